@@ -5,11 +5,16 @@ import numpy as np
 from dateutil import parser
 import numpy as np
 import yfinance as yf
+from profiler import start_rerun, profile_stage, mark, render_profiler_panel
+from data_loader import page_sheet
+from ui_kpi import render_quality_summary
+from refresh_worker import shared_worker, get
 
 
 
 # ---- CONFIGURAZIONE ----
 st.set_page_config(page_title="Dashboard Analisi", layout="wide", initial_sidebar_state="expanded")
+start_rerun("dashboard")
 st.title("📈 Dashboard Analisi Small Cap")
 
 ticker_input = st.text_input(
@@ -18,86 +23,38 @@ ticker_input = st.text_input(
 ).upper().strip()
 
 # ---- CARICAMENTO DATI ----
-SHEET_URL = "https://docs.google.com/spreadsheets/d/15ev2l8av7iil_-HsXMZihKxV-B5MgTVO-LnK1y_f2-o/export?format=csv"
-df = pd.read_csv(SHEET_URL)
+# snapshot pulito dal refresh worker (download e pulizia in background)
 
 # region ---- PULIZIA DATI ----
-# Rimuovo eventuali spazi nei nomi colonne
-df.columns = df.columns.str.strip()
+with profile_stage("caricamento foglio") as stage:
+    df = page_sheet("dashboard")
+    stage.rows_out = len(df)
 
-# Funzione robusta per parse date con dayfirst
-def parse_date(x):
-    try:
-        return parser.parse(str(x).strip(), dayfirst=True)
-    except:
-        return pd.NaT
-
-df["Date"] = df["Date"].apply(parse_date)
-df["Date"] = df["Date"].apply(lambda x: x.date() if pd.notna(x) else pd.NaT)
-
-df["Chiusura"] = df["Chiusura"].str.upper().str.strip()
-
-# Funzione per convertire percentuali da stringhe con virgola e %
-def parse_percent(x):
-    try:
-        if pd.isna(x):
-            return np.nan
-        x = str(x).replace('%', '').replace(',', '.')
-        return float(x)
-    except:
-        return np.nan
-
-# Pulizia colonne percentuali
-percent_cols = ["GAP", "%Open_PMH", "%OH", "%OL"]
-for col in percent_cols:
-    if col in df.columns:
-        df[col] = df[col].apply(parse_percent)
-
-# Pulizia colonne numeriche con virgola e separatore migliaia
-num_cols = ["OPEN", "Float", "break"]
-for col in num_cols:
-    if col in df.columns:
-        df[col] = pd.to_numeric(
-            df[col].astype(str)
-            .str.replace('.', '', regex=False)   # rimuove punti migliaia
-            .str.replace(',', '.', regex=False), # converte virgole decimali
-            errors="coerce"
-        )
-
-# Sostituisco NaN con valori neutri per non perdere righe
-for col in ["GAP", "Float", "%Open_PMH", "OPEN", "%OH", "%OL", "break"]:
-    if col in df.columns:
-        df[col] = df[col].fillna(0)
- 
 # endregion
 
 # region ---- CONTROLLO DATI ----
 
-problemi_dati = False  # flag per sapere se ci sono problemi
+# report calcolato una volta all'ingest (valori grezzi, prima di NaN -> 0): solo conteggi
+render_quality_summary(df)
 
-# Mostra il titolo solo se ci sono problemi
-if problemi_dati:
-    st.markdown('<h3 style="font-size:16px; color:#FFFFFF;">🛠️ Controllo dati</h3>', unsafe_allow_html=True)
+# endregion
+mark("controllo dati")
 
-# Date non valide
-invalid_dates = df[df["Date"].isna()]
-if not invalid_dates.empty:
-    st.warning(f"⚠️ Attenzione: {len(invalid_dates)} righe con date non valide")
-    st.dataframe(invalid_dates[["Ticker", "Date"]])
 
-# Numeri non validi nelle colonne numeriche principali
-for col in ["GAP", "Float", "%Open_PMH", "OPEN", "%OH", "%OL", "break"]:
-    if col in df.columns:
-        invalid_nums = df[df[col].isna()]
-        if not invalid_nums.empty:
-            st.warning(f"⚠️ Attenzione: {len(invalid_nums)} righe con valori non numerici in '{col}'")
-            st.dataframe(invalid_nums[["Ticker", col]])
+# ---- SLIDER SEZIONE STORICA (solo se ticker valorizzato) ----
+# fragment: slider e heatmap rieseguono solo questa sezione; lo storico Yahoo dei ticker
+# visti di recente resta nel refresh worker, che lo rinfresca prima della scadenza
+YF_TTL = 3600
 
-# endregion
 
+def fetch_yf_history(ticker):
+    """Storico giornaliero 4 anni e split da Yahoo Finance"""
+    ticker_yf = yf.Ticker(ticker)
+    return ticker_yf.history(period="4y", auto_adjust=False), ticker_yf.splits
 
-# ---- SLIDER SEZIONE STORICA (solo se ticker valorizzato) ----
-if ticker_input:
+
+@st.fragment
+def render_ticker_history(df, ticker_input):
     st.markdown(f"### 📊 Gap giornaliero per - {ticker_input}")
 
     col1, spacer, col2 = st.columns([4, 1, 4])  # proporzioni: slider1=4, spazio=1, slider2=4
@@ -138,13 +95,11 @@ if ticker_input:
     st.write(f"Record filtrati: {len(historical_filtered)}")
 
     try:
-        ticker_yf = yf.Ticker(ticker_input)
-        df_yf = ticker_yf.history(period="4y", auto_adjust=False)
-        df_yf.reset_index(inplace=True)
+        df_yf, splits = get(shared_worker(), ("yf", ticker_input), lambda: fetch_yf_history(ticker_input), ttl=YF_TTL)
+        df_yf = df_yf.reset_index()
         df_yf = df_yf.sort_values("Date").reset_index(drop=True)
 
         # ===== SPLIT =====
-        splits = ticker_yf.splits
         df_yf["factor"] = 1.0
         for date, ratio in splits.items():
             split_date = pd.to_datetime(date)
@@ -310,95 +265,99 @@ if ticker_input:
         st.error(f"Errore nel recupero dati Yahoo Finance: {e}")
 
 
+if ticker_input:
+    render_ticker_history(df, ticker_input)
 
 
-
-
-
+mark("storico yfinance")
 
 # region ---- FILTRI ----
 st.sidebar.header("🔍 Filtri")
 
-date_range = st.sidebar.date_input("Intervallo date", [])
-#tickers = st.sidebar.multiselect("Ticker", sorted(df["Ticker"].dropna().unique()))
-min_gap = st.sidebar.number_input("GAP minimo (%)", 0, 1000, 0)
-
-# ====== MARKET CAP: DUE BOX (IN MILIONI) ======
-# Valori fissi di default in Milioni
-default_mc_min_M = 0
-default_mc_max_M = 2000
-
-col_mc_min, col_mc_max = st.sidebar.columns(2)
-
-marketcap_min_M = col_mc_min.number_input(
-    "MC Min ($M)", 
-    value=default_mc_min_M, 
-    step=10,
-    min_value=0,
-    max_value=2000,
-    help="Valore minimo di Market Cap in Milioni"
-)
-
-marketcap_max_M = col_mc_max.number_input(
-    "MC Max ($M)", 
-    value=default_mc_max_M, 
-    step=10,
-    min_value=0,
-    max_value=2000,
-    help="Valore massimo di Market Cap in Milioni"
-)
-
-# Converti in valori reali per il filtro
-marketcap_min = marketcap_min_M * 1_000_000
-marketcap_max = marketcap_max_M * 1_000_000
-
-# filtro flottante
-col_float_min, col_float_max = st.sidebar.columns(2)
-
-float_min = col_float_min.number_input(
-    "Float MIN", 
-    value=0, 
-    step=100000,
-    min_value=0,
-    max_value=1000000000,
-    help="Valore minimo di Flottante"
-
-)
-
-float_max = col_float_max.number_input(
-    "Float MAX", 
-    value=15000000, 
-    step=100000,
-    min_value=0,
-    max_value=1000000000,
-    help="Valore massimo di Flottante"
-
-)
-
-min_open_pmh = st.sidebar.number_input("%Open_PMH minimo", -100, 100, -100)
-
-# filtro OPEN price
-col_open_min, col_open_max = st.sidebar.columns(2)
-
-open_min = col_open_min.number_input(
-    "Open MIN", 
-    value=1.0, 
-    step=0.1,
-    min_value=0.0,
-    max_value=100.0,
-    help="Valore minimo di Open rispetto a PMH in %"
-
-)
-
-open_max = col_open_max.number_input(
-    "Open MAX", 
-    value=100.0, 
-    step=0.1,
-    min_value=0.0,
-    max_value=100.0,
-    help="Valore massimo di Open rispetto a PMH in %"
-
-)
+# form: i valori si applicano tutti insieme con un solo rerun
+with st.sidebar.form("filtri"):
+    date_range = st.date_input("Intervallo date", [])
+    #tickers = st.multiselect("Ticker", sorted(df["Ticker"].dropna().unique()))
+    min_gap = st.number_input("GAP minimo (%)", 0, 1000, 0)
+
+    # ====== MARKET CAP: DUE BOX (IN MILIONI) ======
+    # Valori fissi di default in Milioni
+    default_mc_min_M = 0
+    default_mc_max_M = 2000
+
+    col_mc_min, col_mc_max = st.columns(2)
+
+    marketcap_min_M = col_mc_min.number_input(
+        "MC Min ($M)", 
+        value=default_mc_min_M, 
+        step=10,
+        min_value=0,
+        max_value=2000,
+        help="Valore minimo di Market Cap in Milioni"
+    )
+
+    marketcap_max_M = col_mc_max.number_input(
+        "MC Max ($M)", 
+        value=default_mc_max_M, 
+        step=10,
+        min_value=0,
+        max_value=2000,
+        help="Valore massimo di Market Cap in Milioni"
+    )
+
+    # Converti in valori reali per il filtro
+    marketcap_min = marketcap_min_M * 1_000_000
+    marketcap_max = marketcap_max_M * 1_000_000
+
+    # filtro flottante
+    col_float_min, col_float_max = st.columns(2)
+
+    float_min = col_float_min.number_input(
+        "Float MIN", 
+        value=0, 
+        step=100000,
+        min_value=0,
+        max_value=1000000000,
+        help="Valore minimo di Flottante"
+
+    )
+
+    float_max = col_float_max.number_input(
+        "Float MAX", 
+        value=15000000, 
+        step=100000,
+        min_value=0,
+        max_value=1000000000,
+        help="Valore massimo di Flottante"
+
+    )
+
+    min_open_pmh = st.number_input("%Open_PMH minimo", -100, 100, -100)
+
+    # filtro OPEN price
+    col_open_min, col_open_max = st.columns(2)
+
+    open_min = col_open_min.number_input(
+        "Open MIN", 
+        value=1.0, 
+        step=0.1,
+        min_value=0.0,
+        max_value=100.0,
+        help="Valore minimo di Open rispetto a PMH in %"
+
+    )
+
+    open_max = col_open_max.number_input(
+        "Open MAX", 
+        value=100.0, 
+        step=0.1,
+        min_value=0.0,
+        max_value=100.0,
+        help="Valore massimo di Open rispetto a PMH in %"
+
+    )
+
+    st.form_submit_button("Applica filtri", use_container_width=True)
 
 filtered = df.copy()
 if ticker_input:
@@ -448,6 +407,7 @@ else:
     st.info("⚠️ Nessun dato disponibile dopo i filtri.")
 
 # endregion
+mark("filtri", rows_out=len(filtered))
 
 # region ---- KPI BOX ----
 total = len(filtered)
@@ -555,6 +515,7 @@ mediaorario_red = minuti_to_orario(red.mean()) if not red.empty else "-"
 mediaorario_green = minuti_to_orario(green.mean()) if not green.empty else "-"
 
 # endregion
+mark("kpi box")
 
 # region ---- STILE GLOBALE ----
 st.markdown(
@@ -642,6 +603,7 @@ st.markdown(
 )
 
 # endregion
+mark("stile")
 
 # region ---- KPI BOX SCROLLABILI ----
 html_kpis = f"""
@@ -783,6 +745,7 @@ html_kpis = f"""
 st.markdown(html_kpis, unsafe_allow_html=True)
 
 # endregion
+mark("kpi scrollabili")
 
 
 # ---- TAB E TABELLA ----
@@ -842,3 +805,6 @@ for col in percent_cols_display:
 
 st.dataframe(filtered_sorted, use_container_width=True)
 st.caption(f"Sto mostrando {len(filtered_sorted)} record filtrati su {len(df)} totali.")
+
+mark("fine pagina")
+render_profiler_panel()
@@ -0,0 +1,338 @@
+"""
+Backtest della strategia intraday senza interfaccia.
+
+Uso da riga di comando:
+    python backtest.py --config runs.json --data scarico_intraday.xlsx --out risultati/ --workers 4
+
+runs.json: {"defaults": {...}, "runs": [{...}, ...]}; ogni run sovrascrive i
+default (stesse chiavi di DEFAULT_CONFIG, "filters" unito chiave per chiave).
+"""
+import os
+import json
+import copy
+import argparse
+from concurrent.futures import ProcessPoolExecutor
+
+import pandas as pd
+import numpy as np
+
+from strategy_engine import (
+    add_pretrade_features, build_prices, repair_envelope, simulate_single, simulate_scale_in,
+    apply_simulation, calculate_trade_pnl, MODE_90M, SHORT, LONG, ENTRY_TFS,
+)
+from strategy_rules import rule_masks
+from cost_model import apply_costs
+from minute_bars import (
+    load_store, attach_bars, build_minute_prices, MINUTE_BARS_DIR, RESOLUTION_BUCKET, RESOLUTION_MINUTE,
+)
+
+
+DEFAULT_CONFIG = {
+    "mode": MODE_90M,
+    "entry_tf": 60,
+    "direction": SHORT,
+    # (entry%, SL%, TP%) dall'open per ciascun lato
+    "short": [15.0, 30.0, -15.0],
+    "long": [10.0, -5.0, 25.0],
+    "scale_in": [],
+    "exit_model": {},
+    "rules": [],
+    "costs": None,
+    "initial_capital": 3000.0,
+    "risk_pct": 2.0,
+    # "bucket": timeframe del foglio; "minute": barre a 1 minuto dallo store in "bars"
+    "resolution": RESOLUTION_BUCKET,
+    "bars": MINUTE_BARS_DIR,
+    "filters": {
+        "date_range": [],
+        "tickers": [],
+        "market_cap": [0, 2000],   # $M
+        "open": [2.0, 500.0],
+        "min_gap": 50.0,
+        "float": [0, 200],         # M azioni
+    },
+}
+
+
+# ========================================
+# region DATI
+# ========================================
+
+def _intraday_dtypes():
+    cols = ["Gap%", "Open", "High", "Low", "Close", "Market Cap", "Shs Float", "Shares Outstanding",
+            "HighPM", "VolumePM", "Volume", "Volume_5m", "Volume_30m", "Volume_60m"]
+    cols += [f"{p}_{tf}m" for p in ("High", "Low", "Close") for tf in ENTRY_TFS]
+    return {"Ticker": str, "TimeHigh": str, **{c: "float64" for c in cols}}
+
+
+# tipi del foglio scarico_intraday (colonne assenti ignorate); Date a parte (datetime64)
+INTRADAY_DTYPES = _intraday_dtypes()
+
+
+def clean_intraday(df, dayfirst=False):
+    """Tipi del foglio scarico_intraday: Date datetime64 a giornata, numeri float"""
+    df = df.copy()
+    if not pd.api.types.is_datetime64_any_dtype(df["Date"]):
+        df["Date"] = pd.to_datetime(df["Date"], dayfirst=dayfirst, errors="coerce")
+    df["Date"] = df["Date"].dt.normalize()
+
+    # celle testuali dell'xlsx (es. "-") -> NaN; no-op sulle colonne già numeriche
+    for col, dtype in INTRADAY_DTYPES.items():
+        if col in df.columns and dtype == "float64" and df[col].dtype != "float64":
+            df[col] = pd.to_numeric(df[col], errors="coerce").astype("float64")
+    return df
+
+
+def read_intraday_csv(source, it_format=False):
+    """
+    Csv del foglio (export per gid o snapshot) letto già tipizzato con
+    INTRADAY_DTYPES. it_format: export di Google Sheets in formato italiano
+    (virgola decimale, punto migliaia, date dd/mm/yyyy).
+    """
+    df = pd.read_csv(
+        source,
+        dtype=INTRADAY_DTYPES,
+        decimal="," if it_format else ".",
+        thousands="." if it_format else None,
+    )
+    return clean_intraday(df, dayfirst=it_format)
+
+
+def load_snapshot(path, sheet_name="scarico_intraday"):
+    """Snapshot locale del foglio: .parquet (consigliato), .csv o .xlsx"""
+    ext = os.path.splitext(path)[1].lower()
+    if ext == ".csv":
+        df = read_intraday_csv(path)
+    elif ext == ".parquet":
+        df = clean_intraday(pd.read_parquet(path))
+    else:
+        df = clean_intraday(pd.read_excel(path, sheet_name=sheet_name))
+    # come la pagina: estremi cumulati riparati una volta al caricamento
+    return repair_envelope(df)
+
+
+def filter_universe(df, filters):
+    """Filtri della sidebar (date, open, gap, float, market cap, ticker)"""
+    filtered = df.copy()
+
+    # Date è già datetime64 (clean_intraday): Date_dt resta come alias per le pagine
+    filtered["Date_dt"] = filtered["Date"]
+
+    date_range = filters.get("date_range") or []
+    if len(date_range) == 2:
+        start, end = date_range
+        filtered = filtered[(filtered["Date_dt"] >= pd.to_datetime(start)) &
+                            (filtered["Date_dt"] <= pd.to_datetime(end))]
+
+    open_min, open_max = filters["open"]
+    filtered = filtered[
+        (filtered["Open"] >= open_min) &
+        (filtered["Open"] <= open_max) &
+        (filtered["Gap%"] >= filters["min_gap"])
+    ].copy()
+
+    # Shs Float mancante -> Shares Outstanding
+    filtered["Shs Float"] = filtered["Shs Float"].fillna(filtered["Shares Outstanding"])
+
+    float_min, float_max = filters["float"]
+    mc_min, mc_max = filters["market_cap"]
+    filtered = filtered[
+        (filtered["Shs Float"] >= float_min * 1_000_000) &
+        (filtered["Shs Float"] <= float_max * 1_000_000) &
+        (filtered["Market Cap"] >= mc_min * 1_000_000) &
+        (filtered["Market Cap"] <= mc_max * 1_000_000)
+    ]
+
+    tickers = filters.get("tickers") or []
+    if tickers:
+        filtered = filtered[filtered["Ticker"].isin(tickers)]
+
+    return filtered
+
+# endregion
+
+
+# ========================================
+# region PIPELINE
+# ========================================
+
+def merge_config(base, override):
+    """Config completa: override sopra base, 'filters' unito chiave per chiave"""
+    config = copy.deepcopy(base)
+    for key, value in (override or {}).items():
+        if key == "filters":
+            config["filters"].update(value)
+        else:
+            config[key] = value
+    return config
+
+
+def simulate_config(prices, config, direction=None, exit_model=None):
+    """Simulazione della config (scale-in se più livelli) sulle matrici prezzi"""
+    direction = direction or config["direction"]
+    if exit_model is None:
+        exit_model = config["exit_model"]
+    entry_pct, sl_pct, tp_pct = config[LONG if direction == LONG else SHORT]
+
+    legs = config["scale_in"]
+    if len(legs) > 1 and sum(size for _, size in legs) > 0:
+        return simulate_scale_in(prices, legs, sl_pct, tp_pct, config["entry_tf"], exit_model, direction)
+    return simulate_single(prices, entry_pct, sl_pct, tp_pct, config["entry_tf"], exit_model, direction)
+
+
+def minute_resolution(config):
+    return config.get("resolution") == RESOLUTION_MINUTE
+
+
+def config_prices(filtered, config, store=None):
+    """Matrici prezzi della config: bucket del foglio o un bucket per minuto dalle barre"""
+    if minute_resolution(config):
+        return build_minute_prices(filtered, store or load_store(config["bars"]), config["mode"])
+    return build_prices(filtered, config["mode"])
+
+
+def trade_pnl(filtered, config, prices=None):
+    """Simulazione + PnL (+ costi) sulle righe già filtrate"""
+    if prices is None:
+        prices = config_prices(filtered, config)
+
+    filtered = apply_simulation(filtered, simulate_config(prices, config))
+    filtered = calculate_trade_pnl(
+        filtered,
+        initial_capital=config["initial_capital"],
+        risk_pct=config["risk_pct"],
+    )
+    if config.get("costs"):
+        filtered = apply_costs(
+            filtered, config["costs"],
+            initial_capital=config["initial_capital"], risk_pct=config["risk_pct"],
+        )
+    return filtered
+
+
+def trade_metrics(trades, initial_capital):
+    """KPI della strategia (stesse formule dei box della pagina) sui trade attivati"""
+    pnl = trades["PnL_$"].to_numpy(dtype=float)
+    n = len(pnl)
+    wins, losses = pnl[pnl > 0], pnl[pnl < 0]
+
+    winrate = len(wins) / n if n else 0
+    avg_win = wins.mean() if len(wins) else 0
+    avg_loss = -losses.mean() if len(losses) else 0
+
+    equity = np.cumsum(pnl)
+    drawdown = equity - np.maximum.accumulate(equity) if n else np.zeros(1)
+
+    return {
+        "n_trades": n,
+        "winrate": winrate * 100,
+        "expectancy": winrate * avg_win - (1 - winrate) * avg_loss,
+        "profit": pnl.sum(),
+        "max_drawdown": drawdown.min(),
+        "total_r": trades["R_multiple"].sum(),
+        "final_equity": initial_capital + pnl.sum(),
+    }
+
+
+def run_backtest(df, config):
+    """
+    Pipeline completa su un dataset già pulito: filtri, feature pre-trade,
+    regole di ingresso, simulazione, PnL e costi.
+    Al minuto restano solo le giornate con barre, con i timeframe ricalcolati dalle barre.
+    Restituisce (righe filtrate con i risultati, metriche).
+    """
+    filtered = add_pretrade_features(filter_universe(df, config["filters"]))
+    store = None
+    if minute_resolution(config):
+        store = load_store(config["bars"])
+        filtered = attach_bars(store, filtered)
+    if config["rules"] and len(filtered):
+        filtered = filtered[rule_masks(filtered, config["rules"]).all(axis=0)]
+
+    filtered = trade_pnl(filtered, config, config_prices(filtered, config, store))
+    trades = filtered[filtered["attivazione"] == 1]
+    return filtered, trade_metrics(trades, config["initial_capital"])
+
+# endregion
+
+
+# ========================================
+# region CLI
+# ========================================
+
+_DATA = None
+
+
+def _init_worker(df):
+    # il dataset arriva una sola volta per processo
+    global _DATA
+    _DATA = df
+
+
+def _run_one(config):
+    return run_backtest(_DATA, config)
+
+
+def run_batch(df, configs, workers=1):
+    """run_backtest per ogni config, su un pool di processi se workers > 1"""
+    if workers <= 1 or len(configs) < 2:
+        return [run_backtest(df, c) for c in configs]
+    with ProcessPoolExecutor(max_workers=workers, initializer=_init_worker, initargs=(df,)) as pool:
+        return list(pool.map(_run_one, configs))
+
+
+def read_config_file(path):
+    """Elenco delle config complete (default del modulo + defaults del file + run)"""
+    with open(path) as f:
+        spec = json.load(f)
+    base = merge_config(DEFAULT_CONFIG, spec.get("defaults"))
+    runs = spec.get("runs") or [{}]
+    return [merge_config(base, run) for run in runs]
+
+
+def main(argv=None):
+    from result_store import dataset_version, run_hash, save_run
+
+    parser = argparse.ArgumentParser(description="Backtest batch della strategia intraday")
+    parser.add_argument("--config", required=True, help="file JSON con defaults e runs")
+    parser.add_argument("--data", required=True, help="snapshot del foglio (.xlsx, .csv, .parquet)")
+    parser.add_argument("--out", default="risultati_backtest", help="cartella di output")
+    parser.add_argument("--workers", type=int, default=os.cpu_count() or 1)
+    parser.add_argument("--store", action="store_true", help="salva le run anche nello storico SQLite")
+    args = parser.parse_args(argv)
+
+    df = load_snapshot(args.data)
+    # una volta per dataset / store, non per config
+    version = dataset_version(df)
+    store_versions = {}
+    configs = read_config_file(args.config)
+    results = run_batch(df, configs, args.workers)
+
+    os.makedirs(args.out, exist_ok=True)
+    summary = []
+    for config, (filtered, metrics) in zip(configs, results):
+        label = config.get("label", "")
+        run_version = version
+        if minute_resolution(config):
+            if config["bars"] not in store_versions:
+                store_versions[config["bars"]] = load_store(config["bars"])["version"]
+            run_version = f"{version}/{store_versions[config['bars']]}"
+        run_id = run_hash({k: v for k, v in config.items() if k != "label"}, run_version)
+
+        filtered.to_csv(os.path.join(args.out, f"{run_id}_trades.csv"), index=False)
+        with open(os.path.join(args.out, f"{run_id}.json"), "w") as f:
+            json.dump({"config": config, "metrics": metrics, "dataset_version": run_version},
+                      f, indent=2, default=str)
+        if args.store:
+            save_run(run_id, config, run_version, filtered, metrics, label=label)
+
+        summary.append({"run_hash": run_id, "label": label, **metrics})
+        print(f"{run_id} {label} trade={metrics['n_trades']} profit={metrics['profit']:.2f}")
+
+    pd.DataFrame(summary).to_csv(os.path.join(args.out, "summary.csv"), index=False)
+
+
+if __name__ == "__main__":
+    main()
+
+# endregion
@@ -0,0 +1,229 @@
+"""
+Tempi per stage delle pagine su dati sintetici.
+
+    python -m benchmarks.run_benchmarks --sizes 1000 10000 100000
+    python -m benchmarks.run_benchmarks --sizes 1000000 --repeat 1
+    python -m benchmarks.run_benchmarks --compare prima.json dopo.json
+
+Ogni run scrive un JSON in benchmarks/results/ (stage -> secondi, righe in/out).
+"""
+import os
+import sys
+import json
+import time
+import platform
+import argparse
+import subprocess
+from io import StringIO
+from datetime import datetime
+
+import pandas as pd
+import numpy as np
+
+from benchmarks.synthetic_data import gapper_sheet, intraday_sheet
+from data_loader import clean_gapper_sheet
+from timeframe_metrics import INTRADAY_TFS, add_tf_metrics, grouped_means, tf_columns
+from multigapper_engine import apply_filters, aggregate_days, regime_features, mark_hot_regime
+from strategy_engine import (
+    add_pretrade_features, build_prices, repair_envelope, simulate_single, apply_simulation, calculate_trade_pnl,
+    MODE_90M,
+)
+from backtest import clean_intraday, filter_universe, trade_metrics, DEFAULT_CONFIG, INTRADAY_DTYPES
+from portfolio import simulate_portfolio, trade_exposure_pct
+
+
+DEFAULT_SIZES = [1_000, 10_000, 100_000]
+RESULTS_DIR = os.path.join(os.path.dirname(__file__), "results")
+
+# filtri larghi: misurano il costo del filtro, non lo svuotano
+MULTIGAPPER_SPEC = {
+    "min_gap": 0, "min_open_pmh": -1000, "open_min": 0, "open_max": 1e6,
+    "date_range": (), "mc_min": 0, "mc_max": 1e6, "float_min": 0, "float_max": 1e6,
+    "min_gapper_day": 1, "max_gapper_day": 1000,
+}
+STRATEGY_FILTERS = {
+    **DEFAULT_CONFIG["filters"],
+    "open": [0, 1e6], "min_gap": 0, "market_cap": [0, 1e6], "float": [0, 1e6],
+}
+
+
+# -------------------------------------------------
+# region MISURA
+# -------------------------------------------------
+
+def _timed(fn, repeat):
+    """Esegue fn repeat volte: (risultato dell'ultima, tempi in secondi)"""
+    times = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        out = fn()
+        times.append(time.perf_counter() - start)
+    return out, times
+
+
+def _rows(obj):
+    if isinstance(obj, tuple):
+        obj = obj[0]
+    return len(obj) if hasattr(obj, "__len__") else None
+
+
+def run_stages(stages, repeat):
+    """
+    stages: lista di (nome, funzione(input) -> output); l'output di uno stage
+    è l'input del successivo. Restituisce {stage: statistiche}.
+    """
+    results = {}
+    data = None
+    for name, fn in stages:
+        rows_in = _rows(data) if data is not None else None
+        data, times = _timed(lambda: fn(data), repeat)
+        results[name] = {
+            "median_s": float(np.median(times)),
+            "min_s": float(np.min(times)),
+            "rows_in": rows_in,
+            "rows_out": _rows(data),
+        }
+    return results
+
+# endregion
+
+
+# -------------------------------------------------
+# region PIPELINE DELLE PAGINE
+# -------------------------------------------------
+
+def multigapper_stages(csv_text):
+    """Dashboard / multi gapper: csv -> pulizia -> filtri -> KPI e regime"""
+
+    def clean(raw):
+        df = clean_gapper_sheet(raw, num_cols=["OPEN", "Float", "break", "Close"], tf_cols=True)
+        df["day_close_pct"] = (df["Close"] - df["OPEN"]) / df["OPEN"] * 100
+        return add_tf_metrics(df, INTRADAY_TFS)
+
+    def kpi(filtered):
+        filtered, daily = aggregate_days(filtered)
+        regime = mark_hot_regime(regime_features(daily))
+        cols = ["GAP", "%OH", "%OL", "day_close_pct"] + tf_columns("oh", INTRADAY_TFS) + tf_columns("ol", INTRADAY_TFS)
+        return grouped_means(filtered, cols), daily, regime
+
+    return [
+        ("parse", lambda _: pd.read_csv(StringIO(csv_text))),
+        ("clean", clean),
+        ("filter", lambda df: apply_filters(df, MULTIGAPPER_SPEC)),
+        ("kpi_aggregate", kpi),
+    ]
+
+
+def strategy_stages(csv_text):
+    """Strategia: csv -> pulizia -> filtri -> matrici prezzi -> SL/TP -> PnL -> equity"""
+    config = {**DEFAULT_CONFIG, "filters": STRATEGY_FILTERS}
+    entry_pct, sl_pct, tp_pct = config["short"]
+
+    def simulate(state):
+        filtered, prices = state
+        return apply_simulation(filtered, simulate_single(prices, entry_pct, sl_pct, tp_pct, config["entry_tf"]))
+
+    def equity(filtered):
+        trades = filtered[filtered["attivazione"] == 1]
+        metrics = trade_metrics(trades, config["initial_capital"])
+        daily = simulate_portfolio(
+            trades["Date_dt"].to_numpy(),
+            trades["R_multiple"].to_numpy(),
+            trade_exposure_pct(trades["Entry_price"], trades["SL_price"], config["risk_pct"]),
+            priority=trades["entry_bucket"].to_numpy(dtype=float),
+        )[1]
+        return daily, metrics
+
+    return [
+        ("parse", lambda _: pd.read_csv(StringIO(csv_text), dtype=INTRADAY_DTYPES)),
+        ("clean", lambda df: repair_envelope(clean_intraday(df))),
+        ("filter", lambda df: add_pretrade_features(filter_universe(df, STRATEGY_FILTERS))),
+        ("entry_bucket_prices", lambda df: (df, build_prices(df, MODE_90M))),
+        ("simulate_sl_tp", simulate),
+        ("pnl", lambda df: calculate_trade_pnl(df, config["initial_capital"], config["risk_pct"])),
+        ("equity", equity),
+    ]
+
+# endregion
+
+
+# -------------------------------------------------
+# region CLI
+# -------------------------------------------------
+
+def _git_rev():
+    try:
+        return subprocess.check_output(["git", "rev-parse", "--short", "HEAD"], text=True).strip()
+    except Exception:
+        return None
+
+
+def run(sizes, repeat, seed=0):
+    report = {
+        "timestamp": datetime.now().isoformat(timespec="seconds"),
+        "git_rev": _git_rev(),
+        "python": platform.python_version(),
+        "pandas": pd.__version__,
+        "numpy": np.__version__,
+        "repeat": repeat,
+        "results": {},
+    }
+
+    for n in sizes:
+        gapper_csv = gapper_sheet(n, seed).to_csv(index=False)
+        intraday_csv = intraday_sheet(n, seed).to_csv(index=False)
+
+        report["results"][str(n)] = {
+            "multigapper": run_stages(multigapper_stages(gapper_csv), repeat),
+            "strategia": run_stages(strategy_stages(intraday_csv), repeat),
+        }
+        for page, stages in report["results"][str(n)].items():
+            for stage, stats in stages.items():
+                print(f"{n:>9} {page:<12} {stage:<20} {stats['median_s'] * 1000:10.1f} ms")
+
+    return report
+
+
+def compare(old_path, new_path):
+    """Rapporto dei tempi mediani (nuovo / vecchio) per size, pagina e stage"""
+    with open(old_path) as f:
+        old = json.load(f)["results"]
+    with open(new_path) as f:
+        new = json.load(f)["results"]
+
+    for n in sorted(set(old) & set(new), key=int):
+        for page in new[n]:
+            for stage, stats in new[n][page].items():
+                before = old[n].get(page, {}).get(stage)
+                if before:
+                    ratio = stats["median_s"] / before["median_s"] if before["median_s"] else np.nan
+                    print(f"{n:>9} {page:<12} {stage:<20} {before['median_s'] * 1000:10.1f} -> "
+                          f"{stats['median_s'] * 1000:10.1f} ms  x{ratio:.2f}")
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Benchmark per stage su dati sintetici")
+    parser.add_argument("--sizes", type=int, nargs="+", default=DEFAULT_SIZES)
+    parser.add_argument("--repeat", type=int, default=3)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--out", default=None, help="file JSON (default: benchmarks/results/bench_<data>.json)")
+    parser.add_argument("--compare", nargs=2, metavar=("PRIMA", "DOPO"), help="confronta due JSON")
+    args = parser.parse_args(argv)
+
+    if args.compare:
+        compare(*args.compare)
+        return
+
+    report = run(args.sizes, args.repeat, args.seed)
+
+    out = args.out or os.path.join(RESULTS_DIR, f"bench_{datetime.now():%Y%m%d_%H%M%S}.json")
+    os.makedirs(os.path.dirname(out) or ".", exist_ok=True)
+    with open(out, "w") as f:
+        json.dump(report, f, indent=2)
+    print(f"risultati: {out}", file=sys.stderr)
+
+
+if __name__ == "__main__":
+    main()
+
+# endregion
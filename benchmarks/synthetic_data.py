@@ -0,0 +1,155 @@
+import pandas as pd
+import numpy as np
+
+
+# timeframe presenti nei fogli (High_{tf}m / Low_{tf}m / Close_{tf}m)
+SHEET_TFS = [1, 5, 15, 30, 45, 60, 90, 120, 240]
+N_TICKERS = 2000
+N_DAYS = 1500
+
+
+# -------------------------------------------------
+# region FORMATTAZIONE ITALIANA
+# -------------------------------------------------
+
+def it_decimal(values, decimals=2):
+    """3.45 -> '3,45'"""
+    return pd.Series(np.round(values, decimals)).astype(str).str.replace(".", ",", regex=False)
+
+
+def it_percent(values):
+    """12.3 -> '12,3%'"""
+    return it_decimal(values) + "%"
+
+
+def it_thousands(values):
+    """12345678 -> '12.345.678'"""
+    return pd.Series(values).map("{:,.0f}".format).str.replace(",", ".", regex=False)
+
+# endregion
+
+
+# -------------------------------------------------
+# region PREZZI INTRADAY
+# -------------------------------------------------
+
+def _price_paths(rng, open_, tfs=SHEET_TFS):
+    """
+    High/Low cumulati per timeframe coerenti (High crescente, Low decrescente
+    con il timeframe), Close dentro il range di ogni bucket e di giornata.
+    """
+    n, k = len(open_), len(tfs)
+    up = np.maximum.accumulate(rng.exponential(0.08, (n, k)), axis=1)
+    down = np.maximum.accumulate(rng.exponential(0.06, (n, k)), axis=1).clip(max=0.9)
+
+    highs = open_[:, None] * (1 + up)
+    lows = open_[:, None] * (1 - down)
+    closes = lows + (highs - lows) * rng.random((n, k))
+
+    day_high = highs[:, -1] * (1 + rng.exponential(0.02, n))
+    day_low = lows[:, -1] * (1 - rng.exponential(0.01, n).clip(max=0.05))
+    day_close = day_low + (day_high - day_low) * rng.random(n)
+
+    return highs, lows, closes, day_high, day_low, day_close
+
+
+def _dates(rng, n):
+    start = np.datetime64("2019-01-02")
+    return start + rng.integers(0, N_DAYS, n).astype("timedelta64[D]")
+
+
+def _tickers(rng, n):
+    return np.char.add("T", rng.integers(0, N_TICKERS, n).astype(str))
+
+# endregion
+
+
+# -------------------------------------------------
+# region FOGLI
+# -------------------------------------------------
+
+def gapper_sheet(n, seed=0):
+    """
+    Foglio gapper come l'export csv (dashboard, multi gapper): valori come
+    stringhe in formato italiano, Chiusura con maiuscole/spazi misti,
+    Orario High 'H:MM', colonne timeframe con la virgola.
+    """
+    rng = np.random.default_rng(seed)
+    open_ = rng.lognormal(1.2, 0.8, n).round(2)
+    highs, lows, closes, day_high, day_low, day_close = _price_paths(rng, open_)
+
+    gap = rng.lognormal(4.2, 0.5, n)
+    pm_high = open_ * rng.uniform(0.9, 1.4, n)
+    minutes = 570 + np.minimum(rng.exponential(40, n), 389).astype(int)
+
+    sheet = pd.DataFrame({
+        "Date": pd.to_datetime(_dates(rng, n)).strftime("%d/%m/%Y"),
+        "Ticker": _tickers(rng, n),
+        "GAP": it_percent(gap),
+        "%Open_PMH": it_percent((open_ - pm_high) / pm_high * 100),
+        "%OH": it_percent((day_high - open_) / open_ * 100),
+        "%OL": it_percent((day_low - open_) / open_ * 100),
+        "OPEN": it_decimal(open_),
+        "Close": it_decimal(day_close),
+        "Float": it_thousands(rng.lognormal(16, 1.2, n)),
+        "Market Cap": rng.lognormal(17.5, 1.2, n).round(0),
+        "Shares Outstanding": rng.lognormal(16.5, 1.2, n).round(0),
+        "Volume": rng.lognormal(15, 1.5, n).round(0),
+        "Volume PM": rng.lognormal(13, 1.5, n).round(0),
+        "break": (day_high >= pm_high).astype(int).astype(str),
+        "Chiusura": rng.choice(["RED", "GREEN", " red", "Green "], n, p=[0.55, 0.35, 0.06, 0.04]),
+        "Orario High": [f"{m // 60}:{m % 60:02d}" for m in minutes],
+        "PM_high": it_decimal(pm_high),
+    })
+
+    tf_cols = {}
+    for j, tf in enumerate(SHEET_TFS):
+        tf_cols[f"High_{tf}m"] = it_decimal(highs[:, j])
+        tf_cols[f"Low_{tf}m"] = it_decimal(lows[:, j])
+        tf_cols[f"Close_{tf}m"] = it_decimal(closes[:, j])
+
+    return pd.concat([sheet, pd.DataFrame(tf_cols)], axis=1)
+
+
+def intraday_sheet(n, seed=0):
+    """
+    Foglio scarico_intraday (pagina strategia): numeri già numerici come dalla
+    lettura xlsx, Date datetime, TimeHigh come orario 'HH:MM:SS'.
+    """
+    rng = np.random.default_rng(seed + 1)
+    open_ = rng.lognormal(1.2, 0.8, n).round(2)
+    highs, lows, closes, day_high, day_low, day_close = _price_paths(rng, open_)
+
+    volume = rng.lognormal(15, 1.5, n).round(0)
+    minutes = 570 + np.minimum(rng.exponential(40, n), 389).astype(int)
+    float_ = rng.lognormal(16, 1.2, n).round(0)
+
+    sheet = pd.DataFrame({
+        "Date": pd.to_datetime(_dates(rng, n)),
+        "Ticker": _tickers(rng, n),
+        "Gap%": rng.lognormal(4.2, 0.5, n).round(2),
+        "Open": open_,
+        "High": day_high.round(4),
+        "Low": day_low.round(4),
+        "Close": day_close.round(4),
+        "Market Cap": rng.lognormal(17.5, 1.2, n).round(0),
+        "Shs Float": np.where(rng.random(n) < 0.1, np.nan, float_),
+        "Shares Outstanding": (float_ * rng.uniform(1, 2, n)).round(0),
+        "HighPM": (open_ * rng.uniform(0.9, 1.4, n)).round(4),
+        "VolumePM": rng.lognormal(13, 1.5, n).round(0),
+        "Volume": volume,
+        "Volume_5m": (volume * rng.uniform(0.05, 0.3, n)).round(0),
+        "Volume_30m": (volume * rng.uniform(0.3, 0.6, n)).round(0),
+        "Volume_60m": (volume * rng.uniform(0.5, 0.8, n)).round(0),
+        "TimeHigh": [f"{m // 60:02d}:{m % 60:02d}:00" for m in minutes],
+    })
+
+    tf_cols = {}
+    for j, tf in enumerate(SHEET_TFS):
+        tf_cols[f"High_{tf}m"] = highs[:, j].round(4)
+        tf_cols[f"Low_{tf}m"] = lows[:, j].round(4)
+        tf_cols[f"Close_{tf}m"] = closes[:, j].round(4)
+
+    return pd.concat([sheet, pd.DataFrame(tf_cols)], axis=1)
+
+# endregion
@@ -0,0 +1,113 @@
+import numpy as np
+
+
+# valori di default della sidebar
+COMMISSION_PER_SHARE = 0.005
+MIN_TICKET = 1.0
+SLIPPAGE_PCT = 0.1
+BORROW_PCT = 0.0
+
+# borrow fee: % fissa per trade o tasso annuo (addebitato per una giornata)
+BORROW_PER_TRADE = "per trade"
+BORROW_ANNUAL = "annuo"
+BORROW_MODES = [BORROW_PER_TRADE, BORROW_ANNUAL]
+DAYS_PER_YEAR = 360
+
+
+# -------------------------------------------------
+# region COSTI PER TRADE
+# -------------------------------------------------
+
+def trade_costs(entry_price, ret_pct, shares, side, costs):
+    """
+    Costi in $ per trade su vettori: commissioni (per azione, con minimo per
+    ticket, ingresso + uscita), slippage % sui due nozionali e borrow fee
+    solo per gli short (Side = +1).
+    costs = {commission_per_share, min_ticket, slippage_pct, borrow_pct, borrow_mode}
+    """
+    exit_price = entry_price * (1 + np.nan_to_num(ret_pct, nan=0.0) / 100)
+    notional_in = shares * entry_price
+    notional_out = shares * exit_price
+
+    commission = np.maximum(shares * costs["commission_per_share"], costs["min_ticket"]) * 2
+    slippage = (notional_in + notional_out) * costs["slippage_pct"] / 100
+
+    borrow_rate = costs["borrow_pct"] / 100
+    if costs.get("borrow_mode") == BORROW_ANNUAL:
+        borrow_rate /= DAYS_PER_YEAR
+    borrow = np.where(side > 0, notional_in * borrow_rate, 0.0)
+
+    return commission, slippage, borrow
+
+
+def trade_shares(entry, sl, fill, risk_amount):
+    """
+    Azioni per trade coerenti con calculate_trade_pnl: rischio / distanza stop
+    dal prezzo medio di ingresso, per la frazione eseguita (scale-in).
+    0 se stop e entry coincidono o mancano.
+    """
+    entry = np.asarray(entry, dtype=float)
+    stop_dist = np.abs(np.asarray(sl, dtype=float) - entry)
+    with np.errstate(divide="ignore", invalid="ignore"):
+        shares = np.where(stop_dist > 0, risk_amount / stop_dist * np.asarray(fill, dtype=float), 0.0)
+    return np.nan_to_num(shares, nan=0.0)
+
+
+def sim_costs(entry, sl, ret_pct, fill, side, active, costs, risk_amount):
+    """Commissioni, slippage e borrow in $ per riga (0 se non attivato), size da trade_shares"""
+    entry = np.asarray(entry, dtype=float)
+    shares = np.where(np.asarray(active, dtype=bool), trade_shares(entry, sl, fill, risk_amount), 0.0)
+    active = shares > 0
+
+    commission, slippage, borrow = trade_costs(entry, np.asarray(ret_pct, dtype=float), shares, side, costs)
+    return (
+        np.where(active, commission, 0.0),
+        np.where(active, slippage, 0.0),
+        np.where(active, borrow, 0.0),
+    )
+
+
+def apply_costs(df, costs, initial_capital=10000, risk_pct=1):
+    """
+    PnL_$ e R_multiple al netto dei costi (solo trade attivati).
+    Aggiunge PnL_lordo_$ e le colonne dei costi.
+    """
+    df = df.copy()
+    risk_amount = initial_capital * (risk_pct / 100)
+
+    fill = df["Fill_frac"].to_numpy(dtype=float) if "Fill_frac" in df.columns else 1.0
+    side = df["Side"].to_numpy(dtype=float) if "Side" in df.columns else np.ones(len(df))
+    commission, slippage, borrow = sim_costs(
+        df["Entry_price"], df["SL_price"], df["TP_90m%"], fill, side,
+        df["attivazione"].to_numpy() == 1, costs, risk_amount,
+    )
+    total = commission + slippage + borrow
+
+    df["PnL_lordo_$"] = df["PnL_$"]
+    df["Commissioni_$"] = commission
+    df["Slippage_$"] = slippage
+    df["Borrow_$"] = borrow
+    df["Costi_$"] = total
+    df["PnL_$"] = df["PnL_$"] - total
+    if risk_amount != 0:
+        df["R_multiple"] = df["R_multiple"] - total / risk_amount
+    return df
+
+
+def cost_r(sim, costs, initial_capital=10000, risk_pct=1):
+    """
+    Costi per trade in R dal dict della simulazione (stesse formule di
+    apply_costs): R netto = r_multiple(sim) - cost_r(...). Zero senza costi.
+    """
+    n = len(sim["attivazione"])
+    risk_amount = initial_capital * (risk_pct / 100)
+    if not costs or risk_amount == 0:
+        return np.zeros(n)
+
+    commission, slippage, borrow = sim_costs(
+        sim["Entry_price"], sim["SL_price"], sim["TP_90m%"], sim.get("Fill_frac", 1.0),
+        sim.get("Side", 1.0), sim["attivazione"] == 1, costs, risk_amount,
+    )
+    return (commission + slippage + borrow) / risk_amount
+
+# endregion
@@ -0,0 +1,271 @@
+import os
+import time
+import logging
+from io import BytesIO
+from urllib.request import urlopen
+
+import pandas as pd
+import numpy as np
+from dateutil import parser
+
+from refresh_worker import shared_worker, get, REFRESH_AHEAD
+from timeframe_metrics import INTRADAY_TFS, add_tf_metrics
+from data_quality import attach_quality, GAPPER_RULES, STORICO_RULES, INTRADAY_RULES
+
+
+# colonne del foglio gapper (export csv)
+PERCENT_COLS = ["GAP", "%Open_PMH", "%OH", "%OL"]
+NUM_COLS = ["OPEN", "Float", "break"]
+# NaN -> 0 per non perdere righe
+FILL_ZERO_COLS = ["GAP", "Float", "%Open_PMH", "OPEN", "%OH", "%OL", "break"]
+TF_PREFIXES = ("%Close_", "Close_", "High_", "Low_")
+# secondi di validità degli snapshot dei fogli scaricati dalle pagine
+SHEET_TTL = 600
+
+SHEET_EXPORT = "https://docs.google.com/spreadsheets/d/15ev2l8av7iil_-HsXMZihKxV-B5MgTVO-LnK1y_f2-o/export"
+GAPPER_CSV_URL = SHEET_EXPORT + "?format=csv"
+STORICO_CSV_URL = SHEET_EXPORT + "?format=csv&gid=137871937"
+INTRADAY_XLSX_URL = SHEET_EXPORT + "?format=xlsx"
+# gid del tab scarico_intraday (variabile d'ambiente INTRADAY_GID): se impostato
+# il tab si scarica come csv tipizzato invece dell'xlsx (openpyxl carica tutta
+# la cartella ed è ~10x più lento)
+INTRADAY_GID = os.environ.get("INTRADAY_GID") or None
+# snapshot colonnare locale del tab (python data_loader.py): se presente la
+# pagina strategia legge questo invece di scaricare e parsare l'xlsx; più
+# vecchio di SHEET_TTL * REFRESH_AHEAD viene riscritto dal foglio
+INTRADAY_SNAPSHOT = "scarico_intraday.parquet"
+PARQUET_MAGIC = b"PAR1"
+
+log = logging.getLogger(__name__)
+
+
+# -------------------------------------------------
+# region PARSING VALORI
+# -------------------------------------------------
+
+# Funzione robusta per parse date con dayfirst
+def parse_date(x):
+    try:
+        return parser.parse(str(x).strip(), dayfirst=True)
+    except:
+        return pd.NaT
+
+
+def parse_dates(s, date_format="%d/%m/%Y"):
+    """
+    Date dayfirst vettoriali: formato fisso del foglio in un colpo solo,
+    parse_date (dateutil) solo sui valori rimasti fuori formato.
+    """
+    dates = pd.to_datetime(s.astype(str).str.strip(), format=date_format, errors="coerce")
+    odd = dates.isna() & s.notna()
+    if odd.any():
+        dates[odd] = pd.to_datetime(s[odd].map(parse_date), errors="coerce")
+    return dates
+
+
+def parse_percents(s):
+    """Percentuali '12,5%' -> 12.5 su tutta la colonna (NaN se non numeriche)"""
+    return pd.to_numeric(
+        s.astype(str).str.replace('%', '', regex=False).str.replace(',', '.', regex=False),
+        errors="coerce"
+    )
+
+
+def parse_it_number(s):
+    """Numeri in formato italiano: punto migliaia, virgola decimale"""
+    return pd.to_numeric(
+        s.astype(str)
+        .str.replace('.', '', regex=False)   # rimuove punti migliaia
+        .str.replace(',', '.', regex=False), # converte virgole decimali
+        errors="coerce"
+    )
+
+# endregion
+
+
+# -------------------------------------------------
+# region PULIZIA FOGLIO GAPPER
+# -------------------------------------------------
+
+def clean_gapper_sheet(df, num_cols=NUM_COLS, fill_zero_cols=FILL_ZERO_COLS, tf_cols=False, rules=None):
+    """
+    Pulizia comune del foglio gapper (dashboard, multi gapper, storico):
+    date dayfirst, Chiusura maiuscola, percentuali e numeri italiani,
+    NaN -> 0 sulle colonne principali; con tf_cols anche Close/High/Low_{tf}m e PM_high.
+    Con rules il controllo qualità gira sui valori parsati prima di NaN -> 0.
+    """
+    df = df.copy()
+
+    # Rimuovo eventuali spazi nei nomi colonne
+    df.columns = df.columns.str.strip()
+
+    df["Date"] = parse_dates(df["Date"]).dt.date
+
+    df["Chiusura"] = df["Chiusura"].str.upper().str.strip()
+
+    # Pulizia colonne percentuali
+    for col in PERCENT_COLS:
+        if col in df.columns:
+            df[col] = parse_percents(df[col])
+
+    # Pulizia colonne numeriche con virgola e separatore migliaia
+    for col in num_cols:
+        if col in df.columns:
+            df[col] = parse_it_number(df[col])
+
+    # --- PULIZIA COLONNE TIMEFRAME (Close / High / Low) ---
+    if tf_cols:
+        cols = [c for c in df.columns if c.startswith(TF_PREFIXES)]
+        for col in cols + ["PM_high"]:
+            if col in df.columns:
+                df[col] = pd.to_numeric(
+                    df[col].astype(str)
+                    .str.replace(",", ".", regex=False).str.strip(),
+                    errors="coerce"
+                )
+
+    if rules is not None:
+        attach_quality(df, rules)
+
+    # Sostituisco NaN con valori neutri per non perdere righe
+    for col in fill_zero_cols:
+        if col in df.columns:
+            df[col] = df[col].fillna(0)
+
+    return df
+
+# endregion
+
+
+# -------------------------------------------------
+# region FOGLI DELLE PAGINE
+# un tab per pagina, scaricato e pulito alla prima visita della pagina
+# -------------------------------------------------
+
+SHEET_TABS = {
+    "gapper": GAPPER_CSV_URL,
+    "storico": STORICO_CSV_URL,
+    "intraday": SHEET_EXPORT + f"?format=csv&gid={INTRADAY_GID}" if INTRADAY_GID else INTRADAY_XLSX_URL,
+}
+
+
+def snapshot_fresh(path, ttl=SHEET_TTL * REFRESH_AHEAD):
+    """True se lo snapshot esiste ed è stato scritto da meno di ttl secondi"""
+    return os.path.isfile(path) and time.time() - os.path.getmtime(path) < ttl
+
+
+def download_tab(tab, timeout=60):
+    """
+    Bytes grezzi dell'export del tab. Intraday: snapshot parquet locale se
+    presente, riscritto dal foglio quando scade come gli altri tab (se il
+    download fallisce resta lo snapshot precedente).
+    """
+    if tab == "intraday" and os.path.isfile(INTRADAY_SNAPSHOT):
+        if not snapshot_fresh(INTRADAY_SNAPSHOT):
+            try:
+                save_intraday_snapshot(INTRADAY_SNAPSHOT, timeout=timeout)
+            except Exception as e:
+                log.warning("refresh snapshot %s fallito, uso quello precedente: %s", INTRADAY_SNAPSHOT, e)
+        with open(INTRADAY_SNAPSHOT, "rb") as f:
+            return f.read()
+    with urlopen(SHEET_TABS[tab], timeout=timeout) as resp:
+        return resp.read()
+
+
+def parse_dashboard_sheet(raw):
+    return clean_gapper_sheet(pd.read_csv(BytesIO(raw)), rules=GAPPER_RULES)
+
+
+def parse_multigapper_sheet(raw):
+    df = clean_gapper_sheet(pd.read_csv(BytesIO(raw)), num_cols=NUM_COLS + ["Close"], tf_cols=True, rules=GAPPER_RULES)
+
+    # colonne calcolate una volta nello snapshot, non a ogni rerun della pagina
+    if "Close" in df.columns and "OPEN" in df.columns:
+        df["day_close_pct"] = (df["Close"] - df["OPEN"]) / df["OPEN"] * 100
+
+    # %H/L rispetto all'open e break PMH per i timeframe intraday (matrici righe x timeframe)
+    return add_tf_metrics(df, INTRADAY_TFS)
+
+
+def parse_storico_sheet(raw):
+    df = pd.read_csv(BytesIO(raw))
+
+    # Rimuovi tutte le colonne senza nome
+    df = df.loc[:, ~df.columns.str.contains("^Unnamed")]
+
+    return clean_gapper_sheet(
+        df,
+        num_cols=["OPEN", "Shared Outstanding", "break"],
+        fill_zero_cols=["GAP", "Shared Outstanding", "%Open_PMH", "OPEN", "%OH", "%OL", "break"],
+        rules=STORICO_RULES,
+    )
+
+
+def read_intraday_tab(raw):
+    """scarico_intraday tipizzato dai bytes: snapshot parquet, csv per gid o xlsx"""
+    from backtest import clean_intraday, read_intraday_csv
+
+    if raw[:4] == PARQUET_MAGIC:
+        # snapshot già tipizzato: niente openpyxl
+        return clean_intraday(pd.read_parquet(BytesIO(raw)))
+    if INTRADAY_GID:
+        return read_intraday_csv(BytesIO(raw), it_format=True)
+    # Carica tutte le colonne automaticamente
+    return clean_intraday(pd.read_excel(BytesIO(raw), sheet_name="scarico_intraday"))
+
+
+def parse_intraday_sheet(raw):
+    from strategy_engine import repair_envelope
+
+    df = read_intraday_tab(raw)
+    # nessuna imputazione in clean_intraday: il controllo gira sul foglio tipizzato,
+    # poi High/Low_{tf}m riportati a estremi cumulati per le ricerche vettoriali
+    return repair_envelope(attach_quality(df, INTRADAY_RULES))
+
+
+# pagina -> (tab, pulizia)
+PAGE_SHEETS = {
+    "dashboard": ("gapper", parse_dashboard_sheet),
+    "multigapper": ("gapper", parse_multigapper_sheet),
+    "storico": ("storico", parse_storico_sheet),
+    "strategia": ("intraday", parse_intraday_sheet),
+}
+
+
+def load_page_sheet(page):
+    tab, parse = PAGE_SHEETS[page]
+    return parse(download_tab(tab))
+
+
+def page_sheet(page):
+    """
+    Foglio pulito della pagina, caricato solo quando la pagina lo chiede: la
+    prima visita scarica e pulisce il suo tab e basta (lo scarico_intraday
+    solo per strategia). Il refresh worker rinfresca lo snapshot in background
+    prima della scadenza. Copia, perché lo snapshot è condiviso tra le sessioni.
+    """
+    worker = shared_worker()
+    return get(worker, ("sheet", page), lambda: load_page_sheet(page), ttl=SHEET_TTL).copy()
+
+
+def save_intraday_snapshot(path=INTRADAY_SNAPSHOT, timeout=120):
+    """
+    Scarica il tab scarico_intraday dal foglio e lo salva in parquet tipizzato
+    (una volta, poi a intervalli: cron o a mano). Colonne numeriche float64,
+    Date datetime64: la pagina e la CLI di backtest lo leggono senza conversioni.
+    """
+    with urlopen(SHEET_TABS["intraday"], timeout=timeout) as resp:
+        df = read_intraday_tab(resp.read())
+
+    # scrittura atomica: il refresh worker può leggere il file in qualsiasi momento
+    tmp = path + ".tmp"
+    df.to_parquet(tmp, index=False)
+    os.replace(tmp, path)
+    return df
+
+
+if __name__ == "__main__":
+    df = save_intraday_snapshot()
+    print(f"{len(df)} righe -> {INTRADAY_SNAPSHOT}")
+
+# endregion
@@ -0,0 +1,127 @@
+import re
+
+import pandas as pd
+import numpy as np
+
+
+# -------------------------------------------------
+# region REGOLE
+# controlli dichiarati per foglio, eseguiti sui valori grezzi prima dell'imputazione (NaN -> 0)
+# -------------------------------------------------
+
+GAPPER_RULES = {
+    "required": ["Date", "Ticker", "GAP", "OPEN", "%OH", "%OL", "Chiusura"],
+    "numeric": ["GAP", "Float", "%Open_PMH", "OPEN", "%OH", "%OL", "break"],
+    # (min, max), None = senza limite
+    "ranges": {
+        "GAP": (0, None),
+        "OPEN": (0, None),
+        "Float": (0, None),
+        "%OH": (0, None),
+        "%OL": (-100, 0),
+        "break": (0, 1),
+    },
+    "unique": ["Date", "Ticker"],
+    "open": "OPEN",
+}
+
+STORICO_RULES = {
+    **GAPPER_RULES,
+    "numeric": ["GAP", "Shared Outstanding", "%Open_PMH", "OPEN", "%OH", "%OL", "break"],
+    "ranges": {**{k: v for k, v in GAPPER_RULES["ranges"].items() if k != "Float"},
+               "Shared Outstanding": (0, None)},
+}
+
+INTRADAY_RULES = {
+    "required": ["Date", "Ticker", "Open", "High", "Low", "Gap%"],
+    "numeric": ["Open", "High", "Low", "Gap%", "Market Cap"],
+    "ranges": {
+        "Open": (0, None),
+        "Low": (0, None),
+        "Gap%": (0, None),
+        "Market Cap": (0, None),
+    },
+    "unique": ["Date", "Ticker"],
+    "open": "Open",
+}
+
+QUALITY_KEY = "quality"
+
+# endregion
+
+
+# -------------------------------------------------
+# region VALIDAZIONE
+# -------------------------------------------------
+
+def _tf_matrix(df, prefix):
+    """Colonne {prefix}_{tf}m numeriche, ordinate per timeframe: (tf, matrice righe x tf)"""
+    cols = {}
+    for col in df.columns:
+        m = re.fullmatch(rf"{prefix}_(\d+)m", col)
+        if m and pd.api.types.is_numeric_dtype(df[col]):
+            cols[int(m.group(1))] = col
+    tfs = sorted(cols)
+    return tfs, df[[cols[tf] for tf in tfs]].to_numpy(dtype=float)
+
+
+def validate_sheet(df, rules):
+    """
+    Conteggi delle violazioni per controllo: {controllo: righe}.
+    Solo conteggi, niente righe: il report viaggia con lo snapshot del foglio.
+    """
+    report = {"Righe": len(df)}
+
+    missing = [c for c in rules["required"] if c not in df.columns]
+    report["Colonne obbligatorie mancanti"] = len(missing)
+
+    if "Date" in df.columns:
+        report["Date non valide"] = int(df["Date"].isna().sum())
+
+    for col in rules["numeric"]:
+        if col in df.columns:
+            report[f"{col}: mancante / non numerico"] = int(df[col].isna().sum())
+
+    for col, (lo, hi) in rules["ranges"].items():
+        if col not in df.columns:
+            continue
+        values = df[col].to_numpy(dtype=float)
+        out = np.zeros(len(values), dtype=bool)
+        if lo is not None:
+            out |= values < lo
+        if hi is not None:
+            out |= values > hi
+        report[f"{col}: fuori intervallo"] = int(out.sum())
+
+    keys = [c for c in rules["unique"] if c in df.columns]
+    if len(keys) == len(rules["unique"]):
+        report["Duplicati " + " / ".join(keys)] = int(df.duplicated(keys).sum())
+
+    # timeframe: High cumulato non decrescente, Low non crescente (NaN ignorati)
+    high_tfs, highs = _tf_matrix(df, "High")
+    low_tfs, lows = _tf_matrix(df, "Low")
+    with np.errstate(invalid="ignore"):
+        if len(high_tfs) > 1:
+            report["High_{tf}m non monotoni"] = int((np.diff(highs, axis=1) < 0).any(axis=1).sum())
+        if len(low_tfs) > 1:
+            report["Low_{tf}m non monotoni"] = int((np.diff(lows, axis=1) > 0).any(axis=1).sum())
+
+        open_col = rules["open"]
+        if open_col in df.columns and high_tfs and low_tfs:
+            open_ = df[open_col].to_numpy(dtype=float)[:, None]
+            outside = (lows > open_).any(axis=1) | (highs < open_).any(axis=1)
+            report["Open fuori da Low/High_{tf}m"] = int(outside.sum())
+
+    return report
+
+
+def attach_quality(df, rules):
+    """Valida e allega il report al DataFrame (df.attrs): calcolato una volta per snapshot"""
+    df.attrs[QUALITY_KEY] = validate_sheet(df, rules)
+    return df
+
+
+def quality_report(df):
+    return df.attrs.get(QUALITY_KEY)
+
+# endregion
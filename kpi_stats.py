@@ -0,0 +1,119 @@
+import pandas as pd
+import numpy as np
+
+
+N_BOOT = 1000
+CI_LEVEL = 95
+# limite celle (ricampionamenti x righe) per blocco: tiene la memoria sotto controllo
+MAX_CELLS = 4_000_000
+
+
+# -------------------------------------------------
+# region BOOTSTRAP
+# -------------------------------------------------
+
+def _index_chunks(n, n_boot, rng, chunk_size=None):
+    """Genera matrici di indici (blocco x n) fino a n_boot ricampionamenti totali"""
+    if chunk_size is None:
+        chunk_size = max(1, MAX_CELLS // max(n, 1))
+    for start in range(0, n_boot, chunk_size):
+        m = min(chunk_size, n_boot - start)
+        yield rng.integers(0, n, size=(m, n))
+
+
+def _percentiles(boot, ci):
+    """Estremi dell'intervallo di confidenza (percentile) lungo i ricampionamenti"""
+    alpha = (100 - ci) / 2
+    return np.nanpercentile(boot, [alpha, 100 - alpha], axis=0)
+
+
+def bootstrap_means(values, n_boot=N_BOOT, ci=CI_LEVEL, chunk_size=None, seed=0):
+    """
+    IC bootstrap delle medie di più colonne (values: righe x colonne).
+    Una sola matrice di indici (n_boot x n) per blocco, applicata a tutte
+    le colonne insieme; NaN/inf esclusi. Restituisce (lo, hi) per colonna.
+    """
+    values = np.asarray(values, dtype=float)
+    if values.ndim == 1:
+        values = values[:, None]
+    n, k = values.shape
+    if n == 0:
+        return np.full(k, np.nan), np.full(k, np.nan)
+
+    valid = np.isfinite(values)
+    clean = np.where(valid, values, 0.0)
+    weight = valid.astype(float)
+
+    # il blocco è ricampionamenti x righe x colonne: limite celle su tutte e tre
+    if chunk_size is None:
+        chunk_size = max(1, MAX_CELLS // max(n * k, 1))
+
+    rng = np.random.default_rng(seed)
+    boot = []
+    for idx in _index_chunks(n, n_boot, rng, chunk_size):
+        with np.errstate(divide="ignore", invalid="ignore"):
+            boot.append(clean[idx].sum(axis=1) / weight[idx].sum(axis=1))
+
+    lo, hi = _percentiles(np.vstack(boot), ci)
+    return lo, hi
+
+
+def bootstrap_trade_kpis(pnl, n_boot=N_BOOT, ci=CI_LEVEL, chunk_size=None, seed=0):
+    """
+    IC bootstrap di winrate (%) ed expectancy ($) sui PnL dei trade,
+    con le stesse formule del KPI box della strategia.
+    """
+    pnl = np.asarray(pnl, dtype=float)
+    pnl = pnl[np.isfinite(pnl)]
+    n = len(pnl)
+    if n == 0:
+        return {"winrate": (np.nan, np.nan), "expectancy": (np.nan, np.nan)}
+
+    rng = np.random.default_rng(seed)
+    winrates, expectancies = [], []
+    for idx in _index_chunks(n, n_boot, rng, chunk_size):
+        sample = pnl[idx]
+        win = sample > 0
+        loss = sample < 0
+
+        n_win = win.sum(axis=1)
+        n_loss = loss.sum(axis=1)
+        winrate = n_win / n
+        with np.errstate(divide="ignore", invalid="ignore"):
+            avg_win = np.where(n_win > 0, np.where(win, sample, 0).sum(axis=1) / n_win, 0)
+            avg_loss = np.where(n_loss > 0, -np.where(loss, sample, 0).sum(axis=1) / n_loss, 0)
+
+        winrates.append(winrate * 100)
+        expectancies.append(winrate * avg_win - (1 - winrate) * avg_loss)
+
+    boot = np.column_stack([np.concatenate(winrates), np.concatenate(expectancies)])
+    lo, hi = _percentiles(boot, ci)
+    return {"winrate": (lo[0], hi[0]), "expectancy": (lo[1], hi[1])}
+
+# endregion
+
+
+# -------------------------------------------------
+# region IC PER GRUPPO
+# -------------------------------------------------
+
+def group_bootstrap_ci(df, cols, by="Chiusura", groups=("RED", "GREEN"),
+                       n_boot=N_BOOT, ci=CI_LEVEL, seed=0):
+    """
+    IC bootstrap delle medie per Totale e per gruppo (stessa forma di
+    grouped_means). Restituisce due DataFrame: estremi inferiori e superiori.
+    """
+    values = df[cols].to_numpy(dtype=float)
+    labels = df[by].to_numpy()
+
+    index = ["Totale", *groups]
+    masks = [np.ones(len(df), dtype=bool)] + [labels == g for g in groups]
+
+    lo = pd.DataFrame(np.nan, index=index, columns=cols)
+    hi = pd.DataFrame(np.nan, index=index, columns=cols)
+    for name, mask in zip(index, masks):
+        lo.loc[name], hi.loc[name] = bootstrap_means(values[mask], n_boot, ci, seed=seed)
+
+    return lo, hi
+
+# endregion
@@ -0,0 +1,343 @@
+"""
+Barre a 1 minuto per giornata gapper (Date, Ticker), su disco a colonne.
+
+Layout della cartella (MINUTE_BARS_DIR):
+    days.csv      Date, Ticker, start, end   (indice: barre [start, end) della giornata)
+    minute.npy    int16, minuti dall'open 9:30 (0..389), crescenti dentro la giornata
+    open.npy / high.npy / low.npy / close.npy   float32
+    volume.npy    float64
+    run_high.npy / run_low.npy   float32, massimo / minimo progressivo dall'open
+                  della giornata: indice per le ricerche del primo tocco
+
+Gli array si aprono in memory-map (np.load mmap_mode="r"): solo le giornate
+richieste vengono lette dal disco. Import da dump locali csv/parquet:
+
+    python minute_bars.py dump_2024.parquet dump_2025.csv --out minute_bars
+"""
+import os
+import hashlib
+import argparse
+
+import pandas as pd
+import numpy as np
+
+from strategy_engine import (
+    search_first_at_least, build_touch_index,
+    ENTRY_TFS, MODE_90M, MODE_CLOSE, MARKET_OPEN_SEC, SESSION_MIN, _tf_cols,
+)
+
+
+MINUTE_BARS_DIR = "minute_bars"
+DAYS_FILE = "days.csv"
+BAR_COLS = {
+    "minute": np.int16,
+    "open": np.float32,
+    "high": np.float32,
+    "low": np.float32,
+    "close": np.float32,
+    "volume": np.float64,
+}
+# estremi progressivi per giornata (-inf / +inf prima del primo prezzo)
+RUNNING_COLS = ["run_high", "run_low"]
+# ultimo minuto in cui si cercano SL/TP per modalità (come EXIT_TFS)
+EXIT_MINUTES = {MODE_90M: 90, MODE_CLOSE: SESSION_MIN}
+# risoluzione della simulazione (chiave "resolution" della config)
+RESOLUTION_BUCKET = "bucket"
+RESOLUTION_MINUTE = "minute"
+# colonna flag sulle righe del foglio con le barre
+BARS_FLAG = "Bars"
+BAR_DAY = "bar_day"
+
+
+# ================================================
+# region IMPORT DUMP
+# ================================================
+
+# nomi accettati nei dump (minuscolo) -> colonna standard
+_ALIASES = {
+    "symbol": "ticker",
+    "datetime": "timestamp",
+    "time": "timestamp",
+    "date_time": "timestamp",
+    "o": "open", "h": "high", "l": "low", "c": "close", "v": "volume",
+}
+
+
+def read_bar_dump(path):
+    """
+    Dump di barre a 1 minuto (.csv o .parquet): Ticker, timestamp (o Date +
+    orario), open/high/low/close/volume. Restituisce Date, Ticker, minute e
+    prezzi; solo le barre della sessione regolare (orario di New York).
+    """
+    ext = os.path.splitext(path)[1].lower()
+    raw = pd.read_parquet(path) if ext == ".parquet" else pd.read_csv(path)
+    raw.columns = [_ALIASES.get(c.strip().lower(), c.strip().lower()) for c in raw.columns]
+
+    if "timestamp" in raw.columns and "date" in raw.columns:
+        ts = pd.to_datetime(raw["date"].astype(str) + " " + raw["timestamp"].astype(str), errors="coerce")
+    elif "timestamp" in raw.columns:
+        ts = pd.to_datetime(raw["timestamp"], errors="coerce")
+    else:
+        raise ValueError(f"{path}: serve una colonna timestamp/datetime o Date + Time")
+
+    bars = pd.DataFrame({
+        "Date": ts.dt.normalize(),
+        "Ticker": raw["ticker"].astype(str).str.strip().str.upper(),
+        "minute": (ts.dt.hour * 3600 + ts.dt.minute * 60 - MARKET_OPEN_SEC) // 60,
+    })
+    for col in ["open", "high", "low", "close", "volume"]:
+        bars[col] = pd.to_numeric(raw[col], errors="coerce") if col in raw.columns else np.nan
+
+    in_session = bars["minute"].between(0, SESSION_MIN - 1) & bars["Date"].notna()
+    return bars[in_session]
+
+
+def running_extrema(high, low, starts, ends):
+    """Massimo degli High e minimo dei Low progressivi dentro ogni giornata [start, end)"""
+    day_of_bar = np.repeat(np.arange(len(starts)), ends - starts)
+    high = pd.Series(np.where(np.isnan(high), -np.inf, high))
+    low = pd.Series(np.where(np.isnan(low), np.inf, low))
+    return {
+        "run_high": high.groupby(day_of_bar).cummax().to_numpy(dtype=np.float32),
+        "run_low": low.groupby(day_of_bar).cummin().to_numpy(dtype=np.float32),
+    }
+
+
+def build_store(bars, path=MINUTE_BARS_DIR):
+    """
+    Scrive la cartella del layout: barre ordinate per (Date, Ticker, minute),
+    una sola barra per minuto (l'ultima del dump), indice delle giornate.
+    """
+    bars = (
+        bars.sort_values(["Date", "Ticker", "minute"])
+        .drop_duplicates(["Date", "Ticker", "minute"], keep="last")
+        .reset_index(drop=True)
+    )
+
+    new_day = (bars["Date"].ne(bars["Date"].shift()) | bars["Ticker"].ne(bars["Ticker"].shift())).to_numpy()
+    starts = np.flatnonzero(new_day)
+    ends = np.append(starts[1:], len(bars))
+
+    os.makedirs(path, exist_ok=True)
+    for col, dtype in BAR_COLS.items():
+        np.save(os.path.join(path, f"{col}.npy"), bars[col].to_numpy(dtype=dtype))
+    running = running_extrema(
+        bars["high"].to_numpy(dtype=np.float32), bars["low"].to_numpy(dtype=np.float32), starts, ends
+    )
+    for col in RUNNING_COLS:
+        np.save(os.path.join(path, f"{col}.npy"), running[col])
+
+    days = pd.DataFrame({
+        "Date": bars["Date"].to_numpy()[starts],
+        "Ticker": bars["Ticker"].to_numpy()[starts],
+        "start": starts,
+        "end": ends,
+    })
+    days.to_csv(os.path.join(path, DAYS_FILE), index=False, date_format="%Y-%m-%d")
+    return days
+
+# endregion
+
+
+# ================================================
+# region STORE
+# ================================================
+
+def store_available(path=MINUTE_BARS_DIR):
+    return os.path.isfile(os.path.join(path, DAYS_FILE))
+
+
+def load_store(path=MINUTE_BARS_DIR):
+    """Indice delle giornate in memoria, barre in memory-map (sola lettura)"""
+    days_path = os.path.join(path, DAYS_FILE)
+    days = pd.read_csv(days_path, parse_dates=["Date"], dtype={"Ticker": str})
+    with open(days_path, "rb") as f:
+        version = hashlib.sha1(f.read()).hexdigest()[:12]
+
+    store = {col: np.load(os.path.join(path, f"{col}.npy"), mmap_mode="r") for col in BAR_COLS}
+    store["days"] = days
+    store["start"] = days["start"].to_numpy(dtype=np.int64)
+    store["end"] = days["end"].to_numpy(dtype=np.int64)
+    if all(os.path.isfile(os.path.join(path, f"{col}.npy")) for col in RUNNING_COLS):
+        store.update({col: np.load(os.path.join(path, f"{col}.npy"), mmap_mode="r") for col in RUNNING_COLS})
+    else:
+        # store importato prima dell'indice: estremi calcolati in memoria
+        store.update(running_extrema(np.asarray(store["high"]), np.asarray(store["low"]), store["start"], store["end"]))
+    # entra nell'hash delle run: barre diverse -> risultati diversi
+    store["version"] = version
+    return store
+
+
+def match_days(store, df):
+    """Indice della giornata nello store per ogni riga del foglio (-1 se senza barre)"""
+    days = store["days"]
+    index = pd.MultiIndex.from_arrays([days["Date"], days["Ticker"]])
+    keys = pd.MultiIndex.from_arrays([
+        pd.to_datetime(df["Date"]).dt.normalize(),
+        df["Ticker"].astype(str).str.strip().str.upper(),
+    ])
+    return index.get_indexer(keys)
+
+
+def minute_matrix(store, day_ids, col):
+    """
+    Matrice densa righe x SESSION_MIN della colonna col (NaN nei minuti senza
+    barra e nelle righe con day_id -1). Una sola gather vettoriale sulle barre.
+    """
+    day_ids = np.asarray(day_ids)
+    out = np.full((len(day_ids), SESSION_MIN), np.nan)
+    rows = np.flatnonzero(day_ids >= 0)
+    if not len(rows):
+        return out
+
+    starts = store["start"][day_ids[rows]]
+    lengths = store["end"][day_ids[rows]] - starts
+    # posizione di ogni barra: start della giornata + progressivo dentro la giornata
+    row_of_bar = np.repeat(rows, lengths)
+    offsets = np.arange(lengths.sum()) - np.repeat(np.cumsum(lengths) - lengths, lengths)
+    bar_idx = np.repeat(starts, lengths) + offsets
+
+    out[row_of_bar, store["minute"][bar_idx]] = store[col][bar_idx]
+    return out
+
+
+def ffill_minutes(values):
+    """Ultimo valore noto lungo i minuti (minuti senza scambi -> close precedente)"""
+    idx = np.where(np.isnan(values), 0, np.arange(values.shape[1])[None, :])
+    idx = np.maximum.accumulate(idx, axis=1)
+    return values[np.arange(len(values))[:, None], idx]
+
+# endregion
+
+
+# ================================================
+# region PRIMO TOCCO E TIMEFRAME DALLE BARRE
+# ================================================
+
+def _day_bounds(store, day_ids):
+    day_ids = np.asarray(day_ids)
+    return store["start"][day_ids], store["end"][day_ids]
+
+
+def first_touch(store, day_ids, level, side="high"):
+    """
+    Primo minuto dall'open con High >= level (side "high") o Low <= level
+    ("low") per giornata, -1 se mai: searchsorted sugli estremi progressivi
+    della giornata, O(log n) senza leggere le barre.
+    """
+    starts, ends = _day_bounds(store, day_ids)
+    if side == "high":
+        bar = search_first_at_least(store["run_high"], level, starts, ends)
+    else:
+        bar = search_first_at_least(store["run_low"], level, starts, ends, descending=True)
+    found = (bar < ends) & ~np.isnan(level)
+    return np.where(found, store["minute"][np.where(found, bar, 0)], -1)
+
+
+def tf_snapshots(store, day_ids, tfs=ENTRY_TFS):
+    """
+    High/Low/Close_{tf}m per giornata dagli stessi estremi progressivi:
+    ultima barra con minuto < tf (searchsorted sui minuti della giornata),
+    letti run_high / run_low / close in quella barra. {prefisso: righe x tf}
+    """
+    starts, ends = _day_bounds(store, day_ids)
+    n, k = len(starts), len(tfs)
+    # una query per (riga, tf): prima barra con minuto >= tf, quella prima è l'ultima entro tf
+    bar = search_first_at_least(
+        store["minute"], np.tile(np.asarray(tfs), n), np.repeat(starts, k), np.repeat(ends, k)
+    ) - 1
+    valid = bar >= np.repeat(starts, k)
+    bar = np.where(valid, bar, 0)
+
+    out = {}
+    for prefix, col in (("High", "run_high"), ("Low", "run_low"), ("Close", "close")):
+        values = np.where(valid, store[col][bar].astype(float), np.nan)
+        out[prefix] = np.where(np.isinf(values), np.nan, values).reshape(n, k)
+    return out
+
+
+def attach_bars(store, df, tfs=ENTRY_TFS):
+    """
+    Righe del foglio con barre nello store, con High/Low/Close_{tf}m ricalcolati
+    dalle barre (tf_snapshots): High/Low = estremi cumulati dall'open sui primi
+    tf minuti, Close = close dell'ultima barra entro tf. Le colonne di giornata
+    restano quelle del foglio. bar_day = indice della giornata nello store.
+    """
+    day_ids = match_days(store, df)
+    df = df[day_ids >= 0].copy()
+    day_ids = day_ids[day_ids >= 0]
+    df[BAR_DAY] = day_ids
+    df[BARS_FLAG] = 1
+
+    for prefix, values in tf_snapshots(store, day_ids, tfs).items():
+        df[_tf_cols(prefix, tfs)] = values
+    return df
+
+# endregion
+
+
+# ================================================
+# region MATRICI PREZZI AL MINUTO
+# ================================================
+
+def build_minute_prices(df, store, mode):
+    """
+    Stesso formato di strategy_engine.build_prices con un bucket per minuto:
+    entry_high = massimo progressivo dello store (minuti 1..240, contiene i
+    timeframe di entry), exit_high/exit_low = High/Low della singola barra,
+    così SL/TP sono cercati dal minuto dopo l'entry al primo tocco esatto.
+    touch = tabelle sparse per le ricerche del primo tocco dopo l'entry.
+    Memoria: righe x 390 float per matrice (~3 KB a riga per matrice), più
+    ~25 KB a riga per l'indice del primo tocco.
+    """
+    day_ids = df[BAR_DAY].to_numpy() if BAR_DAY in df.columns else match_days(store, df)
+    n_exit = EXIT_MINUTES[mode]
+    n_entry = max(ENTRY_TFS)
+
+    highs = minute_matrix(store, day_ids, "high")
+    lows = minute_matrix(store, day_ids, "low")
+    closes = ffill_minutes(minute_matrix(store, day_ids, "close"))
+    # minuti senza barra: resta l'estremo del minuto prima; -inf prima del primo prezzo
+    entry_high = ffill_minutes(minute_matrix(store, day_ids, "run_high")[:, :n_entry])
+    entry_high = np.where(np.isnan(entry_high), -np.inf, entry_high)
+
+    times = df.reindex(columns=["TimeHigh_sec", "TimeLow_sec"]).apply(pd.to_numeric, errors="coerce")
+
+    return {
+        "mode": mode,
+        "open": pd.to_numeric(df["Open"], errors="coerce").to_numpy(dtype=float),
+        "entry_tfs": np.arange(1, n_entry + 1, dtype=float),
+        "entry_high": entry_high,
+        "exit_tfs": np.arange(1, n_exit + 1, dtype=float),
+        "exit_high": highs[:, :n_exit],
+        "exit_low": lows[:, :n_exit],
+        "exit_close": closes[:, n_exit - 1],
+        "exit_close_tf": closes[:, :n_exit],
+        "time_high_min": (times["TimeHigh_sec"].to_numpy(dtype=float) - MARKET_OPEN_SEC) / 60,
+        "time_low_min": (times["TimeLow_sec"].to_numpy(dtype=float) - MARKET_OPEN_SEC) / 60,
+        "has_bars": np.asarray(day_ids) >= 0,
+        "touch": build_touch_index(highs[:, :n_exit], lows[:, :n_exit]),
+    }
+
+# endregion
+
+
+# ================================================
+# region CLI
+# ================================================
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Importa dump di barre a 1 minuto nello store")
+    parser.add_argument("dumps", nargs="+", help="file .csv / .parquet")
+    parser.add_argument("--out", default=MINUTE_BARS_DIR, help="cartella dello store")
+    args = parser.parse_args(argv)
+
+    bars = pd.concat([read_bar_dump(p) for p in args.dumps], ignore_index=True)
+    days = build_store(bars, args.out)
+    print(f"{len(days)} giornate, {len(bars)} barre -> {args.out}")
+
+
+if __name__ == "__main__":
+    main()
+
+# endregion
@@ -0,0 +1,95 @@
+import numpy as np
+from concurrent.futures import ProcessPoolExecutor
+
+
+N_SIMS = 10_000
+# limite celle (simulazioni x trade) per blocco: tiene la memoria sotto controllo
+MAX_CELLS = 2_000_000
+PERCENTILES = [5, 25, 50, 75, 95]
+N_SAMPLE_PATHS = 100
+
+
+# -------------------------------------------------
+# region SIMULAZIONE A BLOCCHI
+# -------------------------------------------------
+
+def _simulate_chunk(values, n_sims, method, start, ruin_level, seed, keep_paths=0):
+    """
+    Simula n_sims sequenze di trade come cumsum vettoriale (n_sims x n_trade).
+    method: "shuffle" (rimescola l'ordine) o "bootstrap" (ricampiona con reinserimento).
+    Restituisce solo le statistiche per path, non i path interi.
+    """
+    rng = np.random.default_rng(seed)
+    n = len(values)
+
+    if method == "bootstrap":
+        sample = values[rng.integers(0, n, size=(n_sims, n))]
+    else:
+        sample = rng.permuted(np.tile(values, (n_sims, 1)), axis=1)
+
+    paths = start + np.cumsum(sample, axis=1)
+
+    # il picco parte dal capitale iniziale
+    peaks = np.maximum(np.maximum.accumulate(paths, axis=1), start)
+    drawdown = paths - peaks
+    with np.errstate(divide="ignore", invalid="ignore"):
+        drawdown_pct = np.where(peaks != 0, drawdown / peaks * 100, np.nan)
+
+    return {
+        "final": paths[:, -1],
+        "max_dd": drawdown.min(axis=1),
+        "max_dd_pct": np.nanmin(drawdown_pct, axis=1) if start != 0 else np.full(n_sims, np.nan),
+        "ruined": paths.min(axis=1) <= ruin_level,
+        "paths": paths[:keep_paths],
+    }
+
+
+def simulate_trade_sequences(values, n_sims=N_SIMS, method="shuffle", start=0.0,
+                             ruin_level=-np.inf, chunk_size=None, seed=0, workers=1):
+    """
+    Monte Carlo sulla sequenza dei trade (PnL_$ o R_multiple).
+    I path sono generati a blocchi di chunk_size simulazioni; con workers > 1
+    i blocchi vengono distribuiti su un pool di processi.
+    Restituisce distribuzioni di equity finale e drawdown, probabilità di rovina
+    e percentili dell'equity finale.
+    """
+    values = np.asarray(values, dtype=float)
+    values = values[np.isfinite(values)]
+    if len(values) == 0:
+        return None
+
+    if chunk_size is None:
+        chunk_size = max(1, MAX_CELLS // len(values))
+
+    sizes = [min(chunk_size, n_sims - s) for s in range(0, n_sims, chunk_size)]
+    # un seed indipendente per blocco: risultati riproducibili anche in parallelo
+    seeds = np.random.SeedSequence(seed).spawn(len(sizes))
+    keep = [N_SAMPLE_PATHS if i == 0 else 0 for i in range(len(sizes))]
+
+    args = [
+        (values, m, method, start, ruin_level, ss, k)
+        for m, ss, k in zip(sizes, seeds, keep)
+    ]
+
+    if workers > 1 and len(sizes) > 1:
+        with ProcessPoolExecutor(max_workers=workers) as pool:
+            chunks = list(pool.map(_simulate_chunk, *zip(*args)))
+    else:
+        chunks = [_simulate_chunk(*a) for a in args]
+
+    final = np.concatenate([c["final"] for c in chunks])
+    max_dd = np.concatenate([c["max_dd"] for c in chunks])
+    max_dd_pct = np.concatenate([c["max_dd_pct"] for c in chunks])
+    ruined = np.concatenate([c["ruined"] for c in chunks])
+
+    return {
+        "final": final,
+        "max_dd": max_dd,
+        "max_dd_pct": max_dd_pct,
+        "prob_ruin": ruined.mean() * 100,
+        "final_pct": dict(zip(PERCENTILES, np.percentile(final, PERCENTILES))),
+        "max_dd_pctl": dict(zip(PERCENTILES, np.percentile(max_dd, PERCENTILES))),
+        "sample_paths": chunks[0]["paths"],
+    }
+
+# endregion
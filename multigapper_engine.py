@@ -0,0 +1,143 @@
+import pandas as pd
+import numpy as np
+
+
+# -------------------------------------------------
+# region FILTRI
+# -------------------------------------------------
+
+def apply_filters(df, spec):
+    """Applica i filtri della sidebar (spec = dizionario dei valori scelti)"""
+    filtered = df[
+        (df["GAP"] >= spec["min_gap"]) &
+        (df["%Open_PMH"] >= spec["min_open_pmh"]) &
+        (df["OPEN"] >= spec["open_min"]) &
+        (df["OPEN"] <= spec["open_max"])
+    ].copy()
+
+    date_range = spec.get("date_range") or ()
+    if len(date_range) == 2:
+        start, end = date_range
+        filtered = filtered[(filtered["Date"] >= start) & (filtered["Date"] <= end)]
+
+    filtered["Market Cap"] = pd.to_numeric(filtered["Market Cap"], errors="coerce")
+    filtered = filtered[
+        (filtered["Market Cap"] >= spec["mc_min"] * 1_000_000) &
+        (filtered["Market Cap"] <= spec["mc_max"] * 1_000_000) &
+        (filtered["Float"] >= spec["float_min"] * 1_000_000) &
+        (filtered["Float"] <= spec["float_max"] * 1_000_000)
+    ].copy()
+
+    filtered["is_red"] = filtered["Chiusura"] == "RED"
+    filtered["is_green"] = filtered["Chiusura"] == "GREEN"
+
+    return filtered
+
+# endregion
+
+
+# -------------------------------------------------
+# region AGGREGAZIONE GIORNALIERA
+# -------------------------------------------------
+
+def aggregate_days(filtered):
+    """
+    Un solo groupby per Date: conteggio gapper e tally RED/GREEN per giornata.
+    n_gapper_day viene riportato sulle righe con transform (stesso grouper).
+    """
+    grouped = filtered.groupby("Date")
+
+    daily = grouped.agg(
+        n_gapper_day = ("Ticker", "count"),
+        n_rows       = ("is_red", "size"),
+        num_red      = ("is_red", "sum"),
+        num_green    = ("is_green", "sum"),
+        pct_red      = ("is_red", "mean"),
+        # somme e conteggi per le medie mobili del regime
+        oh_sum       = ("%OH", "sum"),
+        oh_n         = ("%OH", "count"),
+        ol_sum       = ("%OL", "sum"),
+        ol_n         = ("%OL", "count"),
+        close_sum    = ("day_close_pct", "sum"),
+        close_n      = ("day_close_pct", "count"),
+    ).reset_index()
+    daily["pct_red"] *= 100
+
+    filtered = filtered.assign(n_gapper_day=grouped["Ticker"].transform("count"))
+
+    return filtered, daily
+
+
+def multigapper_days(df, spec):
+    """
+    Filtri + aggregazione multi-gapper + regime. Restituisce le righe delle
+    giornate tenute, la tabella giornaliera filtrata e il regime su tutte le giornate.
+    """
+    filtered, daily = aggregate_days(apply_filters(df, spec))
+
+    # Il regime descrive il mercato: si calcola su tutte le giornate,
+    # prima del filtro sul numero di gapper
+    regime = mark_hot_regime(
+        regime_features(daily),
+        factor=spec.get("hot_factor", HOT_FACTOR),
+    )
+
+    # Il filtro tiene o scarta giornate intere: le statistiche per giorno
+    # non cambiano, quindi la tabella giornaliera si filtra senza rigruppare
+    keep_day = (
+        (daily["n_gapper_day"] >= spec["min_gapper_day"]) &
+        (daily["n_gapper_day"] <= spec["max_gapper_day"])
+    )
+    if spec.get("only_hot"):
+        keep_day &= regime["hot"].to_numpy()
+
+    daily_mg = daily[keep_day].reset_index(drop=True)
+    filtered = filtered[filtered["Date"].isin(daily_mg["Date"])].copy()
+
+    return filtered, daily_mg, regime
+
+# endregion
+
+
+# -------------------------------------------------
+# region REGIME DI MERCATO
+# -------------------------------------------------
+
+REGIME_WINDOWS = (5, 20, 60)
+HOT_FACTOR = 1.2
+
+
+def regime_features(daily, windows=REGIME_WINDOWS):
+    """
+    Medie mobili su finestre di giornate (5/20/60) a partire dalla serie
+    giornaliera: rolling sum di somme e conteggi, nessun rigruppo delle righe.
+    Le finestre contano le giornate presenti nel dataset, non il calendario.
+    """
+    daily = daily.sort_values("Date").reset_index(drop=True)
+    sums = daily[[
+        "n_gapper_day", "n_rows", "num_red",
+        "oh_sum", "oh_n", "ol_sum", "ol_n", "close_sum", "close_n",
+    ]].astype(float)
+
+    regime = pd.DataFrame({"Date": daily["Date"]})
+
+    for w in windows:
+        roll = sums.rolling(w, min_periods=1).sum()
+        n_days = sums["n_gapper_day"].rolling(w, min_periods=1).count()
+
+        regime[f"gapper_{w}d"] = roll["n_gapper_day"] / n_days
+        regime[f"pct_red_{w}d"] = roll["num_red"] / roll["n_rows"].replace(0, np.nan) * 100
+        regime[f"oh_{w}d"] = roll["oh_sum"] / roll["oh_n"].replace(0, np.nan)
+        regime[f"ol_{w}d"] = roll["ol_sum"] / roll["ol_n"].replace(0, np.nan)
+        regime[f"close_{w}d"] = roll["close_sum"] / roll["close_n"].replace(0, np.nan)
+
+    return regime
+
+
+def mark_hot_regime(regime, factor=HOT_FACTOR, short=REGIME_WINDOWS[0], long=REGIME_WINDOWS[-1]):
+    """Giornata 'calda': gapper medi sulla finestra corta >= factor x finestra lunga"""
+    regime = regime.copy()
+    regime["hot"] = regime[f"gapper_{short}d"] >= factor * regime[f"gapper_{long}d"]
+    return regime
+
+# endregion
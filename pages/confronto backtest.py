@@ -0,0 +1,108 @@
+import json
+import streamlit as st
+import pandas as pd
+import numpy as np
+import plotly.graph_objects as go
+from result_store import list_runs, load_results, delete_run
+
+
+# ---- CONFIGURAZIONE ----
+st.set_page_config(page_title="Confronto Backtest", layout="wide")
+
+# Carica il CSS
+def local_css(file_name):
+    with open(file_name) as f:
+        st.markdown(f"<style>{f.read()}</style>", unsafe_allow_html=True)
+
+local_css("theme.css")
+
+st.markdown("<h1 style='margin-bottom:0px;'>Confronto Backtest</h1>", unsafe_allow_html=True)
+st.text("Run salvate dalla pagina Strategia: metriche ed equity a confronto")
+
+
+# =====================================
+# region ELENCO RUN
+# =====================================
+
+runs = list_runs()
+
+if runs.empty:
+    st.info("Nessuna run salvata: esegui la pagina Strategia con 'Salva e riusa le run' attivo.")
+    st.stop()
+
+runs["Run"] = np.where(
+    runs["label"].fillna("") != "",
+    runs["label"] + " (" + runs["run_hash"].str[:6] + ")",
+    runs["created_at"] + " (" + runs["run_hash"].str[:6] + ")",
+)
+
+st.markdown("### 📚 Run salvate")
+st.dataframe(
+    runs[["Run", "created_at", "dataset_version", "n_trades", "winrate", "expectancy",
+          "profit", "max_drawdown", "total_r"]].round(2),
+    use_container_width=True,
+    hide_index=True,
+)
+
+selected = st.multiselect(
+    "Run da confrontare",
+    options=runs["run_hash"].tolist(),
+    default=runs["run_hash"].head(2).tolist(),
+    format_func=dict(zip(runs["run_hash"], runs["Run"])).get,
+)
+
+# endregion
+
+
+# =====================================
+# region CONFRONTO
+# =====================================
+
+if selected:
+    chosen = runs.set_index("run_hash").loc[selected]
+
+    # ---- EQUITY SOVRAPPOSTE ----
+    fig = go.Figure()
+    for run_id in selected:
+        results = load_results(run_id)
+        if results is None:
+            continue
+        trades = results[results["attivazione"] == 1]
+        fig.add_trace(go.Scatter(
+            x=np.arange(1, len(trades) + 1),
+            y=trades["PnL_$"].cumsum(),
+            mode="lines",
+            name=chosen.loc[run_id, "Run"],
+        ))
+
+    fig.update_layout(
+        title="Equity cumulata per trade",
+        xaxis_title="Trade",
+        yaxis_title="PnL cumulato ($)",
+        height=420,
+    )
+    st.plotly_chart(fig, use_container_width=True)
+
+    # ---- METRICHE ----
+    st.markdown("### 📊 Metriche")
+    metrics = chosen[["n_trades", "winrate", "expectancy", "profit", "max_drawdown", "total_r"]]
+    metrics.index = chosen["Run"]
+    st.dataframe(metrics.T.round(2), use_container_width=True)
+
+    # ---- PARAMETRI ----
+    with st.expander("Parametri delle run"):
+        for run_id in selected:
+            st.markdown(f"**{chosen.loc[run_id, 'Run']}**")
+            st.json(json.loads(chosen.loc[run_id, "config"]), expanded=False)
+
+    with st.expander("Elimina run"):
+        to_delete = st.selectbox(
+            "Run",
+            selected,
+            format_func=lambda run_id: chosen.loc[run_id, "Run"],
+        )
+        if st.button("Elimina"):
+            delete_run(to_delete)
+            st.rerun()
+
+# endregion
@@ -5,6 +5,13 @@ from dateutil import parser
 import yfinance as yf
 from ui_kpi import kpi_box_statual
 from ui_kpi import build_kpi, kpi_box_statual
+from timeframe_metrics import INTRADAY_TFS, grouped_means, tf_columns
+from kpi_stats import group_bootstrap_ci, N_BOOT, CI_LEVEL
+from data_loader import page_sheet
+from ui_kpi import render_quality_summary
+from multigapper_engine import multigapper_days, HOT_FACTOR, REGIME_WINDOWS
+from result_store import dataset_version
+from profiler import start_rerun, profile_stage, mark, render_profiler_panel
 
 # -------------------------------------------------
 # CONFIG
@@ -14,6 +21,7 @@ st.set_page_config(
     layout="wide",
     initial_sidebar_state="expanded"
 )
+start_rerun("multigapper")
 
 st.title("📈 Statistiche multi gapper")
 
@@ -28,70 +36,10 @@ local_css("theme.css")
 # -------------------------------------------------
 # region LOAD DATA
 # -------------------------------------------------
-SHEET_URL = "https://docs.google.com/spreadsheets/d/15ev2l8av7iil_-HsXMZihKxV-B5MgTVO-LnK1y_f2-o/export?format=csv"
-df = pd.read_csv(SHEET_URL)
-df.columns = df.columns.str.strip()
-
-# --- PULIZIA DATI ----
-# Rimuovo eventuali spazi nei nomi colonne
-df.columns = df.columns.str.strip()
-
-# Funzione robusta per parse date con dayfirst
-def parse_date(x):
-    try:
-        return parser.parse(str(x).strip(), dayfirst=True)
-    except:
-        return pd.NaT
-
-df["Date"] = df["Date"].apply(parse_date)
-df["Date"] = df["Date"].apply(lambda x: x.date() if pd.notna(x) else pd.NaT)
-
-df["Chiusura"] = df["Chiusura"].str.upper().str.strip()
-
-# Funzione per convertire percentuali da stringhe con virgola e %
-def parse_percent(x):
-    try:
-        if pd.isna(x):
-            return np.nan
-        x = str(x).replace('%', '').replace(',', '.')
-        return float(x)
-    except:
-        return np.nan
-
-# Pulizia colonne percentuali
-percent_cols = ["GAP", "%Open_PMH", "%OH", "%OL"]
-for col in percent_cols:
-    if col in df.columns:
-        df[col] = df[col].apply(parse_percent)
-
-# Pulizia colonne numeriche con virgola e separatore migliaia
-num_cols = ["OPEN", "Float", "break", "Close"]
-for col in num_cols:
-    if col in df.columns:
-        df[col] = pd.to_numeric(
-            df[col].astype(str)
-            .str.replace('.', '', regex=False)   # rimuove punti migliaia
-            .str.replace(',', '.', regex=False), # converte virgole decimali
-            errors="coerce"
-        )
-
-# Sostituisco NaN con valori neutri per non perdere righe
-for col in ["GAP", "Float", "%Open_PMH", "OPEN", "%OH", "%OL", "break"]:
-    if col in df.columns:
-        df[col] = df[col].fillna(0)
-
-# --- PULIZIA COLONNE TIMEFRAME (Close / High / Low) ---
-tf_cols = [
-    c for c in df.columns
-    if c.startswith(("%Close_", "Close_", "High_", "Low_"))
-]
-
-for col in tf_cols:
-    df[col] = pd.to_numeric(
-        df[col].astype(str)
-        .str.replace(",", ".", regex=False).str.strip(),
-        errors="coerce"
-    )
+# foglio pulito (Close, colonne timeframe e metriche oh/ol/break) dal refresh worker
+with profile_stage("caricamento foglio") as stage:
+    df = page_sheet("multigapper")
+    stage.rows_out = len(df)
 
 # endregion
 
@@ -100,137 +48,110 @@ for col in tf_cols:
 # region CONTROLLO DATI 
 # -----------------------------------------------
 
-problemi_dati = False  # flag per sapere se ci sono problemi
-
-# Mostra il titolo solo se ci sono problemi
-if problemi_dati:
-    st.markdown('<h3 style="font-size:16px; color:#FFFFFF;">🛠️ Controllo dati</h3>', unsafe_allow_html=True)
-
-# Date non valide
-invalid_dates = df[df["Date"].isna()]
-if not invalid_dates.empty:
-    st.warning(f"⚠️ Attenzione: {len(invalid_dates)} righe con date non valide")
-    st.dataframe(invalid_dates[["Ticker", "Date"]])
-
-# Numeri non validi nelle colonne numeriche principali
-for col in ["GAP", "Float", "%Open_PMH", "OPEN", "%OH", "%OL", "break"]:
-    if col in df.columns:
-        invalid_nums = df[df[col].isna()]
-        if not invalid_nums.empty:
-            st.warning(f"⚠️ Attenzione: {len(invalid_nums)} righe con valori non numerici in '{col}'")
-            st.dataframe(invalid_nums[["Ticker", col]])
-
-# endregion
-
-# ---------------------------------------
-# region COLONNE CALCOLATE
-# ---------------------------------------
-
-# Calcolo day_close_pct
-if "Close" in df.columns and "OPEN" in df.columns:
-    df["day_close_pct"] = (df["Close"] - df["OPEN"]) / df["OPEN"] * 100
+# report calcolato una volta all'ingest (valori grezzi, prima di NaN -> 0): solo conteggi
+render_quality_summary(df)
 
 # endregion
+mark("controllo dati")
 
 # -------------------------------------------------
 # region SIDEBAR FILTRI
 # -------------------------------------------------
 st.sidebar.header("🔍 Filtri")
 
-date_range = st.sidebar.date_input("Intervallo date", [])
-min_gap = st.sidebar.number_input("GAP minimo (%)", 0, 1000, 50)
-
-col_mc1, col_mc2 = st.sidebar.columns(2)
-mc_min = col_mc1.number_input("MC Min ($M)", 0, 2000, 0, step=10)
-mc_max = col_mc2.number_input("MC Max ($M)", 0, 2000, 500, step=10)
+# form: i valori si applicano tutti insieme con un solo rerun
+with st.sidebar.form("filtri"):
+    date_range = st.date_input("Intervallo date", [])
+    min_gap = st.number_input("GAP minimo (%)", 0, 1000, 50)
 
-col_f1, col_f2 = st.sidebar.columns(2)
-float_min = col_f1.number_input("Float MIN ($M)", 0, 1000, 0, step=5)
-float_max = col_f2.number_input("Float MAX ($M)", 0, 1000, 50, step=5)
+    col_mc1, col_mc2 = st.columns(2)
+    mc_min = col_mc1.number_input("MC Min ($M)", 0, 2000, 0, step=10)
+    mc_max = col_mc2.number_input("MC Max ($M)", 0, 2000, 500, step=10)
 
-min_open_pmh = st.sidebar.number_input("%Open_PMH minimo", -100, 100, -100)
+    col_f1, col_f2 = st.columns(2)
+    float_min = col_f1.number_input("Float MIN ($M)", 0, 1000, 0, step=5)
+    float_max = col_f2.number_input("Float MAX ($M)", 0, 1000, 50, step=5)
 
-col_o1, col_o2 = st.sidebar.columns(2)
-open_min = col_o1.number_input("Open MIN", 0.0, 100.0, 1.0, step=0.1)
-open_max = col_o2.number_input("Open MAX", 0.0, 100.0, 100.0, step=0.1)
+    min_open_pmh = st.number_input("%Open_PMH minimo", -100, 100, -100)
 
-st.sidebar.subheader("📊 Multi-gapper day")
+    col_o1, col_o2 = st.columns(2)
+    open_min = col_o1.number_input("Open MIN", 0.0, 100.0, 1.0, step=0.1)
+    open_max = col_o2.number_input("Open MAX", 0.0, 100.0, 100.0, step=0.1)
 
-col_g1, col_g2 = st.sidebar.columns(2)
+    st.subheader("📊 Multi-gapper day")
 
-min_gapper_day = col_g1.number_input(
-    "Gapper MIN",
-    min_value=1,
-    max_value=20,
-    value=1,
-    step=1,
-    help= "numero minimo di gapper in giornata"
-)
-
-max_gapper_day = col_g2.number_input(
-    "Gapper MAX",
-    min_value=min_gapper_day,
-    max_value=50,
-    value=10,
-    step=1,
-    help= "numero massimo di gapper in giornata"
-)
+    col_g1, col_g2 = st.columns(2)
 
-# -------------------------------------------------
-# APPLY FILTERS
-# -------------------------------------------------
-filtered = df.copy()
+    min_gapper_day = col_g1.number_input(
+        "Gapper MIN",
+        min_value=1,
+        max_value=20,
+        value=1,
+        step=1,
+        help= "numero minimo di gapper in giornata"
+    )
 
-filtered = filtered[
-    (filtered["GAP"] >= min_gap) &
-    (filtered["%Open_PMH"] >= min_open_pmh) &
-    (filtered["OPEN"] >= open_min) &
-    (filtered["OPEN"] <= open_max)
-]
+    max_gapper_day = col_g2.number_input(
+        "Gapper MAX",
+        min_value=min_gapper_day,
+        max_value=50,
+        value=10,
+        step=1,
+        help= "numero massimo di gapper in giornata"
+    )
 
-if len(date_range) == 2:
-    start, end = date_range
-    filtered = filtered[(filtered["Date"] >= start) & (filtered["Date"] <= end)]
+    st.subheader("🌡️ Regime di mercato")
 
-filtered["Market Cap"] = pd.to_numeric(filtered["Market Cap"], errors="coerce")
-filtered = filtered[
-    (filtered["Market Cap"] >= mc_min * 1_000_000) &
-    (filtered["Market Cap"] <= mc_max * 1_000_000)
-]
+    only_hot = st.checkbox(
+        "Solo giornate in regime caldo",
+        value=False,
+        help="gapper medi degli ultimi 5 giorni sopra la media degli ultimi 60"
+    )
 
-filtered = filtered[
-    (filtered["Float"] >= float_min * 1_000_000) &
-    (filtered["Float"] <= float_max * 1_000_000)
-]
+    hot_factor = st.number_input(
+        "Soglia regime caldo (x media 60g)",
+        min_value=0.5,
+        max_value=5.0,
+        value=HOT_FACTOR,
+        step=0.1
+    )
 
-filtered["is_red"] = filtered["Chiusura"] == "RED"
-filtered["is_green"] = filtered["Chiusura"] == "GREEN"
+    st.form_submit_button("Applica filtri", use_container_width=True)
 
 # -------------------------------------------------
-# FILTRO MULTI-GAPPER
-# creazione dataset gapper
+# APPLY FILTERS + FILTRO MULTI-GAPPER
+# filtri e conteggio gapper per giornata in un solo passaggio,
+# in cache per versione del dataset e combinazione di filtri
 # -------------------------------------------------
 
-# Conteggio gapper per ogni giornata
-gapper_per_day = (
-    filtered
-    .groupby("Date")["Ticker"]
-    .count()
-    .reset_index(name="n_gapper_day")
-)
+filter_spec = {
+    "min_gap": min_gap,
+    "min_open_pmh": min_open_pmh,
+    "open_min": open_min,
+    "open_max": open_max,
+    "date_range": tuple(date_range),
+    "mc_min": mc_min,
+    "mc_max": mc_max,
+    "float_min": float_min,
+    "float_max": float_max,
+    "min_gapper_day": min_gapper_day,
+    "max_gapper_day": max_gapper_day,
+    "only_hot": only_hot,
+    "hot_factor": hot_factor,
+}
+
+# filtri + aggregazione + regime in cache per (versione dataset, filtri)
+@st.cache_data(show_spinner=False, max_entries=64)
+def cached_multigapper_days(_df, version, spec):
+    return multigapper_days(_df, spec)
 
-# Teniamo solo le giornate con almeno N gapper
-multi_gapper_days = gapper_per_day[
-    (gapper_per_day["n_gapper_day"] >= min_gapper_day) &
-    (gapper_per_day["n_gapper_day"] <= max_gapper_day)
-]
 
-filtered = filtered[
-    filtered["Date"].isin(multi_gapper_days["Date"])
-].copy()
+df_version = dataset_version(df)
+filtered, daily_mg, regime = cached_multigapper_days(df, df_version, filter_spec)
 
 
 # endregion
+mark("filtri", rows_out=len(filtered))
 
 
 # -------------------------------------------------
@@ -248,15 +169,10 @@ num_days_mg = filtered["Date"].nunique()
 # Numero medio gapper per giornata multi-gap
 # -------------------------------------------------
 
-gapper_per_day_mg = (
-    filtered
-    .groupby("Date")
-    .size()          # numero gapper in quel giorno
-)
-
+# conteggi per giornata già calcolati in multigapper_days
 avg_gapper_per_day = (
-    gapper_per_day_mg.mean()
-    if not gapper_per_day_mg.empty else 0
+    daily_mg["n_gapper_day"].mean()
+    if not daily_mg.empty else 0
 )
 
 
@@ -343,25 +259,14 @@ orario_green = minuti_to_orario(green.mean()) if not green.empty else "-"
 orario_green_med = minuti_to_orario(green.median()) if not green.empty else "-"
 
 # endregion
+mark("kpi")
 
 
 # -------------------------------------------------
 # region TABELLA GIORNALIERA MULTI-GAP
 # -------------------------------------------------
 
-daily_mg = (
-    filtered
-    .assign(is_red = filtered["Chiusura"] == "RED")
-    .groupby("Date")
-    .agg(
-        num_gapper = ("Ticker", "count"),
-        num_red    = ("is_red", "sum"),
-        pct_red    = ("is_red", "mean")
-    )
-    .reset_index()
-)
-
-daily_mg["pct_red"] *= 100
+# daily_mg (n_gapper_day, num_red, num_green, pct_red) arriva da multigapper_days
 
 
 # -------------------------------------------------
@@ -409,9 +314,29 @@ stats_total = structure_stats(total_df)
 stats_green = structure_stats(green_df)
 stats_red   = structure_stats(red_df)
 
+# -------------------------------------------------
+# Intervalli di confidenza bootstrap delle medie
+# (in cache per versione dataset + filtri)
+# -------------------------------------------------
+
+@st.cache_data(show_spinner=False, max_entries=64)
+def cached_group_ci(_df, version, spec, cols, n_boot=N_BOOT, ci=CI_LEVEL):
+    return group_bootstrap_ci(_df, list(cols), n_boot=n_boot, ci=ci)
+
+
+ci_cols = (
+    ("GAP", "%OH", "%OL", "day_close_pct")
+    + tuple(tf_columns("oh", INTRADAY_TFS) + tf_columns("ol", INTRADAY_TFS))
+)
+ci_lo, ci_hi = cached_group_ci(filtered, df_version, filter_spec, ci_cols)
+
+def ci_of(col, group="Totale"):
+    return (ci_lo.loc[group, col], ci_hi.loc[group, col])
+
 
 
 # endregion
+mark("tabella giornaliera")
 
 
 # -----------------------------------------------
@@ -469,6 +394,7 @@ with col2:
 
 
 # endregion
+mark("top box")
 
 
 # -------------------------------------
@@ -477,13 +403,16 @@ with col2:
 
 
 kpi_list = [
-    build_kpi("GAP Medio", gap_mean, gap_median, gap_red, gap_red_med, gap_green, gap_green_med),
-    build_kpi("Open / PMH medio", openpmh_mean, openpmh_med, open_pmh_red, open_pmh_red_med, open_pmh_green, open_pmh_green_med),
+    build_kpi("GAP Medio", total=gap_mean, red=gap_red, green=gap_green, total_med=gap_median, red_med=gap_red_med, green_med=gap_green_med,
+              total_ci=ci_of("GAP"), red_ci=ci_of("GAP", "RED"), green_ci=ci_of("GAP", "GREEN")),
+    build_kpi("Open / PMH medio", total=openpmh_mean, red=open_pmh_red, green=open_pmh_green, total_med=openpmh_med, red_med=open_pmh_red_med, green_med=open_pmh_green_med),
     #i valori mediani non sono significativi per il break essendo dati binari
     build_kpi("Break medio", pm_break_mean, pmbreak_red, pmbreak_green),
-    build_kpi("Spinta media", spinta_mean, spinta_med, spinta_red, spinta_red_med, spinta_green, spinta_green_med),
-    build_kpi("Minimo medio", minimo_mean, minimo_med, low_red, low_red_med, low_green, low_green_med),
-    build_kpi("Orario High medio", orario_high, orario_high_med, orario_red, orario_red_med, orario_green, orario_green_med, suffix="", show_bar=False)
+    build_kpi("Spinta media", total=spinta_mean, red=spinta_red, green=spinta_green, total_med=spinta_med, red_med=spinta_red_med, green_med=spinta_green_med,
+              total_ci=ci_of("%OH"), red_ci=ci_of("%OH", "RED"), green_ci=ci_of("%OH", "GREEN")),
+    build_kpi("Minimo medio", total=minimo_mean, red=low_red, green=low_green, total_med=minimo_med, red_med=low_red_med, green_med=low_green_med,
+              total_ci=ci_of("%OL"), red_ci=ci_of("%OL", "RED"), green_ci=ci_of("%OL", "GREEN")),
+    build_kpi("Orario High medio", total=orario_high, red=orario_red, green=orario_green, total_med=orario_high_med, red_med=orario_red_med, green_med=orario_green_med, suffix="", show_bar=False)
 ]
 
 
@@ -500,6 +429,7 @@ for i, kpi in enumerate(kpi_list):
 
 
 # endregion
+mark("kpi lista")
 
 
 #---------------------------------
@@ -528,24 +458,47 @@ labels = [
     "%Open vs PMH"
 ]
 
+# metriche medie con intervallo di confidenza (le mediane restano senza)
+metrics_ci = {
+    "High_mean": "%OH",
+    "Low_mean": "%OL",
+    "Close_mean": "day_close_pct",
+}
+
+def ci_error(stats, group):
+    """Barre di errore asimmetriche (IC bootstrap) per le metriche medie"""
+    plus, minus = [], []
+    for m in metrics:
+        if m in metrics_ci:
+            lo, hi = ci_of(metrics_ci[m], group)
+            plus.append(hi - stats[m])
+            minus.append(stats[m] - lo)
+        else:
+            plus.append(None)
+            minus.append(None)
+    return dict(type="data", symmetric=False, array=plus, arrayminus=minus)
+
 fig = go.Figure()
 
 fig.add_bar(
     name="Totale",
     x=labels,
     y=[stats_total[m] for m in metrics],
+    error_y=ci_error(stats_total, "Totale"),
 )
 
 fig.add_bar(
     name="Green",
     x=labels,
     y=[stats_green[m] for m in metrics],
+    error_y=ci_error(stats_green, "GREEN"),
 )
 
 fig.add_bar(
     name="Red",
     x=labels,
     y=[stats_red[m] for m in metrics],
+    error_y=ci_error(stats_red, "RED"),
 )
 
 fig.update_layout(
@@ -559,69 +512,40 @@ fig.update_layout(
 st.plotly_chart(fig, use_container_width=True)
 
 # endregion
+mark("grafico confronto")
 
 
 # --------------------------------------------
 # region GRAFICO INTRADAY
 # --------------------------------------------
 
-# Converzione campi testo in numeri
-
-# Timeframe highs
-for tf in [15, 30, 60]:
-    col = f"High_{tf}m"
-    if col in filtered.columns:
-        filtered[col] = pd.to_numeric(
-            filtered[col]
-            .astype(str)
-            .str.replace(",", ".")
-            .str.strip(),
-            errors="coerce"
-        )
-
-# PM High
-if "PM_high" in filtered.columns:
-    filtered["PM_high"] = pd.to_numeric(
-        filtered["PM_high"]
-        .astype(str)
-        .str.replace(",", ".")
-        .str.strip(),
-        errors="coerce"
-    )
-
-# Creazione calcoli per grafici intraday
-
-for tf in [15, 30, 60]:
-    # %H/L rispetto all'open
-    filtered[f"oh_{tf}m"] = (filtered[f"High_{tf}m"] - filtered["OPEN"]) / filtered["OPEN"] * 100
-    filtered[f"ol_{tf}m"] = (filtered[f"Low_{tf}m"] - filtered["OPEN"]) / filtered["OPEN"] * 100
-
-    # Break PMH
-    filtered[f"break_pmh_{tf}m"] = (filtered[f"High_{tf}m"] >= filtered["PM_high"]).astype(int)
-
-# Medie per i grafici intraday
-oh_red = filtered.loc[filtered["Chiusura"] == "RED", ["oh_15m","oh_30m","oh_60m"]].mean()
-oh_green = filtered.loc[filtered["Chiusura"] == "GREEN", ["oh_15m","oh_30m","oh_60m"]].mean()
-
-ol_red = filtered.loc[filtered["Chiusura"] == "RED", ["ol_15m","ol_30m","ol_60m"]].mean()
-ol_green = filtered.loc[filtered["Chiusura"] == "GREEN", ["ol_15m","ol_30m","ol_60m"]].mean()
-
-
+# day_close_pct, oh_{tf}m / ol_{tf}m / break_pmh_{tf}m calcolati al caricamento
+# (data_loader.parse_multigapper_sheet, una volta per snapshot)
 
 import plotly.graph_objects as go
 
-def ci_box_single(df):
+def ci_box_single(df, timeframes=INTRADAY_TFS, ci=None):
     if df.empty:
         st.write("Nessun dato disponibile")
         return
 
-    timeframes = ["15", "30", "60"]
     labels = [f"H{tf}" for tf in timeframes] + [f"L{tf}" for tf in timeframes]
-
-    # Calcolo medie
-    total_means = [df[f"oh_{tf}m"].mean() for tf in timeframes] + [df[f"ol_{tf}m"].mean() for tf in timeframes]
-    red_means   = [df[df["Chiusura"]=="RED"][f"oh_{tf}m"].mean() for tf in timeframes] + [df[df["Chiusura"]=="RED"][f"ol_{tf}m"].mean() for tf in timeframes]
-    green_means = [df[df["Chiusura"]=="GREEN"][f"oh_{tf}m"].mean() for tf in timeframes] + [df[df["Chiusura"]=="GREEN"][f"ol_{tf}m"].mean() for tf in timeframes]
+    cols = tf_columns("oh", timeframes) + tf_columns("ol", timeframes)
+
+    # Calcolo medie Totale / RED / GREEN in una sola chiamata
+    means = grouped_means(df, cols)
+    total_means = means.loc["Totale"].tolist()
+    red_means   = means.loc["RED"].tolist()
+    green_means = means.loc["GREEN"].tolist()
+
+    # Barre di errore dagli intervalli di confidenza (ci = (lo, hi) per gruppo)
+    def error_x(group):
+        if ci is None:
+            return None
+        lo, hi = ci[0].loc[group, cols], ci[1].loc[group, cols]
+        mean = means.loc[group]
+        return dict(type="data", symmetric=False,
+                    array=(hi - mean).tolist(), arrayminus=(mean - lo).tolist())
 
     # Grafico
     fig = go.Figure()
@@ -631,6 +555,7 @@ def ci_box_single(df):
         y=labels,
         name="Totale",
         orientation='h',
+        error_x=error_x("Totale"),
         marker_color="#3498DB",  # azzurrino
         text=[f"{v:.1f}%" for v in total_means],
         textposition="outside"
@@ -641,6 +566,7 @@ def ci_box_single(df):
         y=labels,
         name="RED",
         orientation='h',
+        error_x=error_x("RED"),
         marker_color="#E74C3C",
         text=[f"{v:.1f}%" for v in red_means],
         textposition="outside"
@@ -651,6 +577,7 @@ def ci_box_single(df):
         y=labels,
         name="GREEN",
         orientation='h',
+        error_x=error_x("GREEN"),
         marker_color="#2ECC71",
         text=[f"{v:.1f}%" for v in green_means],
         textposition="outside"
@@ -667,11 +594,12 @@ def ci_box_single(df):
     st.plotly_chart(fig, use_container_width=True)
 
 
-ci_box_single(filtered)
+ci_box_single(filtered, ci=(ci_lo, ci_hi))
 
 
 
 # endregion
+mark("grafico intraday")
 
 
 # -------------------------------------------------
@@ -743,6 +671,71 @@ with col2:
     st.plotly_chart(fig_time, use_container_width=True)
 
 # endregion
+mark("distribuzione red")
+
+
+# -------------------------------------------------
+# region REGIME DI MERCATO
+# medie mobili 5/20/60 giornate (calcolate in multigapper_days)
+# -------------------------------------------------
+
+@st.fragment
+def render_regime(regime):
+    """Fragment: il cambio di metrica ridisegna solo questo grafico"""
+    st.subheader("🌡️ Regime di mercato")
+
+    if regime.empty:
+        st.write("Nessun dato disponibile")
+    else:
+        regime_metric = st.selectbox(
+            "Metrica regime",
+            ["Gapper per giornata", "% RED", "%OH medio", "%OL medio", "%Close medio"]
+        )
+
+        regime_prefix = {
+            "Gapper per giornata": "gapper",
+            "% RED": "pct_red",
+            "%OH medio": "oh",
+            "%OL medio": "ol",
+            "%Close medio": "close",
+        }[regime_metric]
+
+        fig_regime = go.Figure()
+
+        for w in REGIME_WINDOWS:
+            fig_regime.add_trace(go.Scatter(
+                x=regime["Date"].astype(str),
+                y=regime[f"{regime_prefix}_{w}d"],
+                mode="lines",
+                name=f"{w} giorni"
+            ))
+
+        # giornate in regime caldo evidenziate sull'asse x
+        hot_days = regime[regime["hot"]]
+        fig_regime.add_trace(go.Scatter(
+            x=hot_days["Date"].astype(str),
+            y=hot_days[f"{regime_prefix}_{REGIME_WINDOWS[0]}d"],
+            mode="markers",
+            name="Regime caldo",
+            marker=dict(color="#E67E22", size=6)
+        ))
+
+        fig_regime.update_layout(
+            height=350,
+            xaxis_title="Data",
+            yaxis_title=regime_metric,
+            margin=dict(l=20, r=20, t=20, b=20)
+        )
+        fig_regime.update_xaxes(type="category")
+
+        st.plotly_chart(fig_regime, use_container_width=True)
+        st.caption(f"Giornate in regime caldo: {int(regime['hot'].sum())} su {len(regime)}")
+
+
+render_regime(regime)
+
+# endregion
+mark("regime")
 
 
 # -------------------------------------------------
@@ -857,4 +850,7 @@ st.caption(f"Sto mostrando {len(filtered_sorted)} record filtrati su {len(df)} t
 
 
 
-# endregion
\ No newline at end of file
+# endregion
+
+mark("fine pagina")
+render_profiler_panel()
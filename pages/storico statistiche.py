@@ -4,176 +4,121 @@ import pandas as pd
 import numpy as np
 from dateutil import parser
 import numpy as np
+from data_loader import page_sheet
+from ui_kpi import render_quality_summary
+from profiler import start_rerun, profile_stage, mark, render_profiler_panel
 
 
 # ---- CONFIGURAZIONE ----
 st.set_page_config(page_title="Analisi Storico", layout="wide", initial_sidebar_state="expanded")
+start_rerun("storico statistiche")
 st.title("📈 Analisi Storico")
 
 # ---- CARICAMENTO DATI ----
-SHEET_URL = "https://docs.google.com/spreadsheets/d/15ev2l8av7iil_-HsXMZihKxV-B5MgTVO-LnK1y_f2-o/export?format=csv&gid=137871937"
-df = pd.read_csv(SHEET_URL)
-
-# Rimuovi tutte le colonne senza nome
-df = df.loc[:, ~df.columns.str.contains("^Unnamed")]
+# tab storico (gid 137871937) dal refresh worker, senza colonne Unnamed
 
 # region ---- PULIZIA DATI ----
-# Rimuovo eventuali spazi nei nomi colonne
-df.columns = df.columns.str.strip()
-
-# Funzione robusta per parse date con dayfirst
-def parse_date(x):
-    try:
-        return parser.parse(str(x).strip(), dayfirst=True)
-    except:
-        return pd.NaT
-
-df["Date"] = df["Date"].apply(parse_date)
-df["Date"] = df["Date"].apply(lambda x: x.date() if pd.notna(x) else pd.NaT)
-
-df["Chiusura"] = df["Chiusura"].str.upper().str.strip()
-
-# Funzione per convertire percentuali da stringhe con virgola e %
-def parse_percent(x):
-    try:
-        if pd.isna(x):
-            return np.nan
-        x = str(x).replace('%', '').replace(',', '.')
-        return float(x)
-    except:
-        return np.nan
+with profile_stage("caricamento foglio") as stage:
+    df = page_sheet("storico")
+    stage.rows_out = len(df)
 
-# Pulizia colonne percentuali
-percent_cols = ["GAP", "%Open_PMH", "%OH", "%OL"]
-for col in percent_cols:
-    if col in df.columns:
-        df[col] = df[col].apply(parse_percent)
-
-# Pulizia colonne numeriche con virgola e separatore migliaia
-num_cols = ["OPEN", "Shared Outstanding", "break"]
-for col in num_cols:
-    if col in df.columns:
-        df[col] = pd.to_numeric(
-            df[col].astype(str)
-            .str.replace('.', '', regex=False)   # rimuove punti migliaia
-            .str.replace(',', '.', regex=False), # converte virgole decimali
-            errors="coerce"
-        )
-
-# Sostituisco NaN con valori neutri per non perdere righe
-for col in ["GAP", "Shared Outstanding", "%Open_PMH", "OPEN", "%OH", "%OL", "break"]:
-    if col in df.columns:
-        df[col] = df[col].fillna(0)
- 
 # endregion
 
 # region ---- CONTROLLO DATI ----
 
-problemi_dati = False  # flag per sapere se ci sono problemi
-
-# Mostra il titolo solo se ci sono problemi
-if problemi_dati:
-    st.markdown('<h3 style="font-size:16px; color:#FFFFFF;">🛠️ Controllo dati</h3>', unsafe_allow_html=True)
-
-# Date non valide
-invalid_dates = df[df["Date"].isna()]
-if not invalid_dates.empty:
-    st.warning(f"⚠️ Attenzione: {len(invalid_dates)} righe con date non valide")
-    st.dataframe(invalid_dates[["Ticker", "Date"]])
-
-# Numeri non validi nelle colonne numeriche principali
-for col in ["GAP", "Shared Outstanding", "%Open_PMH", "OPEN", "%OH", "%OL", "break"]:
-    if col in df.columns:
-        invalid_nums = df[df[col].isna()]
-        if not invalid_nums.empty:
-            st.warning(f"⚠️ Attenzione: {len(invalid_nums)} righe con valori non numerici in '{col}'")
-            st.dataframe(invalid_nums[["Ticker", col]])
+# report calcolato una volta all'ingest (valori grezzi, prima di NaN -> 0): solo conteggi
+render_quality_summary(df)
 
 # endregion
+mark("controllo dati")
 
 # region ---- FILTRI ----
 st.sidebar.header("🔍 Filtri")
 
-date_range = st.sidebar.date_input("Intervallo date", [])
-tickers = st.sidebar.multiselect("Ticker", sorted(df["Ticker"].dropna().unique()))
-min_gap = st.sidebar.number_input("GAP minimo (%)", 0, 1000, 50)
-
-# ====== MARKET CAP: DUE BOX (IN MILIONI) ======
-# Valori fissi di default in Milioni
-default_mc_min_M = 0
-default_mc_max_M = 2000
-
-col_mc_min, col_mc_max = st.sidebar.columns(2)
-
-marketcap_min_M = col_mc_min.number_input(
-    "MC Min ($M)", 
-    value=default_mc_min_M, 
-    step=10,
-    min_value=0,
-    max_value=2000,
-    help="Valore minimo di Market Cap in Milioni"
-)
-
-marketcap_max_M = col_mc_max.number_input(
-    "MC Max ($M)", 
-    value=default_mc_max_M, 
-    step=10,
-    min_value=0,
-    max_value=2000,
-    help="Valore massimo di Market Cap in Milioni"
-)
-
-# Converti in valori reali per il filtro
-marketcap_min = marketcap_min_M * 1_000_000
-marketcap_max = marketcap_max_M * 1_000_000
-
-min_open_pmh = st.sidebar.number_input("%Open_PMH minimo", -100, 100, -100)
-
-# filtro sh outstanding
-col_shout_min, col_shout_max = st.sidebar.columns(2)
-
-shout_min = col_shout_min.number_input(
-    "ShOut MIN", 
-    value=0, 
-    step=100000,
-    min_value=0,
-    max_value=1000000000,
-    help="Valore minimo di Flottante"
-
-)
-
-shout_max = col_shout_max.number_input(
-    "ShOut MAX", 
-    value=5000000, 
-    step=100000,
-    min_value=0,
-    max_value=1000000000,
-    help="Valore massimo di Flottante"
-
-)
-
-# filtro OPEN price
-col_open_min, col_open_max = st.sidebar.columns(2)
-
-open_min = col_open_min.number_input(
-    "Open MIN %", 
-    value=0.0, 
-    step=0.1,
-    min_value=0.0,
-    max_value=100.0,
-    help="Valore minimo di Open rispetto a PMH in %"
-
-)
-
-open_max = col_open_max.number_input(
-    "Open MAX %", 
-    value=100.0, 
-    step=0.1,
-    min_value=0.0,
-    max_value=100.0,
-    help="Valore massimo di Open rispetto a PMH in %"
-
-)
+# form: i valori si applicano tutti insieme con un solo rerun
+with st.sidebar.form("filtri"):
+    date_range = st.date_input("Intervallo date", [])
+    tickers = st.multiselect("Ticker", sorted(df["Ticker"].dropna().unique()))
+    min_gap = st.number_input("GAP minimo (%)", 0, 1000, 50)
+
+    # ====== MARKET CAP: DUE BOX (IN MILIONI) ======
+    # Valori fissi di default in Milioni
+    default_mc_min_M = 0
+    default_mc_max_M = 2000
+
+    col_mc_min, col_mc_max = st.columns(2)
+
+    marketcap_min_M = col_mc_min.number_input(
+        "MC Min ($M)", 
+        value=default_mc_min_M, 
+        step=10,
+        min_value=0,
+        max_value=2000,
+        help="Valore minimo di Market Cap in Milioni"
+    )
+
+    marketcap_max_M = col_mc_max.number_input(
+        "MC Max ($M)", 
+        value=default_mc_max_M, 
+        step=10,
+        min_value=0,
+        max_value=2000,
+        help="Valore massimo di Market Cap in Milioni"
+    )
+
+    # Converti in valori reali per il filtro
+    marketcap_min = marketcap_min_M * 1_000_000
+    marketcap_max = marketcap_max_M * 1_000_000
+
+    min_open_pmh = st.number_input("%Open_PMH minimo", -100, 100, -100)
+
+    # filtro sh outstanding
+    col_shout_min, col_shout_max = st.columns(2)
+
+    shout_min = col_shout_min.number_input(
+        "ShOut MIN", 
+        value=0, 
+        step=100000,
+        min_value=0,
+        max_value=1000000000,
+        help="Valore minimo di Flottante"
+
+    )
+
+    shout_max = col_shout_max.number_input(
+        "ShOut MAX", 
+        value=5000000, 
+        step=100000,
+        min_value=0,
+        max_value=1000000000,
+        help="Valore massimo di Flottante"
+
+    )
+
+    # filtro OPEN price
+    col_open_min, col_open_max = st.columns(2)
+
+    open_min = col_open_min.number_input(
+        "Open MIN %", 
+        value=0.0, 
+        step=0.1,
+        min_value=0.0,
+        max_value=100.0,
+        help="Valore minimo di Open rispetto a PMH in %"
+
+    )
+
+    open_max = col_open_max.number_input(
+        "Open MAX %", 
+        value=100.0, 
+        step=0.1,
+        min_value=0.0,
+        max_value=100.0,
+        help="Valore massimo di Open rispetto a PMH in %"
+
+    )
+
+    st.form_submit_button("Applica filtri", use_container_width=True)
 
 filtered = df.copy()
 if tickers:
@@ -220,6 +165,7 @@ else:
     st.info("⚠️ Nessun dato disponibile dopo i filtri.")
 
 # endregion
+mark("filtri", rows_out=len(filtered))
 
 # region ---- KPI BOX ----
 total = len(filtered)
@@ -327,6 +273,7 @@ mediaorario_red = minuti_to_orario(red.mean()) if not red.empty else "-"
 mediaorario_green = minuti_to_orario(green.mean()) if not green.empty else "-"
 
 # endregion
+mark("kpi box")
 
 # region ---- STILE GLOBALE ----
 st.markdown(
@@ -414,6 +361,7 @@ st.markdown(
 )
 
 # endregion
+mark("stile")
 
 # region ---- KPI BOX SCROLLABILI ----
 html_kpis = f"""
@@ -555,6 +503,7 @@ html_kpis = f"""
 st.markdown(html_kpis, unsafe_allow_html=True)
 
 # endregion
+mark("kpi scrollabili")
 
 
 # ---- TAB E TABELLA ----
@@ -613,3 +562,6 @@ for col in percent_cols_display:
 
 st.dataframe(filtered_sorted, use_container_width=True)
 st.caption(f"Sto mostrando {len(filtered_sorted)} record filtrati su {len(df)} totali.")
+
+mark("fine pagina")
+render_profiler_panel()
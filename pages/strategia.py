@@ -1,3 +1,4 @@
+import os
 import streamlit as st
 import pandas as pd
 from dateutil import parser
@@ -5,10 +6,32 @@ import numpy as np
 import matplotlib.pyplot as plt
 from ui_kpi import kpi_box_statual
 from ui_kpi import build_kpi, kpi_box_statual
+from kpi_stats import bootstrap_trade_kpis, N_BOOT, CI_LEVEL
+from montecarlo import simulate_trade_sequences, PERCENTILES
+from strategy_engine import (
+    add_pretrade_features, build_prices, r_multiple, param_grid, sweep_exit_models, scenario_stats,
+    EXIT_PARAMS, EXIT_TFS, SHORT, LONG, AMBIGUITY_MODELS, SL_FIRST_PROB
+)
+from walkforward import walk_forward, OBJECTIVES
+from cost_model import (
+    BORROW_MODES, COMMISSION_PER_SHARE, MIN_TICKET, SLIPPAGE_PCT, BORROW_PCT, cost_r, trade_shares
+)
+from portfolio import simulate_portfolio, trade_exposure_pct, ALLOCATIONS, MAX_POSITIONS, MAX_EXPOSURE_PCT
+from strategy_rules import parse_rules, rule_masks, rule_comparison
+from result_store import dataset_version, run_hash, load_results, save_run, results_match, RESULT_COLS
+from data_loader import page_sheet
+from ui_kpi import render_quality_summary
+from backtest import filter_universe, simulate_config, trade_pnl, trade_metrics
+from minute_bars import (
+    load_store, attach_bars, build_minute_prices, store_available,
+    MINUTE_BARS_DIR, DAYS_FILE, RESOLUTION_BUCKET, RESOLUTION_MINUTE,
+)
+from profiler import start_rerun, profile_stage, mark, render_profiler_panel
 
 
 # ---- CONFIGURAZIONE ----
 st.set_page_config(page_title="Strategia Intraday", layout="wide")
+start_rerun("strategia")
 
 # Carica il CSS
 def local_css(file_name):
@@ -45,183 +68,345 @@ with col2:
     )
 
 
-# ---- CARICAMENTO DATI CON CACHE ----
-SHEET_URL = "https://docs.google.com/spreadsheets/d/15ev2l8av7iil_-HsXMZihKxV-B5MgTVO-LnK1y_f2-o/export?format=xlsx"
+# store delle barre a 1 minuto: memory-map aperto una volta, riaperto se l'import lo riscrive
+@st.cache_resource
+def open_bar_store(path, modified):
+    return load_store(path)
 
-@st.cache_data
-def load_data():
-    # Carica tutte le colonne automaticamente
-    df = pd.read_excel(SHEET_URL, sheet_name="scarico_intraday")
-    # Parse date
-    df["Date"] = pd.to_datetime(df["Date"], errors="coerce").dt.date
-    df["Date"] = pd.to_datetime(df["Date"], errors="coerce").dt.strftime("%d-%m-%Y")
-    return df
 
+# ---- CARICAMENTO DATI (snapshot del refresh worker) ----
+with profile_stage("caricamento foglio") as stage:
+    df = page_sheet("strategia")
+    stage.rows_out = len(df)
 
-df = load_data()
+# controllo qualità fatto all'ingest: solo conteggi
+render_quality_summary(df)
+n_envelope_fix = int(df["Envelope_fix"].sum()) if "Envelope_fix" in df.columns else 0
+if n_envelope_fix:
+    st.caption(f"🔧 {n_envelope_fix} righe con High/Low per timeframe riportati a estremi cumulati (colonna Envelope_fix)")
 
 
 #================================
 # region FILTRI LATERALI 
 #================================
 
-#st.sidebar.header("🔍 Filtri e parametri")
-date_range = st.sidebar.date_input("Intervallo date", [])
-tickers = sorted(df["Ticker"].dropna().unique())
-selected_tickers = st.sidebar.multiselect(
-    "Ticker",
-    options=tickers,
-    default=[],
-    help="Seleziona uno o più ticker da analizzare (lascia vuoto per tutti)"
-)
+# fuori dal form: decidono quali campi compaiono nel form, quindi si applicano subito
+with st.sidebar.expander("direzione, livelli e ambiguità SL/TP", expanded=True):
 
-# ====== MARKET CAP: DUE BOX (IN MILIONI) ======
-# Valori fissi di default in Milioni
-default_mc_min_M = 0
-default_mc_max_M = 2000
+    direction_label = st.radio(
+        "Direzione",
+        ["Short", "Long", "Entrambi"],
+        horizontal=True,
+        help="Long: breakout sopra l'entry, SL sotto e TP sopra. "
+             "Entrambi: tabella e grafici sullo short, confronto affiancato nei KPI"
+    )
+    param_direction = LONG if direction_label == "Long" else SHORT
+
+    n_legs = st.number_input(
+        "Livelli di ingresso",
+        value=1,
+        min_value=1,
+        max_value=5,
+        step=1,
+        help="Con più livelli %SL e %TP sono calcolati dal prezzo medio della posizione"
+    )
 
-col_mc_min, col_mc_max = st.sidebar.columns(2)
+    ambiguity_labels = {"worst": "Peggiorativo (SL prima)", "best": "Migliorativo (TP prima)", "prob": "Probabilistico"}
+    exit_ambiguity = st.selectbox(
+        "SL e TP nello stesso bucket",
+        AMBIGUITY_MODELS,
+        format_func=ambiguity_labels.get,
+        help="Probabilistico: usa TimeHigh se cade nel bucket, altrimenti la probabilità sotto"
+    )
 
-marketcap_min_M = col_mc_min.number_input(
-    "MC Min ($M)", 
-    value=default_mc_min_M, 
-    step=10,
-    min_value=0,
-    max_value=2000,
-    help="Valore minimo di Market Cap in Milioni"
-)
+# form: filtri e parametri si applicano tutti insieme con un solo rerun
+with st.sidebar.form("parametri"):
+    #st.header("🔍 Filtri e parametri")
+    date_range = st.date_input("Intervallo date", [])
+    tickers = sorted(df["Ticker"].dropna().unique())
+    selected_tickers = st.multiselect(
+        "Ticker",
+        options=tickers,
+        default=[],
+        help="Seleziona uno o più ticker da analizzare (lascia vuoto per tutti)"
+    )
 
-marketcap_max_M = col_mc_max.number_input(
-    "MC Max ($M)", 
-    value=default_mc_max_M, 
-    step=10,
-    min_value=0,
-    max_value=2000,
-    help="Valore massimo di Market Cap in Milioni"
-)
+    # ====== MARKET CAP: DUE BOX (IN MILIONI) ======
+    # Valori fissi di default in Milioni
+    default_mc_min_M = 0
+    default_mc_max_M = 2000
+
+    col_mc_min, col_mc_max = st.columns(2)
 
-# Converti in valori reali per il filtro
-marketcap_min = marketcap_min_M * 1_000_000
-marketcap_max = marketcap_max_M * 1_000_000
+    marketcap_min_M = col_mc_min.number_input(
+        "MC Min ($M)", 
+        value=default_mc_min_M, 
+        step=10,
+        min_value=0,
+        max_value=2000,
+        help="Valore minimo di Market Cap in Milioni"
+    )
 
-# ====== ALTRI FILTRI ======
+    marketcap_max_M = col_mc_max.number_input(
+        "MC Max ($M)", 
+        value=default_mc_max_M, 
+        step=10,
+        min_value=0,
+        max_value=2000,
+        help="Valore massimo di Market Cap in Milioni"
+    )
 
+    # Converti in valori reali per il filtro
+    marketcap_min = marketcap_min_M * 1_000_000
+    marketcap_max = marketcap_max_M * 1_000_000
 
-col_min_open, col_max_open = st.sidebar.columns(2)
+    # ====== ALTRI FILTRI ======
 
-min_open = col_min_open.number_input(
-    "Open min ($)",
-    value=2.0,
-    min_value=0.0,
-    max_value=500.0,
-    help="prezzo minimo di Open"
-)
 
-max_open = col_max_open.number_input(
-    "Open max ($)",
-    value=500.0,
-    min_value=0.0,
-    max_value=500.0,
-    help="prezzo minimo di Open"
-)
+    col_min_open, col_max_open = st.columns(2)
 
-min_gap = st.sidebar.number_input(
-    "Gap% minimo",
-    value=50.0,
-    min_value=0.0,
-    max_value=500.0,
-    step=5.0
-)
+    min_open = col_min_open.number_input(
+        "Open min ($)",
+        value=2.0,
+        min_value=0.0,
+        max_value=500.0,
+        help="prezzo minimo di Open"
+    )
 
-# ====== SHARES FLOAT (IN MILIONI) ======
+    max_open = col_max_open.number_input(
+        "Open max ($)",
+        value=500.0,
+        min_value=0.0,
+        max_value=500.0,
+        help="prezzo minimo di Open"
+    )
 
-default_float_min_M = 0
-default_float_max_M = 200  # 200M come default
+    min_gap = st.number_input(
+        "Gap% minimo",
+        value=50.0,
+        min_value=0.0,
+        max_value=500.0,
+        step=5.0
+    )
 
-col_float_min, col_float_max = st.sidebar.columns(2)
+    # ====== SHARES FLOAT (IN MILIONI) ======
 
-float_min_M = col_float_min.number_input(
-    "Float Min (M)",
-    value=default_float_min_M,
-    step=50,
-    min_value=0,
-    max_value=1000,
-    help="Valore minimo di Shares Float in Milioni"
-)
+    default_float_min_M = 0
+    default_float_max_M = 200  # 200M come default
 
-float_max_M = col_float_max.number_input(
-    "Float Max (M)",
-    value=default_float_max_M,
-    step=50,
-    min_value=0,
-    max_value=1000,
-    help="Valore massimo di Shares Float in Milioni"
-)
+    col_float_min, col_float_max = st.columns(2)
 
-min_float = float_min_M * 1_000_000
-max_float = float_max_M * 1_000_000
+    float_min_M = col_float_min.number_input(
+        "Float Min (M)",
+        value=default_float_min_M,
+        step=50,
+        min_value=0,
+        max_value=1000,
+        help="Valore minimo di Shares Float in Milioni"
+    )
 
-with st.sidebar.expander("parametri strategia"):
+    float_max_M = col_float_max.number_input(
+        "Float Max (M)",
+        value=default_float_max_M,
+        step=50,
+        min_value=0,
+        max_value=1000,
+        help="Valore massimo di Shares Float in Milioni"
+    )
 
-    param_sl = st.number_input("%SL", value=30.0)
-    param_tp = st.number_input("%TP", value=-15.0)
-    param_entry = st.number_input("%entry", value=15.0)
+    min_float = float_min_M * 1_000_000
+    max_float = float_max_M * 1_000_000
 
+    # ====== CAPITALE E RISCHIO ======
 
+    col_capital, col_risk = st.columns(2)
 
-filtered = df.copy()
+    initial_capital = col_capital.number_input(
+        "💰 Capitale iniziale",
+        value=3000.0,
+        step=100.0
+    )
 
-# Converti Gap% e Open in numerico
-filtered["Gap%"] = pd.to_numeric(filtered["Gap%"], errors="coerce")
-filtered["Open"] = pd.to_numeric(filtered["Open"], errors="coerce")
-filtered["Market Cap"] = pd.to_numeric(filtered["Market Cap"], errors="coerce")
+    risk_pct = col_risk.number_input(
+        "📉 % Rischio per trade",
+        value=2.0,
+        step=0.5
+    )
 
-# Converti sempre Date in datetime
-filtered["Date_dt"] = pd.to_datetime(filtered["Date"], format="%d-%m-%Y", errors="coerce")
+    # i campi che compaiono per le scelte sopra il form restano visibili
+    with st.expander("parametri strategia", expanded=direction_label != "Short"):
+
+        param_sl = st.number_input("%SL", value=30.0)
+        param_tp = st.number_input("%TP", value=-15.0)
+        param_entry = st.number_input("%entry", value=15.0)
+
+        param_entry_long = param_sl_long = param_tp_long = None
+        if direction_label != "Short":
+            param_entry_long = st.number_input("%entry long", value=10.0)
+            param_sl_long = st.number_input("%SL long", value=-5.0)
+            param_tp_long = st.number_input("%TP long", value=25.0)
+
+    with st.expander("scale-in (più ingressi)", expanded=n_legs > 1):
+
+        if n_legs == 1:
+            st.caption("Un solo ingresso: aumenta 'Livelli di ingresso' sopra i filtri")
+        scale_in_legs = []
+        for leg in range(int(n_legs) if n_legs > 1 else 0):
+            col_leg_entry, col_leg_size = st.columns(2)
+            leg_entry = col_leg_entry.number_input(
+                f"%entry L{leg + 1}",
+                value=param_entry + 10.0 * leg,
+                key=f"leg_entry_{leg}"
+            )
+            leg_size = col_leg_size.number_input(
+                f"% size L{leg + 1}",
+                value=round(100.0 / n_legs, 1),
+                min_value=0.0,
+                max_value=100.0,
+                key=f"leg_size_{leg}"
+            )
+            scale_in_legs.append((leg_entry, leg_size))
+
+    with st.expander("uscite (trailing, break-even, time stop)", expanded=exit_ambiguity == "prob"):
+
+        exit_trailing = st.number_input(
+            "Trailing stop %",
+            value=0.0,
+            min_value=0.0,
+            step=1.0,
+            help="Stop a minimo raggiunto dopo l'entry + X%. 0 = disattivato"
+        )
+        exit_breakeven = st.number_input(
+            "Break-even %",
+            value=0.0,
+            min_value=0.0,
+            step=1.0,
+            help="Stop spostato al prezzo di entry dopo un movimento a favore di X%. 0 = disattivato"
+        )
+        # solo i timeframe con colonna Close_{tf}m nel foglio
+        time_stop_options = [
+            tf for tf in EXIT_TFS[mode]
+            if tf != "close" and f"Close_{tf}m" in df.columns
+        ]
+        exit_time_stop = st.selectbox(
+            "Time stop",
+            [None] + time_stop_options,
+            format_func=lambda tf: "Nessuno" if tf is None else f"{tf} min",
+            help="Chiude la posizione al Close del timeframe scelto se SL/TP non sono stati raggiunti"
+        )
 
-# --- Filtro date solo se l’utente ha selezionato un intervallo ---
-if len(date_range) == 2:
-    start, end = date_range
-    filtered = filtered[(filtered["Date_dt"] >= pd.to_datetime(start)) &
-                        (filtered["Date_dt"] <= pd.to_datetime(end))]
-    
-    if filtered.empty:
-        st.warning(
-            f"⚠️ Nessun dato disponibile per l'intervallo selezionato ({start.strftime('%d-%m-%Y')} - {end.strftime('%d-%m-%Y')})."
+        exit_sl_first_prob = SL_FIRST_PROB
+        if exit_ambiguity == "prob":
+            exit_sl_first_prob = st.slider("Probabilità SL prima", 0.0, 1.0, SL_FIRST_PROB, step=0.05)
+
+        exit_model = {
+            "trailing_pct": exit_trailing or None,
+            "breakeven_pct": exit_breakeven or None,
+            "time_stop_tf": exit_time_stop,
+            "ambiguity": exit_ambiguity,
+            "sl_first_prob": exit_sl_first_prob,
+        }
+
+    with st.expander("costi (commissioni, slippage, borrow)"):
+
+        costs_enabled = st.checkbox("Applica costi", value=False)
+        cost_commission = st.number_input("Commissione $/azione", value=COMMISSION_PER_SHARE, min_value=0.0, step=0.001, format="%.4f")
+        cost_min_ticket = st.number_input("Ticket minimo $", value=MIN_TICKET, min_value=0.0, step=0.5)
+        cost_slippage = st.number_input(
+            "Slippage % (per lato)",
+            value=SLIPPAGE_PCT,
+            min_value=0.0,
+            step=0.05,
+            help="Applicato al nozionale di ingresso e di uscita"
+        )
+        cost_borrow = st.number_input("Borrow fee %", value=BORROW_PCT, min_value=0.0, step=0.5)
+        cost_borrow_mode = st.radio(
+            "Borrow fee",
+            BORROW_MODES,
+            horizontal=True,
+            help="per trade: % fissa sul nozionale; annuo: tasso annuo addebitato per una giornata. Solo short"
         )
 
-# --- Filtro Open minimo e Gap% minimo ---
-filtered = filtered[
-    (filtered["Open"] >= min_open) &
-    (filtered["Open"] <= max_open)
-]
-filtered = filtered[filtered["Gap%"] >= min_gap]
+        costs = {
+            "commission_per_share": cost_commission,
+            "min_ticket": cost_min_ticket,
+            "slippage_pct": cost_slippage,
+            "borrow_pct": cost_borrow,
+            "borrow_mode": cost_borrow_mode,
+        }
 
-# Assicura che la colonna sia numerica
-filtered["Shs Float"] = pd.to_numeric(filtered["Shs Float"], errors="coerce")
-filtered["Shares Outstanding"] = pd.to_numeric(filtered["Shares Outstanding"], errors="coerce")
+    with st.expander("storico run"):
 
-# Sostituisci i valori null di Shs Float con Shares Outstanding
-filtered["Shs Float"].fillna(filtered["Shares Outstanding"], inplace=True)
+        store_runs = st.checkbox(
+            "Salva e riusa le run",
+            value=False,
+            help="Con parametri, filtri e dati identici i risultati vengono letti dallo storico"
+        )
+        run_label = st.text_input("Nome run (opzionale)", value="")
 
-# Adesso puoi filtrare senza errori
-filtered = filtered[
-    (filtered["Shs Float"] >= min_float) &
-    (filtered["Shs Float"] <= max_float)
-]
+    with st.expander("regole di ingresso"):
 
-filtered = filtered[
-    (filtered["Market Cap"] >= marketcap_min) &
-    (filtered["Market Cap"] <= marketcap_max)
-]
+        rules_text = st.text_area(
+            "Una regola per riga (tutte devono essere vere)",
+            value="",
+            placeholder="Open_vs_PMH_% < -10 and Vol5_vs_PM_% > 50\nGap% >= 80",
+            help="Condizioni 'colonna operatore numero' unite da and / or. "
+                 "Colonne utili: Open_vs_PMH_%, Vol5_vs_PM_%, Vol30_vs_PM_%, Vol60_vs_PM_%, "
+                 "Vol5_vs_Total_%, TimeHigh_sec, Gap%, Market Cap, Shs Float"
+        )
+        entry_rules = parse_rules(rules_text)
 
+    with st.expander("barre a 1 minuto"):
+
+        bars_available = store_available(MINUTE_BARS_DIR)
+        minute_res = st.checkbox(
+            "Simulazione al minuto",
+            value=False,
+            disabled=not bars_available,
+            help="Entry e SL/TP cercati minuto per minuto sulle barre importate (python minute_bars.py). "
+                 "Solo le giornate con barre; High/Low/Close_{tf}m ricalcolati dalle barre"
+        )
+        if not bars_available:
+            st.caption(f"Nessuno store in {MINUTE_BARS_DIR}/")
+
+    st.form_submit_button("Applica filtri", use_container_width=True)
+
+# ---- FILTRI (backtest.filter_universe, stessa logica della CLI) ----
+universe_filters = {
+    "date_range": list(date_range) if len(date_range) == 2 else [],
+    "tickers": selected_tickers,
+    "market_cap": [marketcap_min_M, marketcap_max_M],
+    "open": [min_open, max_open],
+    "min_gap": min_gap,
+    "float": [float_min_M, float_max_M],
+}
+filtered = filter_universe(df, universe_filters)
+
+# --- Feature pre-trade + regole di ingresso (maschera prima della simulazione) ---
+filtered = add_pretrade_features(filtered)
+filtered_base = filtered
+entry_rule_masks = np.empty((0, len(filtered)), dtype=bool)
+
+if entry_rules:
+    try:
+        entry_rule_masks = rule_masks(filtered, entry_rules)
+        filtered = filtered[entry_rule_masks.all(axis=0)]
+    except ValueError as e:
+        st.error(f"⚠️ Regole di ingresso ignorate: {e}")
+        entry_rules = []
+
+# --- Barre a 1 minuto: solo le giornate presenti nello store ---
+bar_store = None
+if minute_res:
+    bar_store = open_bar_store(MINUTE_BARS_DIR, os.path.getmtime(os.path.join(MINUTE_BARS_DIR, DAYS_FILE)))
+    n_sheet_rows = len(filtered)
+    filtered = attach_bars(bar_store, filtered)
+    st.caption(f"⏱️ Simulazione al minuto: {len(filtered)} giornate su {n_sheet_rows} hanno barre a 1 minuto")
 
-# --- Filtro Ticker (se selezionato) ---
-if selected_tickers:
-    filtered = filtered[filtered["Ticker"].isin(selected_tickers)]
 # ---- Dopo filtraggio ----
 if filtered.empty:
     st.warning("⚠️ Nessun dato disponibile dopo l'applicazione dei filtri.")
+    render_profiler_panel()
     st.stop()
 
 # ---- Dopo filtraggio ----
@@ -256,6 +441,7 @@ if selected_tickers:
 
 
 # endregion
+mark("filtri", rows_out=len(filtered))
 
 
 # Ordina il dataframe filtrato per Date discendente
@@ -266,224 +452,80 @@ if selected_tickers:
 # region CALCOLI ENTRY / SL / TP / ATTIVAZIONE 
 # ================================================
 
-filtered["SL_price"] = filtered["Open"] * (1 + param_sl/100)
-filtered["TP_price"] = filtered["Open"] * (1 + param_tp/100)
-filtered["Entry_price"] = filtered["Open"] * (1 + param_entry/100)
-
-filtered["attivazione"] = (filtered[f"High_{param_entry_tf}m"] >= filtered["Entry_price"]).astype(int)
-
-# ---- ENTRY BUCKET (minimo timeframe in cui l'entry viene raggiunta) ----
-def get_entry_bucket(row):
-    if row.get("High_1m", -np.inf) >= row["Entry_price"]:
-        return 1
-    elif row.get("High_5m", -np.inf) >= row["Entry_price"]:
-        return 5
-    elif row.get("High_15m", -np.inf) >= row["Entry_price"]:  # NUOVO
-        return 15
-    elif row.get("High_30m", -np.inf) >= row["Entry_price"]:
-        return 30
-    elif row.get("High_45m", -np.inf) >= row["Entry_price"]:  # NUOVO
-        return 45
-    elif row.get("High_60m", -np.inf) >= row["Entry_price"]:
-        return 60
-    elif row.get("High_90m", -np.inf) >= row["Entry_price"]:
-        return 90
-    elif row.get("High_120m", -np.inf) >= row["Entry_price"]:
-        return 120
-    elif row.get("High_240m", -np.inf) >= row["Entry_price"]:
-        return 240
-    else:
-        return None
-
-
-filtered["entry_bucket"] = filtered.apply(get_entry_bucket, axis=1)
-
-filtered["TP_90m%"] = np.nan
-filtered["TP"] = 0
-filtered["SL"] = 0
-filtered["Outcome"] = None
-
-if mode == "90 minuti":
-    timeframes_90m = [
-        (1, "High_1m", "Low_1m"),
-        (5, "High_5m", "Low_5m"),
-        (15, "High_15m", "Low_15m"),
-        (30, "High_30m", "Low_30m"),
-        (45, "High_45m", "Low_45m"),
-        (60, "High_60m", "Low_60m"),
-        (90, "High_90m", "Low_90m")
-    ]
-
-    for idx, row in filtered.iterrows():
-        if row["attivazione"] != 1 or row["entry_bucket"] is None:
-            continue
-
-        entry = row["Entry_price"]
-        sl_price = row["SL_price"]
-        tp_price = row["TP_price"]
-
-        for tf, high_col, low_col in timeframes_90m:
+# Matrici High/Low impilate (righe x bucket), riusate da simulazione e walk-forward
+def page_prices(frame):
+    # al minuto: un bucket per minuto (righe senza barre -> NaN, mai attivate)
+    if minute_res:
+        return build_minute_prices(frame, bar_store, mode)
+    return build_prices(frame, mode)
 
-            # ⛔ ignora bucket <= entry (no ordine temporale affidabile)
-            if tf <= row["entry_bucket"]:
-                continue
+prices = page_prices(filtered)
 
-            high = row.get(high_col, np.nan)
-            low = row.get(low_col, np.nan)
+# ---- ENTRY BUCKET + SL/TP (vettoriale, SL prioritario nello stesso bucket) ----
+def run_simulation(prices, exit_model=None, direction=None):
+    return simulate_config(prices, run_config, direction, exit_model)
 
-            # ❗ CASO PEGGIORATIVO: SL PRIORITARIO
-            if pd.notna(high) and high >= sl_price:
-                filtered.at[idx, "SL"] = 1
-                filtered.at[idx, "Outcome"] = "SL"
-                break
 
-            if pd.notna(low) and low <= tp_price:
-                filtered.at[idx, "TP"] = 1
-                filtered.at[idx, "Outcome"] = "TP"
-                break
-
-
-        # calcolo performance % in base a chi ha colpito
-        if filtered.at[idx, "TP"] == 1:
-            exit_price = tp_price
-        elif filtered.at[idx, "SL"] == 1:
-            exit_price = sl_price
-        else:
-            exit_price = row["Close_90m"]
-
-        filtered.at[idx, "TP_90m%"] = (exit_price - entry) / entry * 100
-
-else:
-    # modalità fino a chiusura: aggiungiamo anche 30 minuti al primo timeframe
-    timeframes = [
-        (1, "High_1m", "Low_1m"),
-        (5, "High_5m", "Low_5m"),
-        (15, "High_15m", "Low_15m"),
-        (30, "High_30m", "Low_30m"),
-        (45, "High_45m", "Low_45m"),
-        (60, "High_60m", "Low_60m"),
-        (90, "High_90m", "Low_90m"),
-        (120, "High_120m", "Low_120m"),
-        (240, "High_240m", "Low_240m"),
-        ("close", "High", "Low")
-    ]
-
-    for idx, row in filtered.iterrows():
-        if row["attivazione"] != 1 or row["entry_bucket"] is None:
-            continue
-
-        entry = row["Entry_price"]
-        sl_price = row["SL_price"]
-        tp_price = row["TP_price"]
-
-        for tf, high_col, low_col in timeframes:
-
-            if tf != "close" and tf <= row["entry_bucket"]:
-                continue
-
-            high = row.get(high_col, np.nan)
-            low = row.get(low_col, np.nan)
-
-            # ❗ CASO PEGGIORATIVO
-            if pd.notna(high) and high >= sl_price:
-                filtered.at[idx, "SL"] = 1
-                filtered.at[idx, "Outcome"] = "SL"
-                break
-
-            if pd.notna(low) and low <= tp_price:
-                filtered.at[idx, "TP"] = 1
-                filtered.at[idx, "Outcome"] = "TP"
-                break
-
-
-        # calcolo performance % in base a chi ha colpito
-        if filtered.at[idx, "TP"] == 1:
-            exit_price = tp_price
-        elif filtered.at[idx, "SL"] == 1:
-            exit_price = sl_price
-        else:
-            exit_price = row["Close"]
-
-        filtered.at[idx, "TP_90m%"] = (exit_price - entry) / entry * 100
-
-
-
-# Coerenza finale
-filtered.loc[filtered["SL"] == 1, "TP"] = 0
+# R per trade al netto dei costi della run (stesse formule di PnL_$): i confronti
+# tra lati e regole non devono ignorare il borrow, che pesa solo sugli short
+def net_r(sim):
+    return r_multiple(sim) - cost_r(sim, run_config["costs"], run_config["initial_capital"], run_config["risk_pct"])
 
 # ========================================
-# CALCOLO PNL PER TRADE (CENTRALIZZATO)
+# CALCOLO PNL PER TRADE (CENTRALIZZATO in backtest.trade_pnl)
 # ========================================
 
-def calculate_trade_pnl(df, initial_capital=10000, risk_pct=1):
-
-    df = df.copy()
-    df["PnL_$"] = 0.0
-    df["R_multiple"] = 0.0
-
-    for idx, row in df.iterrows():
-
-        if row["attivazione"] != 1:
-            continue
-
-        risk_amount = initial_capital * (risk_pct / 100)
-        stop_dist = abs(row["SL_price"] - row["Entry_price"])
-
-        if stop_dist == 0:
-            continue
-
-        size = risk_amount / stop_dist
-
-        if row["TP"] == 1:
-            pnl = (row["Entry_price"] - row["TP_price"]) * size
-        elif row["SL"] == 1:
-            pnl = (row["Entry_price"] - row["SL_price"]) * size
-        else:
-            val = row["TP_90m%"]
-            pnl = 0
-            if pd.notna(val):
-                pnl = (-val / 100) * row["Entry_price"] * size
-
-        df.at[idx, "PnL_$"] = pnl
-        df.at[idx, "R_multiple"] = pnl / risk_amount if risk_amount != 0 else 0
-
-    return df
-
-st.markdown("### ⚙️ Parametri Simulazione")
-
-col1, col2 = st.columns(2)
+# ---- CONFIG DELLA RUN (stesse chiavi di backtest.DEFAULT_CONFIG) ----
+run_config = {
+    "mode": mode,
+    "entry_tf": param_entry_tf,
+    "direction": param_direction,
+    "short": [param_entry, param_sl, param_tp],
+    "long": [param_entry_long, param_sl_long, param_tp_long],
+    "scale_in": scale_in_legs,
+    "exit_model": exit_model,
+    "rules": entry_rules,
+    "costs": costs if costs_enabled else None,
+    "initial_capital": initial_capital,
+    "risk_pct": risk_pct,
+    "resolution": RESOLUTION_MINUTE if minute_res else RESOLUTION_BUCKET,
+    "bars": MINUTE_BARS_DIR,
+    "filters": universe_filters,
+}
+
+# ---- RUN SALVATE: stessa configurazione + stessi dati -> stesso hash ----
+df_version = dataset_version(df)
+if minute_res:
+    df_version = f"{df_version}/{bar_store['version']}"
+current_run = run_hash(run_config, df_version)
+
+stored_run = load_results(current_run) if store_runs else None
+if results_match(stored_run, filtered):
+    filtered = filtered.assign(**{
+        col: stored_run[col].to_numpy() for col in stored_run.columns if col in RESULT_COLS
+    })
+    st.caption(f"📂 Risultati letti dallo storico (run {current_run})")
+else:
+    stored_run = None
 
-initial_capital = col1.number_input(
-    "💰 Capitale iniziale",
-    value=3000.0,
-    step=100.0
-)
+    # simulazione + PnL + costi (PnL_lordo_$ resta per i KPI)
+    filtered = trade_pnl(filtered, run_config, prices)
 
-risk_pct = col2.number_input(
-    "📉 % Rischio per trade",
-    value=2.0,
-    step=0.5
-)
-
-# CALCOLO PNL
-filtered = calculate_trade_pnl(
-    filtered,
-    initial_capital=initial_capital,
-    risk_pct=risk_pct
-)
+# Rendimento nel verso del trade: Side = +1 short, -1 long
+side_ret = filtered["TP_90m%"] * filtered["Side"]
 
 # Calcolo TP_90m
 mask_green = (
     (filtered["attivazione"] == 1) & 
     (filtered["SL"] == 0) & 
     (filtered["TP"] == 0) & 
-    (filtered["TP_90m%"] < 0)
+    (side_ret < 0)
 )
 mask_red = (
     (filtered["attivazione"] == 1) & 
     (filtered["SL"] == 0) & 
     (filtered["TP"] == 0) & 
-    (filtered["TP_90m%"] >= 0)
+    (side_ret >= 0)
 )
 tp_90m_green_avg = round(filtered.loc[mask_green, "TP_90m%"].mean(), 0)
 tp_90m_red_avg   = round(filtered.loc[mask_red, "TP_90m%"].mean(), 0)
@@ -493,6 +535,7 @@ tp_90m_red_avg   = "-" if np.isnan(tp_90m_red_avg) else int(tp_90m_red_avg)
 
 
 # endregion
+mark("simulazione", rows_out=len(filtered))
 
 # =====================================
 # region KPI BOX
@@ -502,16 +545,8 @@ total = len(filtered)
 attivazioni = filtered["attivazione"].sum()
 numero_SL = filtered["SL"].sum()
 numero_TP = filtered["TP"].sum()
-close_90m_red = ((filtered["attivazione"] == 1) & 
-             (filtered["SL"] == 0) & 
-             (filtered["TP"] == 0) & 
-             (filtered["TP_90m%"] >= 0)
-            ).sum()
-close_90m_green = ((filtered["attivazione"] == 1) & 
-             (filtered["SL"] == 0) & 
-             (filtered["TP"] == 0) & 
-             (filtered["TP_90m%"] < 0)
-            ).sum()
+close_90m_red = mask_red.sum()
+close_90m_green = mask_green.sum()
 
 # Solo trade attivati
 trades = filtered[filtered["attivazione"] == 1]
@@ -528,7 +563,24 @@ lossrate = 1 - winrate
 RR_real = avg_win / avg_loss if avg_loss > 0 else 0
 expectancy = (winrate * avg_win) - (lossrate * avg_loss)
 
+# Intervalli di confidenza bootstrap (winrate %, expectancy $)
+# in cache: la serie dei PnL identifica i filtri applicati
+@st.cache_data(show_spinner=False, max_entries=64)
+def cached_trade_ci(pnl, n_boot=N_BOOT, ci=CI_LEVEL):
+    return bootstrap_trade_kpis(pnl, n_boot=n_boot, ci=ci)
+
+
+trade_ci = cached_trade_ci(trades["PnL_$"].to_numpy())
+winrate_ci = trade_ci["winrate"]
+expectancy_ci = trade_ci["expectancy"]
+
 profit = trades["PnL_$"].sum()
+
+# Lordo vs netto: somme di colonne già calcolate in apply_costs
+if costs_enabled:
+    profit_gross = trades["PnL_lordo_$"].sum()
+    cost_totals = trades[["Commissioni_$", "Slippage_$", "Borrow_$", "Costi_$"]].sum()
+
 trade_count = len(trades)
 
 # Equity cumulata
@@ -546,6 +598,17 @@ max_drawdown = drawdown.min()
 drawdown_pct = (equity - running_max) / running_max * 100
 max_drawdown_pct = drawdown_pct.min()
 
+# ---- SALVATAGGIO RUN (solo se calcolata ora) ----
+if store_runs and stored_run is None:
+    save_run(
+        current_run,
+        run_config,
+        df_version,
+        filtered,
+        trade_metrics(trades, initial_capital),
+        label=run_label,
+    )
+
 st.markdown(
     """
     <style>
@@ -574,6 +637,7 @@ st.markdown("---------------------")
 # Stile del titolo e del valore
 title_style = "font-size:18px; opacity:0.8;"
 value_style = "font-size:30px; font-weight:bold;"
+ci_style = "font-size:12px; opacity:0.6;"
 profit_color = "#00FF00" if profit >= 0 else "#FF6347"
 
 st.markdown(f"""
@@ -590,6 +654,7 @@ st.markdown(f"""
     <div style="{base_box_style}">
         <div style="{title_style}">Winrate</div>
         <div style="{value_style}">{winrate*100:.1f}%</div>
+        <div style="{ci_style}">IC {winrate_ci[0]:.1f}% – {winrate_ci[1]:.1f}%</div>
     </div>
     <div style="{base_box_style}">
         <div style="{title_style}">RR Real</div>
@@ -598,6 +663,7 @@ st.markdown(f"""
     <div style="{base_box_style}">
         <div style="{title_style}">Expectancy</div>
         <div style="{value_style}">{expectancy:.2f}$</div>
+        <div style="{ci_style}">IC {expectancy_ci[0]:.2f}$ – {expectancy_ci[1]:.2f}$</div>
     </div>
     <div style="{base_box_style} color:#EE4419;">
         <div style="{title_style}">Max Drawdown</div>
@@ -635,25 +701,156 @@ st.markdown(f"""
 </div>
 """, unsafe_allow_html=True)
 
+# ---- LORDO vs NETTO ----
+if costs_enabled:
+    st.markdown(f"""
+<div style="display:flex; gap:15px; margin-bottom:20px;">
+    <div style="{base_box_style}">
+        <div style="{title_style}">Profit lordo</div>
+        <div style="{value_style}">{profit_gross:.2f}$</div>
+    </div>
+    <div style="{base_box_style} color:#EE4419;">
+        <div style="{title_style}">Commissioni</div>
+        <div style="{value_style}">{cost_totals['Commissioni_$']:.2f}$</div>
+    </div>
+    <div style="{base_box_style} color:#EE4419;">
+        <div style="{title_style}">Slippage</div>
+        <div style="{value_style}">{cost_totals['Slippage_$']:.2f}$</div>
+    </div>
+    <div style="{base_box_style} color:#EE4419;">
+        <div style="{title_style}">Borrow fee</div>
+        <div style="{value_style}">{cost_totals['Borrow_$']:.2f}$</div>
+    </div>
+    <div style="{base_box_style}">
+        <div style="{title_style}">Profit netto</div>
+        <div style="{value_style}; color:{profit_color};">{profit:.2f}$</div>
+    </div>
+</div>
+""", unsafe_allow_html=True)
+
+# ---- SHORT vs LONG AFFIANCATI (stesse matrici prezzi) ----
+if direction_label == "Entrambi":
+    side_sims = [run_simulation(prices, direction=d) for d in (SHORT, LONG)]
+    side_stats = scenario_stats(
+        np.vstack([net_r(sim) for sim in side_sims]),
+        np.vstack([sim["attivazione"] == 1 for sim in side_sims]),
+        ["Short", "Long"],
+        initial_capital * (risk_pct / 100),
+    )
+    for sim, label in zip(side_sims, ["Short", "Long"]):
+        side_stats.loc[side_stats["Scenario"] == label, "Numero SL"] = sim["SL"].sum()
+        side_stats.loc[side_stats["Scenario"] == label, "Numero TP"] = sim["TP"].sum()
+
+    st.markdown("#### ↕️ Short vs Long")
+    if costs_enabled:
+        st.caption("R e profit al netto dei costi (borrow solo sugli short)")
+    st.dataframe(side_stats.set_index("Scenario").T.round(2), use_container_width=True)
+
+# ---- TRADE AMBIGUI (SL e TP nello stesso bucket) ----
+n_ambiguous = int(filtered["Ambiguo"].sum())
+if n_ambiguous:
+    # stesso calcolo del box Profit (trade_pnl: PnL e costi) per ogni modello
+    ambiguity_rows = []
+    for model in AMBIGUITY_MODELS:
+        model_trades = trade_pnl(filtered, {**run_config, "exit_model": {**exit_model, "ambiguity": model}}, prices)
+        model_trades = model_trades[model_trades["attivazione"] == 1]
+        ambiguity_rows.append({
+            "Modello": ambiguity_labels[model],
+            "Trade": len(model_trades),
+            "Numero SL": int(model_trades["SL"].sum()),
+            "Numero TP": int(model_trades["TP"].sum()),
+            "Winrate %": (model_trades["PnL_$"] > 0).mean() * 100 if len(model_trades) else np.nan,
+            "Profit $": model_trades["PnL_$"].sum(),
+        })
+    ambiguity_stats = pd.DataFrame(ambiguity_rows)
+    profit_range = ambiguity_stats["Profit $"]
+    st.markdown(
+        f"⚠️ **{n_ambiguous}** trade con SL e TP nello stesso bucket: "
+        f"profit{' netto' if costs_enabled else ''} tra **{profit_range.min():.2f}$** e "
+        f"**{profit_range.max():.2f}$** a seconda del modello."
+    )
+    with st.expander("Dettaglio modelli di ambiguità"):
+        st.dataframe(ambiguity_stats.round(2), use_container_width=True, hide_index=True)
+
 
 # endregion
+mark("kpi box")
 
 
 #====================================================
-# region NUOVI KPI PER STOP O PROFIT
+# region CONFRONTO REGOLE
 #====================================================
 
-df_all = filtered.copy()
+if entry_rules:
+    st.markdown("### 🧩 Confronto regole di ingresso")
+    if costs_enabled:
+        st.caption("R e profit al netto dei costi")
+
+    # simulazione unica sull'universo senza regole, poi maschere per scenario
+    base_sim = run_simulation(page_prices(filtered_base))
+    rules_stats = rule_comparison(
+        net_r(base_sim),
+        base_sim["attivazione"] == 1,
+        entry_rule_masks,
+        entry_rules,
+        initial_capital * (risk_pct / 100),
+    )
+    st.dataframe(rules_stats.round(2), use_container_width=True)
 
+# endregion
+mark("confronto regole")
+
+
+#====================================================
+# region SWEEP MODELLI DI USCITA
+#====================================================
+
+# sezioni pesanti come fragment: i loro controlli rieseguono solo la sezione
+@st.fragment
+def render_exit_sweep(prices, exit_model, initial_capital, risk_pct):
+    with st.expander("🚪 Confronto modelli di uscita"):
+
+        col_s1, col_s2 = st.columns(2)
+        sweep_label = col_s1.selectbox("Parametro da variare", list(EXIT_PARAMS))
+        sweep_param = EXIT_PARAMS[sweep_label]
+
+        if sweep_param == "time_stop_tf":
+            sweep_values = col_s2.multiselect(
+                "Valori", time_stop_options, default=time_stop_options
+            )
+        elif sweep_param == "ambiguity":
+            sweep_values = col_s2.multiselect(
+                "Valori", AMBIGUITY_MODELS, default=AMBIGUITY_MODELS, format_func=ambiguity_labels.get
+            )
+        else:
+            sweep_range = col_s2.slider("Intervallo %", 0.0, 100.0, (5.0, 30.0), step=1.0)
+            sweep_step = col_s2.number_input("Passo %", value=5.0, min_value=0.5, step=0.5)
+            sweep_values = list(np.arange(sweep_range[0], sweep_range[1] + 1e-9, sweep_step))
+
+        if sweep_values:
+            # stesse matrici prezzi, gli altri parametri di uscita restano quelli della sidebar
+            sweep_stats = sweep_exit_models(
+                lambda model: run_simulation(prices, model),
+                exit_model,
+                sweep_param,
+                sweep_values,
+                initial_capital * (risk_pct / 100),
+            )
+            st.dataframe(sweep_stats.round(2), use_container_width=True)
+
+
+render_exit_sweep(prices, exit_model, initial_capital, risk_pct)
+
+# endregion
+mark("sweep uscite")
 
-if "TimeHigh" in df_all.columns:
-    df_all["TimeHigh"] = pd.to_datetime(df_all["TimeHigh"], errors="coerce")
-    df_all["TimeHigh_sec"] = df_all["TimeHigh"].apply(
-        lambda x: x.hour*3600 + x.minute*60 if pd.notnull(x) else None
-    )
 
-if all(col in df_all.columns for col in ["Open", "HighPM"]):
-    df_all["Open_vs_PMH_%"] = ((df_all["Open"] - df_all["HighPM"]) / df_all["HighPM"]) * 100
+#====================================================
+# region NUOVI KPI PER STOP O PROFIT
+#====================================================
+
+# TimeHigh_sec, Open_vs_PMH_% e VolX_vs_* già calcolati da add_pretrade_features
+df_all = filtered.copy()
 
 # funzione conversione orari
 def seconds_to_hhmm(seconds):
@@ -662,12 +859,6 @@ def seconds_to_hhmm(seconds):
     seconds = int(seconds)
     return f"{seconds//3600:02d}:{(seconds%3600)//60:02d}"
 
-df_all["Vol5_vs_PM_%"] = (df_all["Volume_5m"] / df_all["VolumePM"].replace(0, np.nan)) * 100
-df_all["Vol30_vs_PM_%"] = (df_all["Volume_30m"] / df_all["VolumePM"].replace(0, np.nan)) * 100
-df_all["Vol60_vs_PM_%"] = (df_all["Volume_60m"] / df_all["VolumePM"].replace(0, np.nan)) * 100
-df_all["Vol5_vs_Total_%"] = (df_all["Volume_5m"] / df_all["Volume"].replace(0, np.nan)) * 100
-df_all["Vol30_vs_Total_%"] = (df_all["Volume_30m"] / df_all["Volume"].replace(0, np.nan)) * 100
-
 df_red = df_all[df_all["PnL_$"] < 0].copy()
 df_green = df_all[df_all["PnL_$"] > 0].copy()
 
@@ -815,6 +1006,7 @@ with st.expander("Dettaglio Volume (clicca per espandere)"):
 
 
 # endregion
+mark("kpi stop/profit")
 
 #===========================
 # region TABELLA 
@@ -824,6 +1016,13 @@ with st.expander("Dettaglio Volume (clicca per espandere)"):
 cols_to_show = ["Date", "Ticker", "Gap%", "High_60m", "Low_60m",
                 "High_90m", "Low_90m", "Close_90m", "Entry_price", "SL_price", "TP_price",
                 "TP_90m%", "attivazione", "SL", "TP"]
+if len(scale_in_legs) > 1:
+    cols_to_show.append("Fill_frac")
+if exit_trailing or exit_breakeven or exit_time_stop:
+    cols_to_show.append("Exit_reason")
+cols_to_show.append("Ambiguo")
+if n_envelope_fix:
+    cols_to_show.append("Envelope_fix")
 
 
 # Funzione per righe alternate
@@ -838,6 +1037,8 @@ def highlight_cells(val, col_name):
         return "background-color: #8B2A06; color:white; font-weight:bold;"
     elif col_name == "TP" and val == 1:
         return "background-color: #024902; color:white; font-weight:bold;"
+    elif col_name == "Ambiguo" and val == 1:
+        return "background-color: #5A3A7A; color:white; font-weight:bold;"
 
     else:
         return ""
@@ -845,9 +1046,11 @@ def highlight_cells(val, col_name):
 # Definizione formato numeri
 format_dict = {}
 for col in cols_to_show:
-    if col == "Gap%":
+    if col == "Date":
+        format_dict[col] = lambda d: d.strftime("%d-%m-%Y") if pd.notna(d) else ""
+    elif col == "Gap%":
         format_dict[col] = "{:.0f}"
-    elif col in ["attivazione", "SL", "TP"]:
+    elif col in ["attivazione", "SL", "TP", "Ambiguo", "Envelope_fix"]:
         format_dict[col] = "{:.0f}"
     elif filtered[col].dtype in ['float64', 'int64']:
         format_dict[col] = "{:.2f}"
@@ -865,6 +1068,7 @@ st.dataframe(styled_df, use_container_width=True)
 st.caption(f"Mostrando {len(filtered)} record filtrati su {len(df)} totali.")
 
 # endregion
+mark("tabella")
 
 # =======================================
 # region EQUITY & DRAWDOWN SIMULATION 
@@ -880,38 +1084,16 @@ df_equity = filtered.copy()
 df_equity = df_equity[df_equity["attivazione"] == 1].copy()
 
 # Evitiamo errori su colonne mancanti
-for col in ["TP", "SL", "TP_90m%", "Entry_price", "SL_price", "TP_price"]:
+for col in ["TP", "SL", "TP_90m%", "Entry_price", "SL_price", "TP_price", "Fill_frac"]:
     if col not in df_equity.columns:
         st.warning(f"Manca la colonna '{col}' nel dataframe.")
         st.stop()
 
 # endregion
+mark("equity df", rows_out=len(df_equity))
 
 # region EQUITY
 
-capital = initial_capital
-equity_values = []
-drawdowns = []
-
-for pnl in df_equity["PnL_$"]:
-    capital += pnl
-    equity_values.append(capital)
-    peak = max(equity_values)
-    drawdown = (capital - peak) / peak * 100
-    drawdowns.append(drawdown)
-
-# Calcolo Size (dimensione del trade)
-df_equity["Size"] = df_equity.apply(
-    lambda row: (initial_capital * (risk_pct/100)) / abs(row["SL_price"] - row["Entry_price"])
-                if row["SL_price"] != row["Entry_price"] else 0,
-    axis=1
-)
-
-# Assembla dataframe finale con Equity e Drawdown
-df_equity["Equity"] = equity_values
-df_equity["Drawdown_%"] = drawdowns
-
-
 # ---- STILE BASE KPI ----
 def kpi_box(title, value, color="#FFD700"):
     return f"""
@@ -932,77 +1114,401 @@ def kpi_box(title, value, color="#FFD700"):
     """
 
 
+@st.fragment
+def render_equity(df_equity, initial_capital, risk_pct):
+    # equity e drawdown vettoriali: PnL cumulato e picco progressivo
+    equity = initial_capital + df_equity["PnL_$"].cumsum()
+    peak = equity.cummax()
 
+    # Size in azioni come nel PnL e nei costi: rischio / distanza stop dal prezzo
+    # medio di ingresso, per la frazione eseguita (scale-in)
+    size = trade_shares(
+        df_equity["Entry_price"], df_equity["SL_price"], df_equity["Fill_frac"], initial_capital * risk_pct / 100
+    )
 
-# ---- CALCOLO COLONNA ESITO ----
-def get_result_icon(row):
-    if row["TP"] == 1:
-        return "🟢"
-    elif row["SL"] == 1:
-        return "🔴"
-    else:
-        return "🟠"
-
-df_equity["Esito"] = df_equity.apply(get_result_icon, axis=1)
-
-# ---- TABELLA RIASSUNTIVA ----
-df_display = df_equity[["Date", "Ticker", "Esito", "Size", "TP_90m%", "PnL_$", "Equity", "Drawdown_%"]].copy()
-df_display["PnL_$"] = df_display["PnL_$"].round(2)
-df_display["Equity"] = df_display["Equity"].round(2)
-df_display["Drawdown_%"] = df_display["Drawdown_%"].round(2)
-df_display["Size"] = df_display["Size"].round(0)
-
-st.dataframe(df_display, use_container_width=True)
-
-# ---- GRAFICO EQUITY ----
-fig1, ax1 = plt.subplots(figsize=(10, 2))  # più compatto
-ax1.plot(
-    range(len(df_display)),
-    df_display["Equity"],
-    linewidth=1,
-    color="royalblue",
-)
+    # ---- TABELLA RIASSUNTIVA ----
+    df_display = pd.DataFrame({
+        "Date": df_equity["Date"].dt.strftime("%d-%m-%Y"),
+        "Ticker": df_equity["Ticker"],
+        "Esito": np.select([df_equity["TP"] == 1, df_equity["SL"] == 1], ["🟢", "🔴"], "🟠"),
+        "Size": np.round(size, 0),
+        "TP_90m%": df_equity["TP_90m%"],
+        "PnL_$": df_equity["PnL_$"].round(2),
+        "Equity": equity.round(2),
+        "Drawdown_%": ((equity - peak) / peak * 100).round(2),
+    })
+
+    st.dataframe(df_display, use_container_width=True)
+
+    # ---- GRAFICO EQUITY ----
+    fig1, ax1 = plt.subplots(figsize=(10, 2))  # più compatto
+    ax1.plot(
+        range(len(df_display)),
+        df_display["Equity"],
+        linewidth=1,
+        color="royalblue",
+    )
 
-# Cambia il colore di fondo dell’intera figura
-fig1.patch.set_facecolor('#D5D9DF')  # ad esempio un blu-scuro
-
-# Cambia il colore di fondo dell’area degli assi (grafico)
-ax1.set_facecolor('#D5D9DF')  # ancora più scuro
-
-ax1.axhline(initial_capital, color="gray", linestyle="--", linewidth=1)  # linea capitale iniziale
-ax1.set_title("Equity Line", fontsize=9)
-ax1.set_xlabel("Trade", fontsize=8)
-ax1.set_ylabel("Capitale ($)", fontsize=8)
-ax1.tick_params(axis='both', which='major', labelsize=7)  # riduce la dimensione delle etichette assi
-ax1.set_xticks(range(0, len(df_display), max(1, len(df_display)//10)))
-plt.tight_layout()
-st.pyplot(fig1)
-
-# ---- GRAFICO DRAWDOWN ----
-fig2, ax2 = plt.subplots(figsize=(10, 2))  # più compatto
-
-# Grafico a barre invece che linea
-ax2.bar(
-    range(len(df_display)),
-    df_display["Drawdown_%"],
-    color="#DE9D9D",
-    width=0.8,
-)
+    # Cambia il colore di fondo dell’intera figura
+    fig1.patch.set_facecolor('#D5D9DF')  # ad esempio un blu-scuro
+
+    # Cambia il colore di fondo dell’area degli assi (grafico)
+    ax1.set_facecolor('#D5D9DF')  # ancora più scuro
+
+    ax1.axhline(initial_capital, color="gray", linestyle="--", linewidth=1)  # linea capitale iniziale
+    ax1.set_title("Equity Line", fontsize=9)
+    ax1.set_xlabel("Trade", fontsize=8)
+    ax1.set_ylabel("Capitale ($)", fontsize=8)
+    ax1.tick_params(axis='both', which='major', labelsize=7)  # riduce la dimensione delle etichette assi
+    ax1.set_xticks(range(0, len(df_display), max(1, len(df_display)//10)))
+    plt.tight_layout()
+    st.pyplot(fig1)
+
+    # ---- GRAFICO DRAWDOWN ----
+    fig2, ax2 = plt.subplots(figsize=(10, 2))  # più compatto
+
+    # Grafico a barre invece che linea
+    ax2.bar(
+        range(len(df_display)),
+        df_display["Drawdown_%"],
+        color="#DE9D9D",
+        width=0.8,
+    )
+
+    # Cambia il colore di fondo dell’intera figura
+    fig2.patch.set_facecolor('#D5D9DF')
+
+    # Cambia il colore di fondo dell’area degli assi (grafico)
+    ax2.set_facecolor('#D5D9DF')
+
+    ax2.set_title("Drawdown (%)", fontsize=9)
+    ax2.set_xlabel("Trade", fontsize=8)
+    ax2.set_ylabel("Drawdown (%)", fontsize=8)
+    ax2.axhline(0, color="gray", linestyle="--", linewidth=0.8)
+    ax2.tick_params(axis='both', which='major', labelsize=7)
+    ax2.set_xticks(range(0, len(df_display), max(1, len(df_display)//10)))
+
+    plt.tight_layout()
+    st.pyplot(fig2)
+
+
+render_equity(df_equity, initial_capital, risk_pct)
+
+# endregion
+mark("equity")
+
+
+# =======================================
+# region MONTE CARLO
+# =======================================
+
+@st.fragment
+def render_monte_carlo(df_equity, initial_capital):
+    st.markdown("### 🎲 Simulazione Monte Carlo")
+
+    mc_enabled = st.checkbox(
+        "Attiva modalità Monte Carlo",
+        value=False,
+        help="Rimescola o ricampiona la sequenza dei trade migliaia di volte"
+    )
+
+    if mc_enabled and len(df_equity) > 0:
+
+        col_mc1, col_mc2, col_mc3, col_mc4 = st.columns(4)
+
+        mc_series = col_mc1.selectbox("Serie", ["PnL_$", "R_multiple"])
+        mc_method = col_mc2.radio(
+            "Metodo",
+            ["Rimescola ordine", "Ricampiona (bootstrap)"],
+            help="Rimescolando, l'equity finale è sempre la stessa: cambia solo il percorso (drawdown)"
+        )
+        mc_n_sims = col_mc3.number_input("Numero simulazioni", value=10000, min_value=100, max_value=100000, step=1000)
+        mc_ruin = col_mc4.number_input(
+            "Soglia rovina (% capitale / R)",
+            value=50.0,
+            min_value=1.0,
+            step=5.0,
+            help="PnL_$: perdita in % del capitale iniziale. R_multiple: perdita in R"
+        )
+
+        if mc_series == "PnL_$":
+            mc_start = initial_capital
+            mc_ruin_level = initial_capital * (1 - mc_ruin / 100)
+            mc_unit = "$"
+        else:
+            mc_start = 0.0
+            mc_ruin_level = -mc_ruin
+            mc_unit = "R"
+
+        mc = simulate_trade_sequences(
+            df_equity[mc_series].to_numpy(),
+            n_sims=int(mc_n_sims),
+            method="shuffle" if mc_method == "Rimescola ordine" else "bootstrap",
+            start=mc_start,
+            ruin_level=mc_ruin_level,
+        )
+
+        col_k1, col_k2, col_k3, col_k4 = st.columns(4)
+        col_k1.markdown(kpi_box("Prob. rovina", f"{mc['prob_ruin']:.1f}%", "#EE4419"), unsafe_allow_html=True)
+        col_k2.markdown(kpi_box("Max DD mediano", f"{mc['max_dd_pctl'][50]:.0f}{mc_unit}", "#EE4419"), unsafe_allow_html=True)
+        col_k3.markdown(kpi_box("Max DD 5° pct", f"{mc['max_dd_pctl'][5]:.0f}{mc_unit}", "#EE4419"), unsafe_allow_html=True)
+        col_k4.markdown(kpi_box("Equity finale mediana", f"{mc['final_pct'][50]:.0f}{mc_unit}"), unsafe_allow_html=True)
+
+        st.dataframe(
+            {
+                "Percentile": [f"{p}°" for p in PERCENTILES],
+                f"Equity finale ({mc_unit})": [round(mc["final_pct"][p], 2) for p in PERCENTILES],
+                f"Max drawdown ({mc_unit})": [round(mc["max_dd_pctl"][p], 2) for p in PERCENTILES],
+            },
+            use_container_width=True
+        )
+
+        # ---- PATH DI ESEMPIO ----
+        fig3, ax3 = plt.subplots(figsize=(10, 2))
+        for path in mc["sample_paths"]:
+            ax3.plot(range(len(path)), path, linewidth=0.5, color="royalblue", alpha=0.15)
+        ax3.axhline(mc_start, color="gray", linestyle="--", linewidth=1)
+        ax3.axhline(mc_ruin_level, color="#EE4419", linestyle=":", linewidth=1)
+        fig3.patch.set_facecolor('#D5D9DF')
+        ax3.set_facecolor('#D5D9DF')
+        ax3.set_title(f"Path simulati (primi {len(mc['sample_paths'])})", fontsize=9)
+        ax3.set_xlabel("Trade", fontsize=8)
+        ax3.set_ylabel(f"Equity ({mc_unit})", fontsize=8)
+        ax3.tick_params(axis='both', which='major', labelsize=7)
+        plt.tight_layout()
+        st.pyplot(fig3)
+
+        # ---- DISTRIBUZIONI ----
+        fig4, (ax4, ax5) = plt.subplots(1, 2, figsize=(10, 2))
+        ax4.hist(mc["final"], bins=50, color="royalblue")
+        ax4.set_title("Equity finale", fontsize=9)
+        ax5.hist(mc["max_dd"], bins=50, color="#DE9D9D")
+        ax5.set_title("Max drawdown", fontsize=9)
+        for ax in (ax4, ax5):
+            ax.set_facecolor('#D5D9DF')
+            ax.tick_params(axis='both', which='major', labelsize=7)
+        fig4.patch.set_facecolor('#D5D9DF')
+        plt.tight_layout()
+        st.pyplot(fig4)
+
+    elif mc_enabled:
+        st.info("Nessun trade attivato da simulare.")
+
+
+render_monte_carlo(df_equity, initial_capital)
+
+# endregion
+mark("monte carlo")
+
+
+# =======================================
+# region PORTAFOGLIO
+# =======================================
+
+@st.fragment
+def render_portfolio(df_equity, initial_capital, risk_pct):
+    st.markdown("### 🗂️ Portafoglio (posizioni contemporanee per giornata)")
+
+    pf_enabled = st.checkbox(
+        "Attiva simulazione portafoglio",
+        value=False,
+        help="Raggruppa i trade per giornata con limite di posizioni ed esposizione"
+    )
 
-# Cambia il colore di fondo dell’intera figura
-fig2.patch.set_facecolor('#D5D9DF')
+    if pf_enabled and len(df_equity) > 0:
 
-# Cambia il colore di fondo dell’area degli assi (grafico)
-ax2.set_facecolor('#D5D9DF')
+        col_p1, col_p2, col_p3, col_p4 = st.columns(4)
+        pf_max_positions = col_p1.number_input("Posizioni max per giorno", value=MAX_POSITIONS, min_value=1, step=1)
+        pf_max_exposure = col_p2.number_input(
+            "Esposizione max (% capitale)",
+            value=MAX_EXPOSURE_PCT,
+            min_value=1.0,
+            step=10.0,
+            help="Somma dei nozionali (size x entry) dei trade della giornata"
+        )
+        pf_allocation = col_p3.radio(
+            "Allocazione",
+            ALLOCATIONS,
+            help="ordine: prima chi entra prima finché c'è esposizione; pro-quota: tutti ridotti in proporzione"
+        )
+        pf_compound = col_p4.checkbox("Capitale composto", value=False)
+
+        pf_trades, pf_daily = simulate_portfolio(
+            df_equity["Date_dt"].to_numpy(),
+            df_equity["R_multiple"].to_numpy(),
+            trade_exposure_pct(
+                df_equity["Entry_price"].to_numpy(),
+                df_equity["SL_price"].to_numpy(),
+                risk_pct,
+                df_equity["Fill_frac"].to_numpy(dtype=float),
+            ),
+            priority=df_equity["entry_bucket"].to_numpy(dtype=float),
+            initial_capital=initial_capital,
+            risk_pct=risk_pct,
+            max_positions=int(pf_max_positions),
+            max_exposure_pct=pf_max_exposure,
+            allocation=pf_allocation,
+            compound=pf_compound,
+        )
+
+        pf_profit = pf_daily["Equity"].iloc[-1] - initial_capital
+        pf_taken = int((pf_trades["Peso"] > 0).sum())
+
+        col_k1, col_k2, col_k3, col_k4 = st.columns(4)
+        col_k1.markdown(kpi_box("Giornate", len(pf_daily)), unsafe_allow_html=True)
+        col_k2.markdown(kpi_box("Trade eseguiti", f"{pf_taken} / {len(pf_trades)}"), unsafe_allow_html=True)
+        col_k3.markdown(kpi_box("Max DD portafoglio", f"{pf_daily['Drawdown_%'].min():.1f}%", "#EE4419"), unsafe_allow_html=True)
+        col_k4.markdown(kpi_box("Profit portafoglio", f"{pf_profit:.2f}$"), unsafe_allow_html=True)
+
+        # ---- EQUITY GIORNALIERA ----
+        fig_pf, ax_pf = plt.subplots(figsize=(10, 2))
+        ax_pf.plot(pf_daily["Date"], pf_daily["Equity"], linewidth=1, color="royalblue")
+        ax_pf.axhline(initial_capital, color="gray", linestyle="--", linewidth=1)
+        fig_pf.patch.set_facecolor('#D5D9DF')
+        ax_pf.set_facecolor('#D5D9DF')
+        ax_pf.set_title("Equity portafoglio (per giornata)", fontsize=9)
+        ax_pf.set_ylabel("Capitale ($)", fontsize=8)
+        ax_pf.tick_params(axis='both', which='major', labelsize=7)
+        plt.tight_layout()
+        st.pyplot(fig_pf)
+
+        with st.expander("Dettaglio giornate"):
+            st.dataframe(pf_daily.round(2), use_container_width=True)
 
-ax2.set_title("Drawdown (%)", fontsize=9)
-ax2.set_xlabel("Trade", fontsize=8)
-ax2.set_ylabel("Drawdown (%)", fontsize=8)
-ax2.axhline(0, color="gray", linestyle="--", linewidth=0.8)
-ax2.tick_params(axis='both', which='major', labelsize=7)
-ax2.set_xticks(range(0, len(df_display), max(1, len(df_display)//10)))
 
-plt.tight_layout()
-st.pyplot(fig2)
+render_portfolio(df_equity, initial_capital, risk_pct)
+
+# endregion
+mark("portafoglio")
+
+
+# =======================================
+# region WALK-FORWARD
+# =======================================
+
+# processi per la griglia: pochi, il server Streamlit gira già su thread
+WF_MAX_WORKERS = min(4, os.cpu_count() or 1)
+
+
+# _prices non entra nella chiave della cache (hash costoso): prices_key = hash della run
+@st.cache_data(show_spinner="Walk-forward in corso...")
+def run_walk_forward(_prices, prices_key, dates, grid, entry_tf, train_days, test_days, objective, min_trades,
+                     exit_model, direction, workers, costs, initial_capital, risk_pct):
+    return walk_forward(_prices, dates, grid, entry_tf, train_days, test_days,
+                        objective=objective, min_trades=min_trades,
+                        exit_model=exit_model, direction=direction, workers=workers,
+                        costs=costs, initial_capital=initial_capital, risk_pct=risk_pct)
+
+
+# range della griglia per lato: (min, max, default) di %entry, %SL, %TP
+WF_RANGES = {
+    SHORT: {"entry": (0.0, 100.0, (5.0, 30.0)), "sl": (0.0, 200.0, (20.0, 50.0)), "tp": (-100.0, 0.0, (-30.0, -10.0))},
+    LONG: {"entry": (0.0, 100.0, (5.0, 20.0)), "sl": (-100.0, 0.0, (-15.0, -5.0)), "tp": (0.0, 200.0, (10.0, 40.0))},
+}
+
+
+@st.fragment
+def render_walk_forward(prices, prices_key, filtered, param_entry_tf, initial_capital, risk_pct, exit_model, direction,
+                        costs):
+    st.markdown("### 🔁 Walk-forward (out-of-sample)")
+
+    wf_enabled = st.checkbox(
+        "Attiva walk-forward",
+        value=False,
+        help="Ottimizza %entry/%SL/%TP su una finestra di train e li applica alla finestra di test successiva"
+    )
+
+
+    if wf_enabled:
+
+        with st.expander("Griglia parametri e finestre", expanded=True):
+            st.caption(f"Lato {direction}, stesso modello di uscita della simulazione (trailing, break-even, time stop, ambiguità)")
+            ranges = WF_RANGES[direction]
+            col_g1, col_g2, col_g3 = st.columns(3)
+            # key per lato: cambiando direzione gli slider ripartono dai default del lato
+            wf_entry = col_g1.slider("%entry (min, max)", *ranges["entry"], step=5.0, key=f"wf_entry_{direction}")
+            wf_entry_step = col_g1.number_input("passo %entry", value=5.0, min_value=0.5, step=0.5)
+            wf_sl = col_g2.slider("%SL (min, max)", *ranges["sl"], step=5.0, key=f"wf_sl_{direction}")
+            wf_sl_step = col_g2.number_input("passo %SL", value=10.0, min_value=0.5, step=0.5)
+            wf_tp = col_g3.slider("%TP (min, max)", *ranges["tp"], step=5.0, key=f"wf_tp_{direction}")
+            wf_tp_step = col_g3.number_input("passo %TP", value=5.0, min_value=0.5, step=0.5)
+
+            col_w1, col_w2, col_w3, col_w4, col_w5 = st.columns(5)
+            wf_train = col_w1.number_input("Giornate train", value=120, min_value=5, step=10)
+            wf_test = col_w2.number_input("Giornate test", value=30, min_value=1, step=5)
+            wf_objective = col_w3.selectbox("Obiettivo", list(OBJECTIVES))
+            wf_min_trades = col_w4.number_input("Trade minimi in train", value=5, min_value=1, step=1)
+            wf_workers = col_w5.number_input(
+                "Processi",
+                value=1,
+                min_value=1,
+                max_value=WF_MAX_WORKERS,
+                step=1,
+                help="1 = nel processo del server. Ogni processo in più riceve una copia delle matrici prezzi"
+            )
+
+        wf_grid = param_grid(
+            np.arange(wf_entry[0], wf_entry[1] + 1e-9, wf_entry_step),
+            np.arange(wf_sl[0], wf_sl[1] + 1e-9, wf_sl_step),
+            np.arange(wf_tp[0], wf_tp[1] + 1e-9, wf_tp_step),
+        )
+
+        wf_windows, wf_oos = run_walk_forward(
+            prices,
+            prices_key,
+            filtered["Date_dt"].to_numpy(),
+            wf_grid,
+            param_entry_tf,
+            int(wf_train),
+            int(wf_test),
+            OBJECTIVES[wf_objective],
+            int(wf_min_trades),
+            exit_model,
+            direction,
+            int(wf_workers),
+            costs,
+            initial_capital,
+            risk_pct,
+        )
+
+        if wf_windows.empty:
+            st.info("Storico insufficiente per almeno una finestra di train + test.")
+        else:
+            if costs:
+                st.caption("R e profit out-of-sample al netto dei costi (commissioni, slippage, borrow)")
+
+            risk_amount = initial_capital * (risk_pct / 100)
+            wf_oos["PnL_$"] = wf_oos["R_multiple"] * risk_amount
+            wf_oos["Equity"] = initial_capital + wf_oos["PnL_$"].cumsum()
+
+            oos_winrate = (wf_oos["R_multiple"] > 0).mean() * 100 if len(wf_oos) else 0
+
+            col_k1, col_k2, col_k3, col_k4 = st.columns(4)
+            col_k1.markdown(kpi_box("Combinazioni griglia", len(wf_grid)), unsafe_allow_html=True)
+            col_k2.markdown(kpi_box("Trade OOS", len(wf_oos)), unsafe_allow_html=True)
+            col_k3.markdown(kpi_box("Winrate OOS", f"{oos_winrate:.1f}%"), unsafe_allow_html=True)
+            col_k4.markdown(kpi_box("Profit OOS", f"{wf_oos['PnL_$'].sum():.2f}$"), unsafe_allow_html=True)
+
+            st.dataframe(wf_windows.round(2), use_container_width=True)
+
+            # ---- EQUITY OUT-OF-SAMPLE ----
+            fig6, ax6 = plt.subplots(figsize=(10, 2))
+            ax6.plot(range(len(wf_oos)), wf_oos["Equity"], linewidth=1, color="royalblue")
+            ax6.axhline(initial_capital, color="gray", linestyle="--", linewidth=1)
+            fig6.patch.set_facecolor('#D5D9DF')
+            ax6.set_facecolor('#D5D9DF')
+            ax6.set_title("Equity out-of-sample (finestre di test concatenate)", fontsize=9)
+            ax6.set_xlabel("Trade", fontsize=8)
+            ax6.set_ylabel("Capitale ($)", fontsize=8)
+            ax6.tick_params(axis='both', which='major', labelsize=7)
+            plt.tight_layout()
+            st.pyplot(fig6)
+
+
+render_walk_forward(prices, current_run, filtered, param_entry_tf, initial_capital, risk_pct, exit_model, param_direction,
+                    run_config["costs"])
+
+# endregion
+mark("walk-forward")
 
-# endregion
\ No newline at end of file
+render_profiler_panel()
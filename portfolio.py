@@ -0,0 +1,127 @@
+import pandas as pd
+import numpy as np
+
+
+MAX_POSITIONS = 3
+MAX_EXPOSURE_PCT = 100.0
+
+# allocazione dei segnali dello stesso giorno
+ALLOC_ORDER = "ordine"
+ALLOC_PRO_RATA = "pro-quota"
+ALLOCATIONS = [ALLOC_ORDER, ALLOC_PRO_RATA]
+
+
+# -------------------------------------------------
+# region RAGGRUPPAMENTO PER GIORNATA
+# -------------------------------------------------
+
+def _day_groups(dates, priority):
+    """
+    Ordina i trade per (giorno, priorità) e restituisce l'ordine, il codice
+    giorno per riga ordinata, il rank dentro la giornata e i giorni unici.
+    """
+    days, day_code = np.unique(dates, return_inverse=True)
+    order = np.lexsort((np.arange(len(dates)), priority, day_code))
+    code = day_code[order]
+
+    # rank = posizione - inizio del gruppo (righe già ordinate per giorno)
+    starts = np.flatnonzero(np.r_[True, code[1:] != code[:-1]])
+    group_start = np.repeat(starts, np.diff(np.r_[starts, len(code)]))
+    rank = np.arange(len(code)) - group_start
+
+    return order, code, rank, group_start, days
+
+
+def _group_cumsum(values, group_start):
+    """Somma cumulata che riparte a ogni giornata (righe ordinate per giorno)"""
+    total = np.cumsum(values)
+    before = np.r_[0.0, total][group_start]
+    return total - before
+
+# endregion
+
+
+# -------------------------------------------------
+# region SIMULAZIONE PORTAFOGLIO
+# -------------------------------------------------
+
+def trade_exposure_pct(entry_price, sl_price, risk_pct, fill_frac=1.0):
+    """Nozionale del trade in % dell'equity: size = rischio / distanza stop"""
+    entry_price = np.asarray(entry_price, dtype=float)
+    stop_dist = np.abs(np.asarray(sl_price, dtype=float) - entry_price)
+    with np.errstate(divide="ignore", invalid="ignore"):
+        return np.where(stop_dist > 0, risk_pct * entry_price / stop_dist, 0.0) * fill_frac
+
+
+def simulate_portfolio(dates, r, exposure_pct, priority=None, initial_capital=10000, risk_pct=1,
+                       max_positions=MAX_POSITIONS, max_exposure_pct=MAX_EXPOSURE_PCT,
+                       allocation=ALLOC_ORDER, compound=False):
+    """
+    Portafoglio per giornata sui soli trade attivati.
+    dates, r (R multiple), exposure_pct (nozionale del trade in % dell'equity
+    a rischio pieno) e priority (es. bucket di entry: prima chi entra prima)
+    sono vettori per trade. Per ogni giorno:
+      - al massimo max_positions trade, in ordine di priorità
+      - esposizione totale <= max_exposure_pct: "ordine" prende i trade finché
+        c'è spazio (l'ultimo ridotto), "pro-quota" riduce tutti in proporzione
+    Equity giornaliera a rischio fisso sul capitale iniziale o composta.
+    Restituisce (trade con peso assegnato, tabella giornaliera).
+    """
+    dates = np.asarray(dates)
+    r = np.asarray(r, dtype=float)
+    exposure_pct = np.nan_to_num(np.asarray(exposure_pct, dtype=float), nan=0.0, posinf=0.0)
+    if priority is None:
+        priority = np.zeros(len(r))
+    priority = np.nan_to_num(np.asarray(priority, dtype=float), nan=np.inf)
+
+    order, code, rank, group_start, days = _day_groups(dates, priority)
+    r_s, exp_s = r[order], exposure_pct[order]
+
+    # ---- LIMITE POSIZIONI ----
+    taken = rank < max_positions
+    exp_taken = np.where(taken, exp_s, 0.0)
+
+    # ---- LIMITE ESPOSIZIONE ----
+    if allocation == ALLOC_PRO_RATA:
+        day_exp = np.bincount(code, weights=exp_taken, minlength=len(days))
+        with np.errstate(divide="ignore", invalid="ignore"):
+            scale = np.where(day_exp > max_exposure_pct, max_exposure_pct / day_exp, 1.0)
+        weight = taken * scale[code]
+    else:
+        used_before = _group_cumsum(exp_taken, group_start) - exp_taken
+        room = np.clip(max_exposure_pct - used_before, 0.0, None)
+        with np.errstate(divide="ignore", invalid="ignore"):
+            weight = np.where(exp_taken > 0, np.minimum(1.0, room / exp_taken), taken * 1.0)
+
+    # ---- AGGREGATO GIORNALIERO ----
+    day_r = np.bincount(code, weights=weight * r_s, minlength=len(days))
+    risk = risk_pct / 100
+
+    if compound:
+        equity = initial_capital * np.cumprod(1 + risk * day_r)
+        start_equity = np.r_[initial_capital, equity[:-1]]
+        day_pnl = equity - start_equity
+    else:
+        day_pnl = initial_capital * risk * day_r
+        equity = initial_capital + np.cumsum(day_pnl)
+
+    peak = np.maximum(np.maximum.accumulate(equity), initial_capital)
+
+    daily = pd.DataFrame({
+        "Date": days,
+        "Segnali": np.bincount(code, minlength=len(days)),
+        "Trade": np.bincount(code, weights=weight > 0, minlength=len(days)).astype(int),
+        "Esposizione_%": np.bincount(code, weights=weight * exp_s, minlength=len(days)),
+        "R": day_r,
+        "PnL_$": day_pnl,
+        "Equity": equity,
+        "Drawdown_%": (equity - peak) / peak * 100,
+    })
+
+    weights = np.empty(len(r))
+    weights[order] = weight
+    trades = pd.DataFrame({"Peso": weights, "R_portafoglio": weights * r})
+
+    return trades, daily
+
+# endregion
@@ -0,0 +1,163 @@
+import os
+import json
+import time
+import tracemalloc
+from collections import deque
+from contextlib import contextmanager
+from datetime import datetime
+
+import streamlit as st
+import pandas as pd
+
+
+PROFILE_LOG = "profiler.log"
+N_RERUNS = 10
+# pannello visibile con ?debug=1 nell'URL
+DEBUG_PARAM = "debug"
+# memoria di picco: PROFILER_TRACEMALLOC=1 all'avvio del server
+TRACEMALLOC_ENV = "PROFILER_TRACEMALLOC"
+
+_RUNS_KEY = "_profiler_runs"
+_CURRENT_KEY = "_profiler_current"
+
+
+# -------------------------------------------------
+# region REGISTRAZIONE STAGE
+# -------------------------------------------------
+
+def debug_enabled():
+    return st.query_params.get(DEBUG_PARAM) == "1"
+
+
+def start_rerun(page):
+    """
+    Apre il profilo del rerun corrente (chiamare in cima alla pagina).
+    La memoria di picco (tracemalloc) si misura solo con PROFILER_TRACEMALLOC=1:
+    tracemalloc è unico per processo e rallenta tutte le sessioni, quindi si
+    avvia una volta e nessuna sessione lo ferma. Con più rerun in parallelo i
+    picchi si mescolano (reset_peak è globale): peak_mb è indicativo, None se spento.
+    """
+    if os.environ.get(TRACEMALLOC_ENV) == "1" and not tracemalloc.is_tracing():
+        tracemalloc.start()
+
+    if _RUNS_KEY not in st.session_state:
+        st.session_state[_RUNS_KEY] = deque(maxlen=N_RERUNS)
+
+    current = {
+        "page": page,
+        # profiler.log solo per i rerun in debug: in produzione il file non cresce
+        "log": debug_enabled(),
+        "ts": datetime.now().isoformat(timespec="seconds"),
+        "stages": [],
+        "_t": time.perf_counter(),
+        "_rows": None,
+    }
+    st.session_state[_RUNS_KEY].append(current)
+    st.session_state[_CURRENT_KEY] = current
+    current["_mem"] = _reset_peak()
+
+
+def _reset_peak():
+    if tracemalloc.is_tracing():
+        tracemalloc.reset_peak()
+        return tracemalloc.get_traced_memory()[0]
+    return None
+
+
+def _record(name, wall, rows_in, rows_out, mem_start):
+    current = st.session_state.get(_CURRENT_KEY)
+    if current is None:
+        return
+
+    peak_mb = None
+    if mem_start is not None and tracemalloc.is_tracing():
+        peak_mb = (tracemalloc.get_traced_memory()[1] - mem_start) / 1e6
+
+    entry = {
+        "stage": name,
+        "wall_ms": wall * 1000,
+        "rows_in": rows_in,
+        "rows_out": rows_out,
+        "peak_mb": peak_mb,
+    }
+    current["stages"].append(entry)
+    current["_rows"] = rows_out if rows_out is not None else current["_rows"]
+
+    if current["log"]:
+        with open(PROFILE_LOG, "a") as f:
+            f.write(json.dumps({"ts": current["ts"], "page": current["page"], **entry}) + "\n")
+
+
+class _Stage:
+    rows_out = None
+
+
+@contextmanager
+def profile_stage(name, rows_in=None):
+    """
+    with profile_stage("download foglio") as stage:
+        df = pd.read_csv(...)
+        stage.rows_out = len(df)
+    """
+    current = st.session_state.get(_CURRENT_KEY)
+    if rows_in is None and current is not None:
+        rows_in = current["_rows"]
+
+    stage = _Stage()
+    mem_start = _reset_peak()
+    start = time.perf_counter()
+    try:
+        yield stage
+    finally:
+        _record(name, time.perf_counter() - start, rows_in, stage.rows_out, mem_start)
+        if current is not None:
+            current["_t"] = time.perf_counter()
+            current["_mem"] = _reset_peak()
+
+
+def mark(name, rows_out=None):
+    """
+    Chiude lo stage che va dall'ultimo mark/stage a qui: per le region lunghe
+    delle pagine (calcoli + rendering) senza reindentare il codice.
+    rows_in = righe in uscita dallo stage precedente.
+    """
+    current = st.session_state.get(_CURRENT_KEY)
+    if current is None:
+        return
+    now = time.perf_counter()
+    mem_start = current.get("_mem")
+    _record(name, now - current["_t"], current["_rows"], rows_out, mem_start)
+    current["_t"] = time.perf_counter()
+    current["_mem"] = _reset_peak()
+
+# endregion
+
+
+# -------------------------------------------------
+# region PANNELLO DEBUG
+# -------------------------------------------------
+
+def render_profiler_panel():
+    """Pannello in sidebar (solo con ?debug=1): ultimo rerun e media degli ultimi N"""
+    if not debug_enabled():
+        return
+
+    runs = [r for r in st.session_state.get(_RUNS_KEY, []) if r["stages"]]
+    if not runs:
+        return
+
+    last = runs[-1]
+    with st.sidebar.expander("🛠️ Profiler (debug)", expanded=True):
+        stages = pd.DataFrame(last["stages"])
+        st.caption(f"{last['page']} — {last['ts']} — totale {stages['wall_ms'].sum():.0f} ms")
+        st.dataframe(stages.round(1), use_container_width=True, hide_index=True)
+
+        history = pd.DataFrame([
+            {"rerun": i, **s} for i, r in enumerate(runs) for s in r["stages"]
+            if r["page"] == last["page"]
+        ])
+        summary = history.groupby("stage", sort=False)["wall_ms"].agg(["mean", "max", "count"])
+        st.caption(f"Ultimi {history['rerun'].nunique()} rerun di questa pagina (ms)")
+        st.dataframe(summary.round(1), use_container_width=True)
+
+# endregion
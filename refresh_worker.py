@@ -0,0 +1,161 @@
+import time
+import logging
+import threading
+
+import streamlit as st
+
+
+REFRESH_TTL = 600        # secondi di validità di uno snapshot
+REFRESH_AHEAD = 0.8      # il worker rinfresca all'80% del ttl, prima della scadenza
+IDLE_EVICT = 3600        # snapshot non letti da un'ora: non più rinfrescati e rimossi
+POLL_SEC = 5
+
+log = logging.getLogger(__name__)
+
+
+# -------------------------------------------------
+# region SNAPSHOT
+# -------------------------------------------------
+
+def new_worker(ttl=REFRESH_TTL, clock=time.monotonic, idle_evict=IDLE_EVICT):
+    """
+    Stato del worker: snapshot per chiave con la funzione che li riscarica.
+    clock iniettabile per i test (deve restituire secondi).
+    """
+    return {
+        "entries": {},
+        "key_locks": {},
+        "lock": threading.Lock(),
+        "ttl": ttl,
+        "clock": clock,
+        "idle_evict": idle_evict,
+        "stop": threading.Event(),
+        "thread": None,
+        "errors": {},
+    }
+
+
+def _key_lock(worker, key):
+    with worker["lock"]:
+        return worker["key_locks"].setdefault(key, threading.Lock())
+
+
+def _swap(worker, key, fetch, value, ttl, last_access):
+    # entry nuova sostituita in blocco: chi legge vede il vecchio o il nuovo snapshot, mai un misto
+    entry = {
+        "fetch": fetch,
+        "value": value,
+        "ttl": ttl,
+        "fetched_at": worker["clock"](),
+        "last_access": last_access,
+    }
+    with worker["lock"]:
+        worker["entries"][key] = entry
+        worker["errors"].pop(key, None)
+    return entry
+
+
+def _fetch(worker, key, fetch, ttl):
+    """Download in linea (primo accesso o worker in ritardo), una sola volta per chiave"""
+    with _key_lock(worker, key):
+        entry = worker["entries"].get(key)
+        if entry is not None and worker["clock"]() - entry["fetched_at"] < entry["ttl"]:
+            return entry
+        try:
+            value = fetch()
+        except Exception as e:
+            if entry is None:
+                raise
+            # meglio lo snapshot scaduto che la pagina in errore
+            log.warning("refresh %s fallito, uso lo snapshot precedente: %s", key, e)
+            with worker["lock"]:
+                worker["errors"][key] = str(e)
+            return entry
+        return _swap(worker, key, fetch, value, ttl, worker["clock"]())
+
+
+def get(worker, key, fetch, ttl=None):
+    """
+    Snapshot per key. Scarica solo al primo accesso o se il worker non l'ha
+    rinfrescato in tempo; altrimenti restituisce l'ultimo snapshot (condiviso
+    tra le sessioni: non modificarlo).
+    """
+    ttl = ttl or worker["ttl"]
+    now = worker["clock"]()
+    entry = worker["entries"].get(key)
+    if entry is None or now - entry["fetched_at"] >= entry["ttl"]:
+        entry = _fetch(worker, key, fetch, ttl)
+    entry["last_access"] = now
+    return entry["value"]
+
+
+def refresh_due(worker):
+    """
+    Un passaggio del worker: rinfresca gli snapshot vicini alla scadenza e
+    rimuove quelli non letti da idle_evict secondi. Restituisce le chiavi rinfrescate.
+    """
+    now = worker["clock"]()
+    with worker["lock"]:
+        entries = list(worker["entries"].items())
+
+    refreshed = []
+    for key, entry in entries:
+        if now - entry["last_access"] > worker["idle_evict"]:
+            with worker["lock"]:
+                if worker["entries"].get(key) is entry:
+                    del worker["entries"][key]
+            continue
+
+        if now - entry["fetched_at"] < entry["ttl"] * REFRESH_AHEAD:
+            continue
+
+        try:
+            value = entry["fetch"]()
+        except Exception as e:
+            log.warning("refresh %s fallito: %s", key, e)
+            with worker["lock"]:
+                worker["errors"][key] = str(e)
+            continue
+        _swap(worker, key, entry["fetch"], value, entry["ttl"], entry["last_access"])
+        refreshed.append(key)
+
+    return refreshed
+
+# endregion
+
+
+# -------------------------------------------------
+# region THREAD
+# -------------------------------------------------
+
+def _loop(worker, poll):
+    while not worker["stop"].wait(poll):
+        try:
+            refresh_due(worker)
+        except Exception:
+            log.exception("refresh worker")
+
+
+def start(worker, poll=POLL_SEC):
+    """Avvia il thread di refresh (daemon: non blocca l'uscita del server)"""
+    if worker["thread"] is not None and worker["thread"].is_alive():
+        return worker
+    worker["stop"].clear()
+    worker["thread"] = threading.Thread(target=_loop, args=(worker, poll), name="refresh-worker", daemon=True)
+    worker["thread"].start()
+    return worker
+
+
+def stop(worker, timeout=None):
+    worker["stop"].set()
+    if worker["thread"] is not None:
+        worker["thread"].join(timeout)
+        worker["thread"] = None
+
+
+@st.cache_resource
+def shared_worker():
+    """Worker unico per il processo server, condiviso da tutte le sessioni"""
+    return start(new_worker())
+
+# endregion
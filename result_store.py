@@ -0,0 +1,137 @@
+import json
+import hashlib
+import sqlite3
+from contextlib import closing
+from datetime import datetime
+from io import StringIO
+
+import pandas as pd
+
+
+RESULTS_DB = "backtest_runs.sqlite"
+
+# colonne della simulazione salvate per ogni riga filtrata
+RESULT_COLS = [
+    "Entry_price", "SL_price", "TP_price", "attivazione", "entry_bucket", "TP", "SL",
+    "TP_90m%", "Fill_frac", "Exit_reason", "Ambiguo", "Side", "Outcome",
+    "PnL_$", "R_multiple",
+    "PnL_lordo_$", "Commissioni_$", "Slippage_$", "Borrow_$", "Costi_$",
+]
+# colonne identificative (per equity e confronto senza il dataset)
+KEY_COLS = ["Date", "Ticker"]
+
+METRIC_COLS = ["n_trades", "winrate", "expectancy", "profit", "max_drawdown", "total_r"]
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS runs (
+    run_hash TEXT PRIMARY KEY,
+    created_at TEXT NOT NULL,
+    label TEXT,
+    dataset_version TEXT,
+    config TEXT NOT NULL,
+    n_trades INTEGER,
+    winrate REAL,
+    expectancy REAL,
+    profit REAL,
+    max_drawdown REAL,
+    total_r REAL
+);
+CREATE INDEX IF NOT EXISTS idx_runs_created ON runs(created_at);
+CREATE INDEX IF NOT EXISTS idx_runs_dataset ON runs(dataset_version);
+CREATE TABLE IF NOT EXISTS results (
+    run_hash TEXT PRIMARY KEY REFERENCES runs(run_hash),
+    data TEXT NOT NULL
+);
+"""
+
+
+# -------------------------------------------------
+# region HASH E CONNESSIONE
+# -------------------------------------------------
+
+def dataset_version(df):
+    """Impronta del dataset: cambia solo quando cambiano i dati del foglio"""
+    return str(pd.util.hash_pandas_object(df, index=True).sum())
+
+
+def run_hash(config, dataset_version):
+    """Hash deterministico di parametri + filtri + versione dataset"""
+    payload = json.dumps({"config": config, "dataset": dataset_version}, sort_keys=True, default=str)
+    return hashlib.sha256(payload.encode()).hexdigest()[:16]
+
+
+def connect(path=RESULTS_DB):
+    """Connessione con schema creato; chi la apre la chiude (contextlib.closing)"""
+    con = sqlite3.connect(path)
+    con.executescript(_SCHEMA)
+    return con
+
+# endregion
+
+
+# -------------------------------------------------
+# region LETTURA / SCRITTURA
+# -------------------------------------------------
+
+def save_run(run_id, config, dataset_version, results, metrics, label="", path=RESULTS_DB):
+    """Salva parametri, metriche e risultati per riga (JSON split) sotto run_id"""
+    cols = [c for c in KEY_COLS + RESULT_COLS if c in results.columns]
+    data = results[cols].to_json(orient="split", date_format="iso", double_precision=15)
+
+    with closing(connect(path)) as con, con:
+        con.execute(
+            "INSERT OR REPLACE INTO runs VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)",
+            (
+                run_id,
+                datetime.now().isoformat(timespec="seconds"),
+                label,
+                dataset_version,
+                json.dumps(config, sort_keys=True, default=str),
+                *[None if metrics.get(m) is None else float(metrics[m]) for m in METRIC_COLS],
+            ),
+        )
+        con.execute("INSERT OR REPLACE INTO results VALUES (?, ?)", (run_id, data))
+
+
+def load_results(run_id, path=RESULTS_DB):
+    """Risultati per riga di una run salvata, None se non presente"""
+    with closing(connect(path)) as con, con:
+        row = con.execute("SELECT data FROM results WHERE run_hash = ?", (run_id,)).fetchone()
+    if row is None:
+        return None
+    return pd.read_json(StringIO(row[0]), orient="split")
+
+
+def results_match(stored, df):
+    """
+    True se i risultati salvati sono delle stesse righe di df: stesso indice
+    e stesse Date + Ticker nello stesso ordine (non basta la lunghezza).
+    """
+    if stored is None or len(stored) != len(df) or not stored.index.equals(df.index):
+        return False
+    if not all(col in stored.columns and col in df.columns for col in KEY_COLS):
+        return False
+    same_dates = (pd.to_datetime(stored["Date"]).to_numpy() == pd.to_datetime(df["Date"]).to_numpy()).all()
+    same_tickers = (stored["Ticker"].astype(str).to_numpy() == df["Ticker"].astype(str).to_numpy()).all()
+    return bool(same_dates and same_tickers)
+
+
+def list_runs(path=RESULTS_DB, dataset_version=None):
+    """Elenco delle run (solo tabella runs, indicizzata), più recenti prima"""
+    query = "SELECT * FROM runs"
+    params = ()
+    if dataset_version is not None:
+        query += " WHERE dataset_version = ?"
+        params = (dataset_version,)
+    query += " ORDER BY created_at DESC"
+
+    with closing(connect(path)) as con, con:
+        return pd.read_sql_query(query, con, params=params)
+
+
+def delete_run(run_id, path=RESULTS_DB):
+    with closing(connect(path)) as con, con:
+        con.execute("DELETE FROM results WHERE run_hash = ?", (run_id,))
+        con.execute("DELETE FROM runs WHERE run_hash = ?", (run_id,))
+
+# endregion
@@ -0,0 +1,702 @@
+import pandas as pd
+import numpy as np
+
+from cost_model import cost_r
+
+
+# modalità di uscita (stesse etichette del radio nella pagina strategia)
+MODE_90M = "90 minuti"
+MODE_CLOSE = "Fino a chiusura"
+
+# bucket in cui si cerca il raggiungimento dell'entry
+ENTRY_TFS = [1, 5, 15, 30, 45, 60, 90, 120, 240]
+# bucket per SL/TP: fino a 90m o fino a chiusura (High/Low di giornata come ultimo bucket)
+EXIT_TFS = {
+    MODE_90M: [1, 5, 15, 30, 45, 60, 90],
+    MODE_CLOSE: [1, 5, 15, 30, 45, 60, 90, 120, 240, "close"],
+}
+EXIT_CLOSE_COL = {MODE_90M: "Close_90m", MODE_CLOSE: "Close"}
+
+# direzione del trade: segno usato per specchiare prezzi e R
+SHORT = "short"
+LONG = "long"
+SIDE = {SHORT: 1, LONG: -1}
+
+# ordine SL/TP quando entrambi cadono nello stesso bucket
+AMBIGUITY_WORST = "worst"
+AMBIGUITY_BEST = "best"
+AMBIGUITY_PROB = "prob"
+AMBIGUITY_MODELS = [AMBIGUITY_WORST, AMBIGUITY_BEST, AMBIGUITY_PROB]
+SL_FIRST_PROB = 0.5
+
+# sessione regolare: 9:30 -> 16:00 (per collocare TimeHigh nei bucket)
+MARKET_OPEN_SEC = 9 * 3600 + 30 * 60
+SESSION_MIN = 390
+
+
+# ================================================
+# region FEATURE PRE-TRADE
+# ================================================
+
+def add_pretrade_features(df):
+    """
+    Colonne derivate usate dai KPI e dalle regole di ingresso:
+    TimeHigh_sec (e TimeLow_sec se il foglio ha TimeLow), Open_vs_PMH_%,
+    volumi dei primi minuti rispetto a PM e totale.
+    """
+    df = df.copy()
+
+    for col in ("TimeHigh", "TimeLow"):
+        if col in df.columns:
+            df[col] = pd.to_datetime(df[col], errors="coerce")
+            df[f"{col}_sec"] = df[col].dt.hour * 3600 + df[col].dt.minute * 60 + df[col].dt.second
+
+    if all(col in df.columns for col in ["Open", "HighPM"]):
+        df["Open_vs_PMH_%"] = ((df["Open"] - df["HighPM"]) / df["HighPM"]) * 100
+
+    volume_pm = df["VolumePM"].replace(0, np.nan)
+    volume = df["Volume"].replace(0, np.nan)
+    df["Vol5_vs_PM_%"] = (df["Volume_5m"] / volume_pm) * 100
+    df["Vol30_vs_PM_%"] = (df["Volume_30m"] / volume_pm) * 100
+    df["Vol60_vs_PM_%"] = (df["Volume_60m"] / volume_pm) * 100
+    df["Vol5_vs_Total_%"] = (df["Volume_5m"] / volume) * 100
+    df["Vol30_vs_Total_%"] = (df["Volume_30m"] / volume) * 100
+
+    return df
+
+# endregion
+
+
+# ================================================
+# region MATRICI PREZZI
+# ================================================
+
+def _numeric_matrix(df, cols):
+    """Colonne -> matrice float (righe x colonne); colonne mancanti -> NaN"""
+    return df.reindex(columns=cols).apply(pd.to_numeric, errors="coerce").to_numpy(dtype=float)
+
+
+def _tf_cols(prefix, tfs):
+    return [prefix if tf == "close" else f"{prefix}_{tf}m" for tf in tfs]
+
+
+def repair_envelope(df, tfs=ENTRY_TFS):
+    """
+    High_{tf}m / Low_{tf}m sono estremi cumulati dall'open (High/Low di giornata
+    come ultimo bucket): massimo / minimo progressivo lungo i timeframe.
+    Le righe che violano l'ipotesi (glitch del foglio) vengono corrette e
+    marcate in Envelope_fix. I bucket NaN restano NaN (nessun tocco).
+    """
+    df = df.copy()
+    fixed = np.zeros(len(df), dtype=bool)
+
+    for prefix, accumulate in (("High", np.fmax.accumulate), ("Low", np.fmin.accumulate)):
+        cols = [c for c in _tf_cols(prefix, list(tfs) + ["close"]) if c in df.columns]
+        if len(cols) < 2:
+            continue
+        values = df[cols].to_numpy(dtype=float)
+        missing = np.isnan(values)
+        repaired = np.where(missing, np.nan, accumulate(values, axis=1))
+        fixed |= ((repaired != values) & ~missing).any(axis=1)
+        df[cols] = repaired
+
+    df["Envelope_fix"] = fixed.astype(int)
+    return df
+
+
+def build_prices(df, mode):
+    """
+    Matrici High/Low impilate (righe x bucket) usate da tutte le simulazioni.
+    Si costruiscono una volta e si riusano per ogni combinazione di parametri.
+    """
+    exit_tfs = EXIT_TFS[mode]
+    return {
+        "mode": mode,
+        "open": pd.to_numeric(df["Open"], errors="coerce").to_numpy(dtype=float),
+        "entry_tfs": np.array(ENTRY_TFS, dtype=float),
+        "entry_high": _numeric_matrix(df, _tf_cols("High", ENTRY_TFS)),
+        # il bucket "close" viene sempre dopo qualsiasi bucket di entry
+        "exit_tfs": np.array([np.inf if tf == "close" else tf for tf in exit_tfs], dtype=float),
+        "exit_high": _numeric_matrix(df, _tf_cols("High", exit_tfs)),
+        "exit_low": _numeric_matrix(df, _tf_cols("Low", exit_tfs)),
+        "exit_close": _numeric_matrix(df, [EXIT_CLOSE_COL[mode]])[:, 0],
+        # Close_{tf}m per bucket, usato dal time stop
+        "exit_close_tf": _numeric_matrix(df, _tf_cols("Close", exit_tfs)),
+        # minuti dall'open del massimo di giornata (NaN se TimeHigh manca)
+        "time_high_min": (_numeric_matrix(df, ["TimeHigh_sec"])[:, 0] - MARKET_OPEN_SEC) / 60,
+        # idem per il minimo (NaN se il foglio non ha TimeLow)
+        "time_low_min": (_numeric_matrix(df, ["TimeLow_sec"])[:, 0] - MARKET_OPEN_SEC) / 60,
+    }
+
+# endregion
+
+
+# ================================================
+# region PRIMO TOCCO (RICERCA BINARIA)
+# ================================================
+
+def search_first_at_least(values, targets, lo, hi, descending=False):
+    """
+    searchsorted(side="left") per tante query insieme: per ogni query il primo
+    indice in [lo, hi) con values >= target (hi se nessuno). values è 1-D e
+    non decrescente dentro ogni tratto [lo, hi) (es. massimo progressivo di
+    una giornata). O(log n) letture per query, nessuna scansione.
+    descending: tratti non crescenti (minimo progressivo), primo values <= target.
+    """
+    lo = np.array(lo, dtype=np.int64)
+    hi = np.array(hi, dtype=np.int64)
+    targets = np.broadcast_to(targets, lo.shape)
+    while True:
+        searching = lo < hi
+        if not searching.any():
+            return lo
+        mid = (lo + hi) // 2
+        probe = values[np.where(searching, mid, 0)]
+        below = searching & ((probe > targets) if descending else (probe < targets))
+        lo = np.where(below, mid + 1, lo)
+        hi = np.where(searching & ~below, mid, hi)
+
+
+def first_at_least_rows(running, targets):
+    """
+    Prima colonna di ogni riga con running >= target (-1 se nessuna).
+    running: righe x colonne non decrescenti per riga (massimo progressivo,
+    -inf dove non c'è ancora un prezzo).
+    """
+    n, m = running.shape
+    lo = np.arange(n, dtype=np.int64) * m
+    first = search_first_at_least(np.ascontiguousarray(running).ravel(), targets, lo, lo + m) - lo
+    return np.where((first < m) & ~np.isnan(targets), first, -1)
+
+
+def build_touch_index(high, low):
+    """
+    Tabelle sparse per le ricerche "dopo il minuto t": al livello k massimo
+    degli High / minimo dei Low su finestre di 2^k colonne (float32: i prezzi
+    delle barre lo sono già). Memoria ~ righe x colonne x log2(colonne) x 2.
+    """
+    span_high, span_low = [high.astype(np.float32)], [low.astype(np.float32)]
+    width = 1
+    while width * 2 <= high.shape[1]:
+        h, l = span_high[-1], span_low[-1]
+        span_high.append(np.fmax(h[:, :-width], h[:, width:]))
+        span_low.append(np.fmin(l[:, :-width], l[:, width:]))
+        width *= 2
+    return {"high": span_high, "low": span_low}
+
+
+def first_touch_after(index, key, level, start):
+    """
+    Prima colonna j >= start con High >= level (key "high") o Low <= level
+    (key "low"), -1 se nessuna. Salti di 2^k colonne finché la finestra non
+    tocca il livello (binary lifting): O(log n) per riga.
+    """
+    spans = index[key]
+    n, m = spans[0].shape
+    sign = 1 if key == "high" else -1
+    level = sign * np.broadcast_to(level, (n,))
+    rows = np.arange(n)
+    pos = np.array(start, dtype=np.int64)
+
+    with np.errstate(invalid="ignore"):
+        for k in reversed(range(len(spans))):
+            width = 2 ** k
+            fits = pos + width <= m
+            window = sign * spans[k][rows, np.where(fits, pos, 0)]
+            untouched = fits & ~(window >= level)
+            pos = np.where(untouched, pos + width, pos)
+
+        inside = pos < m
+        touched = inside & (sign * spans[0][rows, np.where(inside, pos, 0)] >= level)
+    return np.where(touched, pos, -1)
+
+# endregion
+
+
+# ================================================
+# region SIMULAZIONE SHORT / LONG (VETTORIALE)
+# ================================================
+
+# motivi di uscita
+EXIT_SL, EXIT_TRAIL, EXIT_BE = 0, 1, 2
+EXIT_REASONS = {EXIT_SL: "SL", EXIT_TRAIL: "TRAIL", EXIT_BE: "BE"}
+
+
+def _resolve_exits(prices, ref, sl_k, tp_k, open_k, exit_model=None, side=SIDE[SHORT]):
+    """
+    Primo bucket di uscita per ogni riga. sl_k, tp_k, ref (prezzo di
+    ingresso/medio) sono matrici (righe x bucket) o broadcastabili; open_k
+    indica i bucket in cui la posizione è aperta.
+    side = +1 short, -1 long: per il long i prezzi sono moltiplicati per -1
+    (High e Low si scambiano), così la stessa logica vale per entrambi i lati.
+    exit_model (opzionale):
+      - trailing_pct: stop a (minimo Low visto dopo l'entry) * (1 + trailing%)
+      - breakeven_pct: stop a ref dopo un Low <= ref * (1 - breakeven%)
+      - time_stop_tf: nessuna uscita dopo quel timeframe, chiusura a Close_{tf}m;
+        posizioni aperte solo dopo il time stop (ingresso nel bucket del time
+        stop o dopo) restano piatte: late = True, il chiamante esce all'entry
+      - ambiguity: stop e TP nello stesso bucket -> "worst" (stop prima, default),
+        "best" (TP prima) o "prob" (lato High prima se il TimeHigh cade nella
+        prima metà del bucket, altrimenti stop prima con probabilità sl_first_prob)
+    I minimi progressivi sono calcolati con fmin.accumulate lungo i bucket:
+    uno stop aggiornato vale dal bucket successivo.
+    """
+    exit_model = exit_model or {}
+    if side > 0:
+        high, low = prices["exit_high"], prices["exit_low"]
+    else:
+        high, low = -prices["exit_low"], -prices["exit_high"]
+    ref, sl_k, tp_k = side * ref, side * sl_k, side * tp_k
+    exit_close = prices["exit_close"]
+    n, k = high.shape
+
+    late = np.zeros(n, dtype=bool)
+    time_stop_tf = exit_model.get("time_stop_tf")
+    if time_stop_tf:
+        in_time = (prices["exit_tfs"] <= time_stop_tf)[None, :]
+        # Close_{tf}m precede l'ingresso: nessun prezzo di uscita valido
+        late = np.asarray(open_k).any(axis=1) & ~(open_k & in_time).any(axis=1)
+        open_k = open_k & in_time
+        exit_close = prices["exit_close_tf"][:, int(np.flatnonzero(prices["exit_tfs"] == time_stop_tf)[0])]
+
+    stop_k = np.broadcast_to(sl_k, (n, k)).astype(float)
+    reason_k = np.full((n, k), EXIT_SL)
+
+    trailing_pct = exit_model.get("trailing_pct")
+    breakeven_pct = exit_model.get("breakeven_pct")
+    if trailing_pct or breakeven_pct:
+        # minimo dei Low nei bucket precedenti (solo a posizione aperta)
+        lows_seen = np.fmin.accumulate(np.where(open_k, low, np.nan), axis=1)
+        prev_low = np.concatenate([np.full((n, 1), np.nan), lows_seen[:, :-1]], axis=1)
+        ref_k = np.broadcast_to(ref, (n, k))
+
+        if trailing_pct:
+            trail_k = np.fmin(prev_low, ref_k) * (1 + side * trailing_pct / 100)
+            tighter = trail_k < stop_k
+            stop_k = np.where(tighter, trail_k, stop_k)
+            reason_k = np.where(tighter, EXIT_TRAIL, reason_k)
+
+        if breakeven_pct:
+            with np.errstate(invalid="ignore"):
+                be_on = (prev_low <= ref_k * (1 - side * breakeven_pct / 100)) & (ref_k < stop_k)
+            stop_k = np.where(be_on, ref_k, stop_k)
+            reason_k = np.where(be_on, EXIT_BE, reason_k)
+
+    tp_k = np.broadcast_to(tp_k, (n, k))
+    stop_hit = (high >= stop_k) & open_k
+    tp_hit = (low <= tp_k) & open_k
+
+    any_hit = stop_hit | tp_hit
+    first = any_hit.argmax(axis=1)
+    hit = any_hit.any(axis=1)
+    rows = np.arange(n)
+
+    ambiguous = hit & stop_hit[rows, first] & tp_hit[rows, first]
+    stop_first = _stop_first(prices, first, side, exit_model)
+
+    # ❗ CASO PEGGIORATIVO (default): SL PRIORITARIO
+    is_stop = hit & stop_hit[rows, first] & (~ambiguous | stop_first)
+    is_tp = hit & ~is_stop
+    reason = np.where(is_stop, reason_k[rows, first], -1)
+
+    exit_price = np.where(
+        is_tp, side * tp_k[rows, first],
+        np.where(is_stop, side * stop_k[rows, first], exit_close)
+    )
+
+    exit_reason = np.where(
+        is_tp, "TP",
+        np.where(reason == EXIT_SL, "SL",
+        np.where(reason == EXIT_TRAIL, "TRAIL",
+        np.where(reason == EXIT_BE, "BE", "TIME" if time_stop_tf else "CLOSE")))
+    )
+
+    return {
+        "hit": hit,
+        "first": first,
+        "is_sl": is_stop & (reason == EXIT_SL),
+        "is_tp": is_tp,
+        "exit_price": exit_price,
+        "exit_reason": exit_reason,
+        "ambiguous": ambiguous,
+        "late": late,
+    }
+
+
+def _resolve_exits_touch(prices, start, active, sl, tp, exit_model=None, side=SIDE[SHORT]):
+    """
+    Come _resolve_exits per un ingresso singolo senza trailing / break-even,
+    sulle matrici con indice del primo tocco (prices["touch"], barre a 1
+    minuto): SL e TP cercati con first_touch_after dalla colonna start invece
+    di confrontare tutti i bucket. Stesse regole per ambiguità e time stop.
+    """
+    exit_model = exit_model or {}
+    index = prices["touch"]
+    exit_close = prices["exit_close"]
+    n, m = len(start), len(prices["exit_tfs"])
+
+    end = m
+    time_stop_tf = exit_model.get("time_stop_tf")
+    if time_stop_tf:
+        end = int(np.flatnonzero(prices["exit_tfs"] == time_stop_tf)[0]) + 1
+        exit_close = prices["exit_close_tf"][:, end - 1]
+
+    # short: stop sul lato High, TP sul lato Low; long il contrario
+    sl_key, tp_key = ("high", "low") if side > 0 else ("low", "high")
+    start = np.where(active, start, m)
+    # ingresso nel bucket del time stop o dopo: piatto (vedi _resolve_exits)
+    late = (start >= end) & (start < m) if time_stop_tf else np.zeros(n, dtype=bool)
+    sl_at = first_touch_after(index, sl_key, sl, start)
+    tp_at = first_touch_after(index, tp_key, tp, start)
+    # colonna m = mai toccato entro la fine (o il time stop)
+    sl_at = np.where((sl_at >= 0) & (sl_at < end), sl_at, m)
+    tp_at = np.where((tp_at >= 0) & (tp_at < end), tp_at, m)
+
+    first_at = np.minimum(sl_at, tp_at)
+    hit = first_at < m
+    first = np.where(hit, first_at, 0)
+    ambiguous = hit & (sl_at == tp_at)
+    stop_first = _stop_first(prices, first, side, exit_model)
+
+    is_stop = hit & (sl_at == first_at) & (~ambiguous | stop_first)
+    is_tp = hit & ~is_stop
+
+    return {
+        "hit": hit,
+        "first": first,
+        "is_sl": is_stop,
+        "is_tp": is_tp,
+        "exit_price": np.where(is_tp, tp, np.where(is_stop, sl, exit_close)),
+        "exit_reason": np.where(is_tp, "TP", np.where(is_stop, "SL", "TIME" if time_stop_tf else "CLOSE")),
+        "ambiguous": ambiguous,
+        "late": late,
+    }
+
+
+def _stop_first(prices, first, side, exit_model):
+    """
+    Per ogni riga: True se, nel bucket first, lo stop viene toccato prima del TP.
+    Con "prob" estrazione con sl_first_prob (seed fisso), tranne quando TimeHigh
+    e TimeLow cadono entrambi nel bucket e il massimo viene prima del minimo:
+    allora lato High prima (short: stop, long: TP). Senza TimeLow o con i due
+    orari fuori dal bucket resta l'estrazione.
+    """
+    ambiguity = exit_model.get("ambiguity", AMBIGUITY_WORST)
+    n = len(first)
+    if ambiguity == AMBIGUITY_WORST:
+        return np.ones(n, dtype=bool)
+    if ambiguity == AMBIGUITY_BEST:
+        return np.zeros(n, dtype=bool)
+
+    rng = np.random.default_rng(exit_model.get("seed", 0))
+    stop_first = rng.random(n) < exit_model.get("sl_first_prob", SL_FIRST_PROB)
+
+    # il bucket contiene le barre che iniziano nei minuti [inizio, fine) dall'open:
+    # 9:31 (t=1) è nel bucket 5m, in modalità minuto la colonna j è [j, j+1)
+    ends = np.minimum(prices["exit_tfs"], SESSION_MIN)
+    starts = np.concatenate([[0.0], ends[:-1]])
+    t_high = prices["time_high_min"]
+    t_low = prices.get("time_low_min", np.full(n, np.nan))
+    with np.errstate(invalid="ignore"):
+        in_bucket = (
+            (t_high >= starts[first]) & (t_high < ends[first])
+            & (t_low >= starts[first]) & (t_low < ends[first])
+        )
+        high_first = in_bucket & (t_high < t_low)
+
+    # short: lo stop è sul lato High; long: sul lato Low
+    return np.where(high_first, side > 0, stop_first)
+
+
+def simulate_single(prices, entry_pct, sl_pct, tp_pct, entry_tf, exit_model=None, direction=SHORT):
+    """
+    Un solo ingresso a Open * (1 + entry%), attivo se High_{entry_tf}m
+    raggiunge l'entry (short sul rialzo, long in breakout). SL/TP in % dall'open
+    (per il long SL sotto e TP sopra), cercati solo nei bucket successivi a
+    quello di entry; nello stesso bucket lo SL ha la precedenza (caso peggiorativo).
+    Uscite aggiuntive (trailing, break-even, time stop) via exit_model.
+    Con le barre a 1 minuto (prices["touch"]) entry e SL/TP sono ricerche del
+    primo tocco in O(log n) per riga invece di confronti su tutti i minuti.
+    """
+    side = SIDE[direction]
+    open_ = prices["open"]
+    entry = open_ * (1 + entry_pct / 100)
+    sl = open_ * (1 + sl_pct / 100)
+    tp = open_ * (1 + tp_pct / 100)
+
+    # ---- ENTRY BUCKET (minimo timeframe in cui l'entry viene raggiunta) ----
+    entry_tfs = prices["entry_tfs"]
+    touch = "touch" in prices
+    if touch:
+        # entry_high è un massimo progressivo: ricerca binaria per riga
+        first_entry = first_at_least_rows(prices["entry_high"], entry)
+        has_bucket = first_entry >= 0
+        entry_bucket = np.where(has_bucket, entry_tfs[first_entry], np.nan)
+    else:
+        hit_entry = prices["entry_high"] >= entry[:, None]
+        has_bucket = hit_entry.any(axis=1)
+        entry_bucket = np.where(has_bucket, entry_tfs[hit_entry.argmax(axis=1)], np.nan)
+
+    tf_idx = int(np.flatnonzero(entry_tfs == entry_tf)[0])
+    attivazione = prices["entry_high"][:, tf_idx] >= entry
+    active = attivazione & has_bucket
+
+    # ---- PRIMO BUCKET DI USCITA ----
+    exit_model = exit_model or {}
+    if touch and not (exit_model.get("trailing_pct") or exit_model.get("breakeven_pct")):
+        start = np.searchsorted(prices["exit_tfs"], np.nan_to_num(entry_bucket, nan=np.inf), side="right")
+        exits = _resolve_exits_touch(prices, start, active, sl, tp, exit_model, side)
+    else:
+        after = (prices["exit_tfs"][None, :] > entry_bucket[:, None]) & active[:, None]
+        exits = _resolve_exits(prices, entry[:, None], sl[:, None], tp[:, None], after, exit_model, side)
+
+    with np.errstate(divide="ignore", invalid="ignore"):
+        exit_price = np.where(exits["late"], entry, exits["exit_price"])
+        ret_pct = np.where(active, (exit_price - entry) / entry * 100, np.nan)
+
+    return {
+        "Entry_price": entry,
+        "SL_price": sl,
+        "TP_price": tp,
+        "attivazione": attivazione.astype(int),
+        "entry_bucket": entry_bucket,
+        "active": active,
+        "TP": exits["is_tp"].astype(int),
+        "SL": exits["is_sl"].astype(int),
+        "TP_90m%": ret_pct,
+        "Exit_reason": np.where(active, exits["exit_reason"], None),
+        "Ambiguo": (exits["ambiguous"] & active).astype(int),
+        "Side": np.full(len(open_), side),
+    }
+
+
+def simulate_sides(prices, params, entry_tf, exit_model=None):
+    """
+    Stessa simulazione per più direzioni sulle stesse matrici prezzi.
+    params = {direzione: (entry%, SL%, TP%)}; restituisce {direzione: sim}.
+    """
+    return {
+        direction: simulate_single(prices, *p, entry_tf, exit_model, direction)
+        for direction, p in params.items()
+    }
+
+
+def simulate_scale_in(prices, legs, sl_pct, tp_pct, entry_tf, exit_model=None, direction=SHORT):
+    """
+    Più livelli di ingresso: legs = [(entry%, frazione size), ...].
+    Ogni livello è eseguito se High_{entry_tf}m lo raggiunge; il suo bucket è il
+    primo timeframe in cui viene toccato. In ogni bucket la posizione comprende
+    i livelli eseguiti nei bucket precedenti; SL/TP sono in % dal prezzo medio
+    di quella posizione, SL prioritario nello stesso bucket.
+    Tutto su array (livelli x righe x bucket), nessun ciclo per riga.
+    """
+    side = SIDE[direction]
+    open_ = prices["open"]
+    entry_tfs = prices["entry_tfs"]
+    tf_idx = int(np.flatnonzero(entry_tfs == entry_tf)[0])
+
+    pcts = np.array([leg[0] for leg in legs], dtype=float)
+    fracs = np.array([leg[1] for leg in legs], dtype=float)
+    fracs = fracs / fracs.sum()
+
+    # ---- LIVELLI (livelli x righe) ----
+    levels = open_[None, :] * (1 + pcts[:, None] / 100)
+    hit_entry = prices["entry_high"][None, :, :] >= levels[:, :, None]
+    has_bucket = hit_entry.any(axis=2)
+    leg_bucket = np.where(has_bucket, entry_tfs[hit_entry.argmax(axis=2)], np.nan)
+    leg_filled = (prices["entry_high"][None, :, tf_idx] >= levels) & has_bucket
+
+    # ---- POSIZIONE PER BUCKET DI USCITA (livelli x righe x bucket) ----
+    in_pos = leg_filled[:, :, None] & (leg_bucket[:, :, None] < prices["exit_tfs"][None, None, :])
+    weight = fracs[:, None, None] * in_pos
+    size = weight.sum(axis=0)
+    with np.errstate(divide="ignore", invalid="ignore"):
+        avg = (weight * levels[:, :, None]).sum(axis=0) / size
+
+    exits = _resolve_exits(
+        prices, avg, avg * (1 + sl_pct / 100), avg * (1 + tp_pct / 100), size > 0, exit_model, side
+    )
+    hit, first = exits["hit"], exits["first"]
+    rows = np.arange(len(open_))
+
+    # posizione finale: al bucket di uscita, altrimenti tutti i livelli eseguiti
+    full_size = (fracs[:, None] * leg_filled).sum(axis=0)
+    with np.errstate(divide="ignore", invalid="ignore"):
+        full_avg = (fracs[:, None] * leg_filled * levels).sum(axis=0) / full_size
+    fill_frac = np.where(hit, size[rows, first], full_size)
+    entry = np.where(hit, avg[rows, first], full_avg)
+
+    sl = entry * (1 + sl_pct / 100)
+    tp = entry * (1 + tp_pct / 100)
+    attivazione = leg_filled.any(axis=0)
+
+    with np.errstate(divide="ignore", invalid="ignore"):
+        exit_price = np.where(exits["late"], entry, exits["exit_price"])
+        ret_pct = np.where(attivazione, (exit_price - entry) / entry * 100, np.nan)
+
+    return {
+        "Entry_price": entry,
+        "SL_price": sl,
+        "TP_price": tp,
+        "attivazione": attivazione.astype(int),
+        "entry_bucket": np.nanmin(np.where(leg_filled, leg_bucket, np.inf), axis=0),
+        "active": attivazione,
+        "TP": exits["is_tp"].astype(int),
+        "SL": exits["is_sl"].astype(int),
+        "TP_90m%": ret_pct,
+        "Fill_frac": np.where(attivazione, fill_frac, 0.0),
+        "Exit_reason": np.where(attivazione, exits["exit_reason"], None),
+        "Ambiguo": (exits["ambiguous"] & attivazione).astype(int),
+        "Side": np.full(len(open_), side),
+    }
+
+
+def apply_simulation(df, sim):
+    """Scrive i risultati della simulazione sulle colonne usate dalla pagina"""
+    df = df.copy()
+    for col in ["Entry_price", "SL_price", "TP_price", "attivazione", "entry_bucket", "TP", "SL", "TP_90m%"]:
+        df[col] = sim[col]
+    df["Fill_frac"] = sim.get("Fill_frac", 1.0)
+    df["Exit_reason"] = sim["Exit_reason"]
+    df["Side"] = sim.get("Side", SIDE[SHORT])
+    df["Ambiguo"] = sim.get("Ambiguo", 0)
+    df["Outcome"] = np.where(sim["SL"] == 1, "SL", np.where(sim["TP"] == 1, "TP", None))
+    return df
+
+# endregion
+
+
+# ========================================
+# region CALCOLO PNL PER TRADE
+# ========================================
+
+def r_multiple(sim):
+    """
+    R per trade (0 se non attivato): dipende solo da entry, stop e uscita,
+    non dal capitale, quindi si può calcolare per tutta la griglia.
+    Side (+1 short, -1 long) dà il verso del guadagno.
+    """
+    entry, sl, tp = sim["Entry_price"], sim["SL_price"], sim["TP_price"]
+    side = sim.get("Side", SIDE[SHORT])
+    stop_dist = np.abs(sl - entry)
+    ret = np.nan_to_num(sim["TP_90m%"], nan=0.0)
+
+    with np.errstate(divide="ignore", invalid="ignore"):
+        move = side * np.where(
+            sim["TP"] == 1, entry - tp,
+            np.where(sim["SL"] == 1, entry - sl, (-ret / 100) * entry)
+        )
+        r = np.where((sim["attivazione"] == 1) & (stop_dist != 0), move / stop_dist, 0.0)
+    # scale-in: solo la frazione di size effettivamente eseguita
+    return r * sim.get("Fill_frac", 1.0)
+
+
+def calculate_trade_pnl(df, initial_capital=10000, risk_pct=1):
+    """PnL $ e R multiple per trade, rischio fisso sul capitale iniziale"""
+    df = df.copy()
+    risk_amount = initial_capital * (risk_pct / 100)
+
+    cols = ["Entry_price", "SL_price", "TP_price", "TP", "SL", "TP_90m%", "attivazione", "Fill_frac", "Side"]
+    r = r_multiple({col: df[col].to_numpy(dtype=float) for col in cols if col in df.columns})
+
+    df["PnL_$"] = r * risk_amount
+    df["R_multiple"] = r if risk_amount != 0 else 0.0
+    return df
+
+# endregion
+
+
+# ========================================
+# region GRIGLIA PARAMETRI
+# ========================================
+
+def param_grid(entry_values, sl_values, tp_values):
+    """Tutte le combinazioni (entry%, SL%, TP%) come array (n_combo x 3)"""
+    e, s, t = np.meshgrid(entry_values, sl_values, tp_values, indexing="ij")
+    return np.column_stack([e.ravel(), s.ravel(), t.ravel()])
+
+
+def evaluate_grid(prices, grid, entry_tf, exit_model=None, direction=SHORT,
+                  costs=None, initial_capital=10000, risk_pct=1):
+    """
+    Matrici R e attivazione (n_combo x righe) per tutta la griglia,
+    riusando le stesse matrici prezzi. Stessi direzione e modello di uscita
+    della simulazione della pagina (per il long %SL < 0 e %TP > 0).
+    Con costs (cost_model) R al netto dei costi, come la simulazione della pagina.
+    """
+    n = len(prices["open"])
+    r = np.empty((len(grid), n))
+    active = np.empty((len(grid), n), dtype=bool)
+    for i, (entry_pct, sl_pct, tp_pct) in enumerate(grid):
+        sim = simulate_single(prices, entry_pct, sl_pct, tp_pct, entry_tf, exit_model, direction)
+        r[i] = r_multiple(sim) - cost_r(sim, costs, initial_capital, risk_pct)
+        active[i] = sim["attivazione"] == 1
+    return r, active
+
+# endregion
+
+
+# ========================================
+# region STATISTICHE PER SCENARIO
+# ========================================
+
+def scenario_stats(r, taken, labels, risk_amount):
+    """
+    Trade, winrate, R totale, expectancy e profit per scenario.
+    taken: maschera (scenari x righe) dei trade presi; r: vettore R per riga
+    comune a tutti gli scenari oppure matrice (scenari x righe).
+    """
+    taken = np.asarray(taken, dtype=float)
+    r = np.broadcast_to(r, taken.shape)
+
+    trades = taken.sum(axis=1)
+    total_r = (taken * r).sum(axis=1)
+    wins = (taken * (r > 0)).sum(axis=1)
+
+    with np.errstate(divide="ignore", invalid="ignore"):
+        winrate = np.where(trades > 0, wins / trades * 100, np.nan)
+        expectancy = np.where(trades > 0, total_r / trades, np.nan)
+
+    return pd.DataFrame({
+        "Scenario": labels,
+        "Trade": trades.astype(int),
+        "Winrate %": winrate,
+        "R totale": total_r,
+        "Expectancy (R)": expectancy,
+        "Profit $": total_r * risk_amount,
+    })
+
+# endregion
+
+
+# ========================================
+# region SWEEP MODELLI DI USCITA
+# ========================================
+
+EXIT_PARAMS = {
+    "Trailing stop %": "trailing_pct",
+    "Break-even %": "breakeven_pct",
+    "Time stop (min)": "time_stop_tf",
+    "Ambiguità SL/TP": "ambiguity",
+}
+
+
+def sweep_exit_models(simulate, base_model, param, values, risk_amount):
+    """
+    Varia un solo parametro del modello di uscita (gli altri restano quelli di
+    base_model). simulate(exit_model) -> sim; le matrici prezzi sono riusate.
+    """
+    r, taken, reasons = [], [], []
+    for value in values:
+        sim = simulate({**(base_model or {}), param: value})
+        r.append(r_multiple(sim))
+        taken.append(sim["attivazione"] == 1)
+        reasons.append(pd.Series(sim["Exit_reason"]).value_counts())
+
+    stats = scenario_stats(np.vstack(r), np.vstack(taken), list(values), risk_amount)
+    stats = stats.rename(columns={"Scenario": param})
+    counts = pd.DataFrame(reasons).fillna(0).astype(int).reset_index(drop=True)
+    return pd.concat([stats, counts], axis=1)
+
+# endregion
+
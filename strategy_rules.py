@@ -0,0 +1,100 @@
+import re
+import pandas as pd
+import numpy as np
+
+from strategy_engine import scenario_stats
+
+
+# ================================================
+# region COMPILAZIONE REGOLE
+# ================================================
+
+_OPS = {
+    "<=": np.less_equal,
+    ">=": np.greater_equal,
+    "==": np.equal,
+    "!=": np.not_equal,
+    "<": np.less,
+    ">": np.greater,
+}
+
+_CONDITION = re.compile(r"^\s*(.+?)\s*(<=|>=|==|!=|<|>)\s*(-?\d+(?:[.,]\d+)?)\s*$")
+
+
+def _split(text, word):
+    return re.split(rf"\s+{word}\s+", text.strip(), flags=re.IGNORECASE)
+
+
+def compile_rule(rule, columns):
+    """
+    Compila una regola tipo "Open_vs_PMH_% < -10 and Vol5_vs_PM_% > 50"
+    in una funzione df -> maschera booleana (numpy).
+    Condizioni "colonna operatore numero" unite da and / or (and ha la precedenza).
+    Valori mancanti -> condizione falsa. Errori di sintassi -> ValueError.
+    """
+    clauses = []
+    for part in _split(rule, "or"):
+        conditions = []
+        for cond in _split(part, "and"):
+            match = _CONDITION.match(cond)
+            if not match:
+                raise ValueError(f"Condizione non valida: '{cond}'")
+            col, op, value = match.groups()
+            if col not in columns:
+                raise ValueError(f"Colonna sconosciuta: '{col}'")
+            conditions.append((col, _OPS[op], float(value.replace(",", "."))))
+        clauses.append(conditions)
+
+    def mask(df):
+        out = np.zeros(len(df), dtype=bool)
+        for conditions in clauses:
+            clause = np.ones(len(df), dtype=bool)
+            for col, op, value in conditions:
+                values = pd.to_numeric(df[col], errors="coerce").to_numpy(dtype=float)
+                with np.errstate(invalid="ignore"):
+                    clause &= op(values, value)
+            out |= clause
+        return out
+
+    return mask
+
+
+def parse_rules(text):
+    """Una regola per riga; righe vuote e commenti (#) ignorati"""
+    return [
+        line.strip() for line in text.splitlines()
+        if line.strip() and not line.strip().startswith("#")
+    ]
+
+
+def rule_masks(df, rules):
+    """Maschere (n_regole x righe) di tutte le regole, nell'ordine dato"""
+    masks = np.empty((len(rules), len(df)), dtype=bool)
+    for i, rule in enumerate(rules):
+        masks[i] = compile_rule(rule, df.columns)(df)
+    return masks
+
+# endregion
+
+
+# ================================================
+# region CONFRONTO CON / SENZA REGOLE
+# ================================================
+
+def rule_comparison(r, active, masks, rules, risk_amount):
+    """
+    Statistiche della strategia senza regole, con ogni regola da sola e con
+    tutte le regole, in un solo passaggio: maschere (scenari x righe) per
+    vettori R / attivazione.
+    """
+    n = len(r)
+    scenarios = np.vstack([
+        np.ones(n, dtype=bool),
+        masks,
+        masks.all(axis=0) if len(masks) else np.ones(n, dtype=bool),
+    ])
+    labels = ["Nessuna regola"] + list(rules) + ["Tutte le regole"]
+
+    return scenario_stats(r, scenarios & active[None, :], labels, risk_amount)
+
+# endregion
@@ -0,0 +1,142 @@
+import numpy as np
+import pandas as pd
+import pytest
+
+from strategy_engine import (
+    build_prices, build_touch_index, simulate_single, simulate_scale_in, ENTRY_TFS, EXIT_TFS, MODE_90M,
+    AMBIGUITY_PROB, MARKET_OPEN_SEC,
+)
+
+
+def _sheet(high_by_tf, open_=10.0, close_by_tf=None):
+    """Una riga del foglio: High_{tf}m dati, Low_{tf}m = open, Close_{tf}m dati (default open)"""
+    close_by_tf = close_by_tf or {}
+    row = {"Open": open_, "Close_90m": close_by_tf.get(90, open_), "TimeHigh_sec": np.nan}
+    for tf in ENTRY_TFS:
+        row[f"High_{tf}m"] = high_by_tf.get(tf, open_)
+        row[f"Low_{tf}m"] = open_
+        row[f"Close_{tf}m"] = close_by_tf.get(tf, open_)
+    return pd.DataFrame([row])
+
+
+def _late_entry_prices():
+    # entry 11.5 raggiunta solo nel bucket 60; Close_30m = 9.2 (prima dell'ingresso)
+    highs = {tf: (12.0 if tf >= 60 else 10.5) for tf in ENTRY_TFS}
+    return build_prices(_sheet(highs, close_by_tf={30: 9.2, 60: 11.6}), MODE_90M)
+
+
+@pytest.mark.parametrize("time_stop_tf", [30, 60])
+def test_time_stop_at_or_before_entry_bucket_is_flat(time_stop_tf):
+    sim = simulate_single(_late_entry_prices(), 15, 30, -15, 60, {"time_stop_tf": time_stop_tf})
+
+    assert sim["attivazione"][0] == 1
+    assert sim["entry_bucket"][0] == 60
+    assert sim["Exit_reason"][0] == "TIME"
+    assert sim["TP_90m%"][0] == 0
+
+
+def test_time_stop_after_entry_bucket_uses_its_close():
+    sim = simulate_single(_late_entry_prices(), 15, 30, -15, 60, {"time_stop_tf": 90})
+
+    assert sim["Exit_reason"][0] == "TIME"
+    assert sim["TP_90m%"][0] == pytest.approx((10.0 - 11.5) / 11.5 * 100)
+
+
+def test_scale_in_time_stop_before_entry_is_flat():
+    sim = simulate_scale_in(_late_entry_prices(), [(15, 0.5), (18, 0.5)], 30, -15, 60, {"time_stop_tf": 30})
+
+    assert sim["attivazione"][0] == 1
+    assert sim["TP_90m%"][0] == 0
+
+
+def test_minute_touch_path_time_stop_before_entry_is_flat():
+    # 90 minuti: entry 11.5 toccata al minuto 40, time stop a 30
+    high = np.full((1, 90), 10.5)
+    high[0, 39:] = 12.0
+    low = np.full((1, 90), 10.0)
+    close = np.full((1, 90), 10.0)
+    close[0, 29] = 9.2
+    entry_high = np.full((1, 240), 12.0)
+    entry_high[0, :39] = 10.5
+    prices = {
+        "mode": MODE_90M,
+        "open": np.array([10.0]),
+        "entry_tfs": np.arange(1, 241, dtype=float),
+        "entry_high": entry_high,
+        "exit_tfs": np.arange(1, 91, dtype=float),
+        "exit_high": high,
+        "exit_low": low,
+        "exit_close": close[:, -1],
+        "exit_close_tf": close,
+        "time_high_min": np.array([np.nan]),
+    }
+    dense = simulate_single(prices, 15, 30, -15, 60, {"time_stop_tf": 30})
+    touch = simulate_single({**prices, "touch": build_touch_index(high, low)}, 15, 30, -15, 60, {"time_stop_tf": 30})
+
+    for sim in (dense, touch):
+        assert sim["Exit_reason"][0] == "TIME"
+        assert sim["TP_90m%"][0] == 0
+
+
+# stop e TP nello stesso bucket, l'estrazione dice sempre "TP prima"
+PROB_TP_FIRST = {"ambiguity": AMBIGUITY_PROB, "sl_first_prob": 0.0}
+
+
+def _ambiguous_bucket_prices(time_high_sec, time_low_sec):
+    # entry 11.5 nel bucket 1, nel bucket 5 toccati sia stop (13) sia TP (8.5)
+    prices = build_prices(_sheet({tf: (15.0 if tf >= 5 else 11.6) for tf in ENTRY_TFS}), MODE_90M)
+    prices["exit_low"] = prices["exit_low"].copy()
+    prices["exit_low"][:, 1:] = 8.0
+    prices["time_high_min"] = np.array([(time_high_sec - MARKET_OPEN_SEC) / 60])
+    prices["time_low_min"] = np.array([(time_low_sec - MARKET_OPEN_SEC) / 60])
+    return prices
+
+
+@pytest.mark.parametrize("time_high_sec, time_low_sec, reason", [
+    # 9:31:00 è il primo minuto del bucket 5m, massimo prima del minimo
+    (MARKET_OPEN_SEC + 60, MARKET_OPEN_SEC + 180, "SL"),
+    # minimo prima del massimo: nessuna informazione sull'ordine, resta l'estrazione
+    (MARKET_OPEN_SEC + 180, MARKET_OPEN_SEC + 60, "TP"),
+    # 9:35 appartiene al bucket 15m
+    (MARKET_OPEN_SEC + 60, MARKET_OPEN_SEC + 300, "TP"),
+    # senza TimeLow resta l'estrazione
+    (MARKET_OPEN_SEC + 60, np.nan, "TP"),
+])
+def test_bucket_high_before_low_resolves_ambiguity(time_high_sec, time_low_sec, reason):
+    sim = simulate_single(_ambiguous_bucket_prices(time_high_sec, time_low_sec), 15, 30, -15, 60, PROB_TP_FIRST)
+
+    assert sim["entry_bucket"][0] == 1
+    assert sim["Exit_reason"][0] == reason
+
+
+@pytest.mark.parametrize("time_high_min, time_low_min, reason", [
+    (5.2, 5.7, "SL"),
+    (5.7, 5.2, "TP"),
+    (5.2, 6.0, "TP"),
+])
+def test_minute_high_before_low_resolves_ambiguity(time_high_min, time_low_min, reason):
+    # entry 11.5 al minuto 0, stop e TP entrambi nella barra del minuto 5 ([5, 6))
+    high = np.full((1, 90), 11.0)
+    high[0, 0] = 11.6
+    high[0, 5] = 15.0
+    low = np.full((1, 90), 10.0)
+    low[0, 5] = 8.0
+    close = np.full((1, 90), 10.0)
+    prices = {
+        "mode": MODE_90M,
+        "open": np.array([10.0]),
+        "entry_tfs": np.arange(1, 241, dtype=float),
+        "entry_high": np.full((1, 240), 11.6),
+        "exit_tfs": np.arange(1, 91, dtype=float),
+        "exit_high": high,
+        "exit_low": low,
+        "exit_close": close[:, -1],
+        "exit_close_tf": close,
+        "time_high_min": np.array([time_high_min]),
+        "time_low_min": np.array([time_low_min]),
+    }
+    dense = simulate_single(prices, 15, 30, -15, 60, PROB_TP_FIRST)
+    touch = simulate_single({**prices, "touch": build_touch_index(high, low)}, 15, 30, -15, 60, PROB_TP_FIRST)
+
+    for sim in (dense, touch):
+        assert sim["Exit_reason"][0] == reason
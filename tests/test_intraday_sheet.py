@@ -0,0 +1,83 @@
+import os
+import time
+from io import BytesIO, StringIO
+
+import numpy as np
+import pandas as pd
+import pytest
+
+from backtest import read_intraday_csv, clean_intraday
+import data_loader
+from data_loader import parse_intraday_sheet, download_tab, PARQUET_MAGIC
+
+
+# export csv di Google Sheets in formato italiano
+IT_CSV = """Date,Ticker,Gap%,Open,High,Low,Close,Volume,Market Cap,TimeHigh,High_60m,Low_60m,Close_60m
+02/01/2024,ABC,"85,5","3,45","4,10","3,01","3,20",1.234.567,45.000.000,09:41:00,"3,90","3,10","3,50"
+13/01/2024,XYZ,"120,25","12,00","15,75","11,50","11,80",987.654,"",10:05:00,"14,20","11,60","13,00"
+"""
+
+
+def test_read_intraday_csv_italian_format():
+    df = read_intraday_csv(StringIO(IT_CSV), it_format=True)
+
+    assert pd.api.types.is_datetime64_any_dtype(df["Date"])
+    # dd/mm/yyyy: 13/01 non diventa una data invalida, 02/01 è il 2 gennaio
+    assert list(df["Date"]) == [pd.Timestamp("2024-01-02"), pd.Timestamp("2024-01-13")]
+    assert df["Open"].tolist() == [3.45, 12.0]
+    assert df["Gap%"].tolist() == [85.5, 120.25]
+    assert df["Volume"].tolist() == [1234567.0, 987654.0]
+    assert df["Market Cap"].iloc[0] == 45_000_000
+    assert np.isnan(df["Market Cap"].iloc[1])
+    assert df["High_60m"].dtype == "float64"
+    assert df["Ticker"].tolist() == ["ABC", "XYZ"]
+
+
+def test_parse_intraday_sheet_reads_parquet_snapshot():
+    pytest.importorskip("pyarrow")
+    snapshot = clean_intraday(read_intraday_csv(StringIO(IT_CSV), it_format=True))
+    buf = BytesIO()
+    snapshot.to_parquet(buf, index=False)
+    raw = buf.getvalue()
+    assert raw[:4] == PARQUET_MAGIC
+
+    df = parse_intraday_sheet(raw)
+
+    assert len(df) == 2
+    assert df["Open"].tolist() == [3.45, 12.0]
+    assert "quality" in df.attrs
+    assert "Envelope_fix" in df.columns
+
+
+def _snapshot(tmp_path, monkeypatch, age):
+    path = tmp_path / "scarico_intraday.parquet"
+    path.write_bytes(b"old")
+    mtime = time.time() - age
+    os.utime(path, (mtime, mtime))
+    monkeypatch.setattr(data_loader, "INTRADAY_SNAPSHOT", str(path))
+    return path
+
+
+def test_fresh_snapshot_is_served_without_download(tmp_path, monkeypatch):
+    _snapshot(tmp_path, monkeypatch, age=0)
+    monkeypatch.setattr(data_loader, "save_intraday_snapshot", lambda *args, **kw: pytest.fail("download"))
+
+    assert download_tab("intraday") == b"old"
+
+
+def test_expired_snapshot_is_rewritten_from_sheet(tmp_path, monkeypatch):
+    path = _snapshot(tmp_path, monkeypatch, age=data_loader.SHEET_TTL)
+    monkeypatch.setattr(data_loader, "save_intraday_snapshot", lambda *args, **kw: path.write_bytes(b"new"))
+
+    assert download_tab("intraday") == b"new"
+
+
+def test_expired_snapshot_kept_when_download_fails(tmp_path, monkeypatch):
+    _snapshot(tmp_path, monkeypatch, age=data_loader.SHEET_TTL)
+
+    def fail(*args, **kw):
+        raise OSError("sheet down")
+
+    monkeypatch.setattr(data_loader, "save_intraday_snapshot", fail)
+
+    assert download_tab("intraday") == b"old"
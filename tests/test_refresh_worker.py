@@ -0,0 +1,110 @@
+import pytest
+
+import refresh_worker
+from refresh_worker import new_worker, get, refresh_due
+
+
+def _clock(start=0.0):
+    """Orologio finto: now["t"] avanzato a mano dai test"""
+    now = {"t": start}
+    return now, lambda: now["t"]
+
+
+def _fetcher(*values):
+    """Restituisce values in ordine; un'eccezione nella lista viene sollevata"""
+    calls = {"n": 0}
+
+    def fetch():
+        value = values[min(calls["n"], len(values) - 1)]
+        calls["n"] += 1
+        if isinstance(value, Exception):
+            raise value
+        return value
+
+    return calls, fetch
+
+
+def test_snapshot_cached_within_ttl():
+    now, clock = _clock()
+    worker = new_worker(ttl=100, clock=clock)
+    calls, fetch = _fetcher("v1", "v2")
+
+    assert get(worker, "k", fetch) == "v1"
+    now["t"] = 99
+    assert get(worker, "k", fetch) == "v1"
+    assert calls["n"] == 1
+
+
+def test_worker_refreshes_ahead_of_expiry():
+    now, clock = _clock()
+    worker = new_worker(ttl=100, clock=clock)
+    calls, fetch = _fetcher("v1", "v2")
+    get(worker, "k", fetch)
+
+    now["t"] = 100 * refresh_worker.REFRESH_AHEAD - 1
+    assert refresh_due(worker) == []
+
+    now["t"] = 100 * refresh_worker.REFRESH_AHEAD
+    assert refresh_due(worker) == ["k"]
+    # il lettore trova lo snapshot nuovo senza scaricare
+    assert get(worker, "k", fetch) == "v2"
+    assert calls["n"] == 2
+
+
+def test_expired_snapshot_fetched_inline():
+    now, clock = _clock()
+    worker = new_worker(ttl=100, clock=clock)
+    calls, fetch = _fetcher("v1", "v2")
+    get(worker, "k", fetch)
+
+    now["t"] = 100
+    assert get(worker, "k", fetch) == "v2"
+    assert calls["n"] == 2
+
+
+def test_failed_refresh_serves_stale_snapshot():
+    now, clock = _clock()
+    worker = new_worker(ttl=100, clock=clock)
+    calls, fetch = _fetcher("v1", RuntimeError("sheet down"), "v3")
+    get(worker, "k", fetch)
+
+    now["t"] = 90
+    assert refresh_due(worker) == []
+    assert worker["errors"] == {"k": "sheet down"}
+
+    now["t"] = 150
+    assert get(worker, "k", fetch) == "v3"
+    assert worker["errors"] == {}
+
+
+def test_failed_inline_fetch_serves_stale_snapshot():
+    now, clock = _clock()
+    worker = new_worker(ttl=100, clock=clock)
+    _, fetch = _fetcher("v1", RuntimeError("sheet down"))
+    get(worker, "k", fetch)
+
+    now["t"] = 200
+    assert get(worker, "k", fetch) == "v1"
+    assert worker["errors"] == {"k": "sheet down"}
+
+
+def test_first_fetch_error_is_raised():
+    _, clock = _clock()
+    worker = new_worker(ttl=100, clock=clock)
+    _, fetch = _fetcher(RuntimeError("sheet down"))
+
+    with pytest.raises(RuntimeError):
+        get(worker, "k", fetch)
+    assert worker["entries"] == {}
+
+
+def test_idle_snapshot_evicted():
+    now, clock = _clock()
+    worker = new_worker(ttl=100, clock=clock, idle_evict=500)
+    calls, fetch = _fetcher("v1", "v2")
+    get(worker, "k", fetch)
+
+    now["t"] = 501
+    assert refresh_due(worker) == []
+    assert "k" not in worker["entries"]
+    assert calls["n"] == 1
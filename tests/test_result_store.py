@@ -0,0 +1,39 @@
+import numpy as np
+import pandas as pd
+
+from result_store import load_results, results_match, save_run
+
+
+def _results():
+    df = pd.DataFrame({
+        "Date": pd.to_datetime(["2024-01-02", "2024-01-02", "2024-01-03"]),
+        "Ticker": ["AAA", "BBB", "AAA"],
+        "attivazione": [1, 0, 1],
+        "PnL_$": [12.5, 0.0, -30.0],
+    }, index=[4, 7, 9])
+    return df
+
+
+def test_saved_results_roundtrip_and_match(tmp_path):
+    path = str(tmp_path / "runs.sqlite")
+    df = _results()
+    save_run("abc", {"mode": "90 minuti"}, "v1", df, {"n_trades": 2}, path=path)
+
+    stored = load_results("abc", path=path)
+    assert results_match(stored, df)
+    assert np.allclose(stored["PnL_$"], df["PnL_$"])
+    assert load_results("missing", path=path) is None
+
+
+def test_results_with_same_length_but_other_rows_do_not_match(tmp_path):
+    path = str(tmp_path / "runs.sqlite")
+    df = _results()
+    save_run("abc", {}, "v1", df, {}, path=path)
+    stored = load_results("abc", path=path)
+
+    other_ticker = df.assign(Ticker=["AAA", "CCC", "AAA"])
+    other_index = df.set_axis([1, 2, 3])
+    assert not results_match(stored, other_ticker)
+    assert not results_match(stored, other_index)
+    assert not results_match(None, df)
+
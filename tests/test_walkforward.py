@@ -0,0 +1,45 @@
+import numpy as np
+
+from benchmarks.synthetic_data import intraday_sheet
+from backtest import clean_intraday, config_prices, trade_pnl, DEFAULT_CONFIG
+from strategy_engine import add_pretrade_features, evaluate_grid, repair_envelope
+from walkforward import walk_forward
+
+COSTS = {
+    "commission_per_share": 0.005,
+    "min_ticket": 1.0,
+    "slippage_pct": 0.1,
+    "borrow_pct": 2.0,
+    "borrow_mode": "per trade",
+}
+
+
+def _sheet():
+    return add_pretrade_features(repair_envelope(clean_intraday(intraday_sheet(400, 0))))
+
+
+def test_grid_r_net_of_costs_matches_page_simulation():
+    df = _sheet()
+    config = {**DEFAULT_CONFIG, "costs": COSTS}
+    prices = config_prices(df, config)
+
+    r, active = evaluate_grid(
+        prices, np.array([config["short"]]), config["entry_tf"], config.get("exit_model"), config["direction"],
+        COSTS, config["initial_capital"], config["risk_pct"],
+    )
+
+    assert active.sum() > 0
+    assert np.allclose(r[0], trade_pnl(df, config, prices)["R_multiple"].to_numpy())
+
+
+def test_walk_forward_oos_r_is_net_of_costs():
+    df = _sheet()
+    prices = config_prices(df, DEFAULT_CONFIG)
+    grid = np.array([[15.0, 30.0, -15.0], [10.0, 30.0, -20.0]])
+    args = (prices, df["Date"].to_numpy(), grid, 60, 20, 10)
+
+    _, gross = walk_forward(*args, min_trades=1)
+    _, net = walk_forward(*args, min_trades=1, costs=COSTS, initial_capital=3000, risk_pct=2)
+
+    assert len(net) > 0
+    assert net["R_multiple"].sum() < gross["R_multiple"].sum()
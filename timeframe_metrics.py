@@ -0,0 +1,89 @@
+import pandas as pd
+import numpy as np
+
+
+# timeframe (minuti) mostrati nel grafico intraday
+INTRADAY_TFS = [15, 30, 60]
+
+
+# -------------------------------------------------
+# region MATRICI TIMEFRAME
+# -------------------------------------------------
+
+def tf_columns(prefix, timeframes):
+    """Nomi colonna per timeframe, es. ('High', [15, 30]) -> ['High_15m', 'High_30m']"""
+    return [f"{prefix}_{tf}m" for tf in timeframes]
+
+
+def tf_matrix(df, prefix, timeframes):
+    """Matrice (righe x timeframe) delle colonne {prefix}_{tf}m; colonne mancanti -> NaN"""
+    return df.reindex(columns=tf_columns(prefix, timeframes)).to_numpy(dtype=float)
+
+
+def relative_metrics(open_, highs, lows, pm_high):
+    """
+    %High, %Low rispetto all'open e break PMH per tutti i timeframe
+    in un solo broadcast (open_ e pm_high: vettori per riga).
+    """
+    base = open_[:, None]
+    with np.errstate(divide="ignore", invalid="ignore"):
+        oh = (highs - base) / base * 100
+        ol = (lows - base) / base * 100
+    brk = (highs >= pm_high[:, None]).astype(int)
+    return oh, ol, brk
+
+
+def add_tf_metrics(df, timeframes=INTRADAY_TFS, open_col="OPEN", pm_col="PM_high"):
+    """Aggiunge oh_{tf}m, ol_{tf}m, break_pmh_{tf}m calcolati sulle matrici timeframe"""
+    pm_high = (
+        df[pm_col].to_numpy(dtype=float)
+        if pm_col in df.columns else np.full(len(df), np.nan)
+    )
+
+    oh, ol, brk = relative_metrics(
+        df[open_col].to_numpy(dtype=float),
+        tf_matrix(df, "High", timeframes),
+        tf_matrix(df, "Low", timeframes),
+        pm_high,
+    )
+
+    metrics = pd.concat([
+        pd.DataFrame(oh, columns=tf_columns("oh", timeframes), index=df.index),
+        pd.DataFrame(ol, columns=tf_columns("ol", timeframes), index=df.index),
+        pd.DataFrame(brk, columns=tf_columns("break_pmh", timeframes), index=df.index),
+    ], axis=1)
+
+    out = pd.concat([df.drop(columns=metrics.columns, errors="ignore"), metrics], axis=1)
+    # concat perde attrs (report qualità del foglio)
+    out.attrs = dict(df.attrs)
+    return out
+
+# endregion
+
+
+# -------------------------------------------------
+# region MEDIE PER GRUPPO
+# -------------------------------------------------
+
+def grouped_means(df, cols, by="Chiusura", groups=("RED", "GREEN")):
+    """
+    Medie di più colonne per Totale e per gruppo (default RED / GREEN)
+    in una sola chiamata: maschere di gruppo x valori, NaN/inf esclusi.
+    """
+    values = df[cols].to_numpy(dtype=float)
+    valid = np.isfinite(values)
+
+    labels = df[by].to_numpy()
+    masks = np.vstack(
+        [np.ones(len(df), dtype=bool)] + [labels == g for g in groups]
+    ).astype(float)
+
+    sums = masks @ np.where(valid, values, 0.0)
+    counts = masks @ valid.astype(float)
+
+    with np.errstate(divide="ignore", invalid="ignore"):
+        means = sums / counts
+
+    return pd.DataFrame(means, index=["Totale", *groups], columns=cols)
+
+# endregion
@@ -1,14 +1,19 @@
 import streamlit as st
+import pandas as pd
+
+from data_quality import quality_report
 
 # ===========================
 # Funzione builder KPI flessibile
 # ===========================
 def build_kpi(title, total, red, green, 
               total_med=None, red_med=None, green_med=None, 
-              suffix="%", show_bar=True):
+              suffix="%", show_bar=True,
+              total_ci=None, red_ci=None, green_ci=None):
     """
     Restituisce un dizionario KPI uniforme, pronto per la dashboard.
     Mediane opzionali: se None, verranno mostrate vuote.
+    Intervalli di confidenza opzionali come coppie (lo, hi).
     """
     return {
         "title": title,
@@ -19,7 +24,10 @@ def build_kpi(title, total, red, green,
         "green": green,
         "green_med": green_med,
         "suffix": suffix,
-        "show_bar": show_bar
+        "show_bar": show_bar,
+        "total_ci": total_ci,
+        "red_ci": red_ci,
+        "green_ci": green_ci
     }
 
 # -------------------------------
@@ -44,6 +52,15 @@ def kpi_box_statual(kpi, invert_negative=False):
     green = kpi["green"]
     suffix = kpi.get("suffix", "")
 
+    def fmt_ci(ci):
+        # intervallo di confidenza piccolo sotto il valore (vuoto se assente)
+        if ci is None:
+            return ""
+        return (
+            '<div style="font-size:11px; opacity:0.5; font-variant-numeric: tabular-nums;">'
+            f'IC {fmt(ci[0])} – {fmt(ci[1])}{suffix}</div>'
+        )
+
     total_med = total if kpi.get("total_med") is None else kpi.get("total_med")
     red_med   = red   if kpi.get("red_med")   is None else kpi.get("red_med")
     green_med = green if kpi.get("green_med") is None else kpi.get("green_med")
@@ -123,6 +140,7 @@ def kpi_box_statual(kpi, invert_negative=False):
                 <div style="font-size:18px; opacity:0.7; font-variant-numeric: tabular-nums;">
                     {fmt(total_med)}{suffix}
                 </div>
+                {fmt_ci(kpi.get("total_ci"))}
             </div>
             <div style="text-align:right;">
                 <div style="font-size:18px; font-weight:600; color:#E74C3C;">
@@ -131,12 +149,14 @@ def kpi_box_statual(kpi, invert_negative=False):
                         || {fmt(red_med)}{suffix}
                     </span>
                 </div>
+                {fmt_ci(kpi.get("red_ci"))}
                 <div style="font-size:18px; font-weight:600; color:#2ECC71;">
                     {fmt(green)}{suffix}
                     <span style="font-size:14px; opacity:0.7; font-variant-numeric: tabular-nums;">
                         || {fmt(green_med)}{suffix}
                     </span>
                 </div>
+                {fmt_ci(kpi.get("green_ci"))}
             </div>
         </div>
         <div style="width:100%; margin-top:10px;">
@@ -145,4 +165,31 @@ def kpi_box_statual(kpi, invert_negative=False):
     </div>
     """
 
-    st.markdown(html, unsafe_allow_html=True)
\ No newline at end of file
+    st.markdown(html, unsafe_allow_html=True)
+
+# endregion
+
+
+# -------------------------------------------------
+# region RIEPILOGO
+# -------------------------------------------------
+
+def render_quality_summary(df):
+    """Solo conteggi: avviso se qualche controllo fallisce, dettaglio in un expander chiuso"""
+    report = quality_report(df)
+    if not report:
+        return
+
+    issues = {k: v for k, v in report.items() if k != "Righe" and v}
+    if not issues:
+        return
+
+    st.warning(f"⚠️ Controllo dati: {len(issues)} controlli con anomalie su {report['Righe']} righe")
+    with st.expander("🛠️ Controllo dati"):
+        st.dataframe(
+            pd.DataFrame({"Controllo": list(issues), "Righe": list(issues.values())}),
+            use_container_width=True,
+            hide_index=True,
+        )
+
+# endregion
@@ -0,0 +1,138 @@
+import multiprocessing
+import pandas as pd
+import numpy as np
+from concurrent.futures import ProcessPoolExecutor
+
+from strategy_engine import evaluate_grid, build_touch_index, SHORT
+
+
+OBJECTIVES = {
+    "R totale": "total_r",
+    "Expectancy (R medio)": "expectancy",
+}
+
+
+# ========================================
+# region GRIGLIA IN PARALLELO
+# ========================================
+
+_PRICES = None
+
+
+def _init_worker(prices):
+    # le matrici prezzi arrivano una sola volta per processo
+    global _PRICES
+    if prices.get("touch") is False:
+        # indice del primo tocco ricostruito qui: non viaggia nel pickle
+        prices = {**prices, "touch": build_touch_index(prices["exit_high"], prices["exit_low"])}
+    _PRICES = prices
+
+
+def _eval_chunk(grid_chunk, entry_tf, exit_model, direction, cost_args):
+    return evaluate_grid(_PRICES, grid_chunk, entry_tf, exit_model, direction, *cost_args)
+
+
+def grid_results(prices, grid, entry_tf, workers=1, exit_model=None, direction=SHORT,
+                 costs=None, initial_capital=10000, risk_pct=1):
+    """evaluate_grid distribuita su più processi (blocchi di combinazioni)"""
+    cost_args = (costs, initial_capital, risk_pct)
+    if workers <= 1 or len(grid) < 2 * workers:
+        return evaluate_grid(prices, grid, entry_tf, exit_model, direction, *cost_args)
+
+    chunks = np.array_split(grid, workers * 2)
+    n = len(chunks)
+    if "touch" in prices:
+        prices = {**prices, "touch": False}
+    # spawn: niente fork dentro un processo con thread (server Streamlit)
+    context = multiprocessing.get_context("spawn")
+    with ProcessPoolExecutor(max_workers=workers, mp_context=context,
+                             initializer=_init_worker, initargs=(prices,)) as pool:
+        parts = list(pool.map(_eval_chunk, chunks, [entry_tf] * n, [exit_model] * n, [direction] * n, [cost_args] * n))
+
+    return np.vstack([p[0] for p in parts]), np.vstack([p[1] for p in parts])
+
+# endregion
+
+
+# ========================================
+# region WALK-FORWARD
+# ========================================
+
+def rolling_windows(n_days, train_days, test_days):
+    """Finestre (train, test) su indici di giornata; il test avanza di test_days"""
+    start = 0
+    while start + train_days < n_days:
+        train = (start, start + train_days)
+        test = (start + train_days, min(start + train_days + test_days, n_days))
+        yield train, test
+        start += test_days
+
+
+def walk_forward(prices, dates, grid, entry_tf, train_days, test_days,
+                 objective="total_r", min_trades=5, workers=1, exit_model=None, direction=SHORT,
+                 costs=None, initial_capital=10000, risk_pct=1):
+    """
+    Walk-forward su finestre mobili: per ogni finestra di train sceglie la
+    combinazione migliore della griglia e la applica alla finestra di test
+    successiva. direction / exit_model come la simulazione della pagina; con
+    costs (più capitale e rischio) R al netto dei costi sia in train sia
+    out-of-sample. La griglia si valuta una sola volta su tutte le righe; le
+    finestre sono differenze di somme cumulate per giornata.
+    workers > 1: griglia su un pool di processi (ogni processo riceve una copia di prices).
+    Restituisce (statistiche per finestra, trade out-of-sample in ordine di data).
+    """
+    dates = pd.to_datetime(pd.Series(dates)).to_numpy()
+    valid = ~pd.isna(dates)
+    rows = np.flatnonzero(valid)
+    rows = rows[np.argsort(dates[rows], kind="stable")]
+
+    r_all, active_all = grid_results(prices, grid, entry_tf, workers, exit_model, direction,
+                                     costs, initial_capital, risk_pct)
+    r = r_all[:, rows]
+    active = active_all[:, rows]
+
+    # ---- SOMME PER GIORNATA (combo x giornate) ----
+    days, day_start = np.unique(dates[rows], return_index=True)
+    r_day = np.add.reduceat(r, day_start, axis=1)
+    n_day = np.add.reduceat(active.astype(float), day_start, axis=1)
+    r_cum = np.concatenate([np.zeros((len(grid), 1)), np.cumsum(r_day, axis=1)], axis=1)
+    n_cum = np.concatenate([np.zeros((len(grid), 1)), np.cumsum(n_day, axis=1)], axis=1)
+    day_end = np.append(day_start[1:], len(rows))
+
+    windows, oos = [], []
+    for w, ((tr0, tr1), (te0, te1)) in enumerate(rolling_windows(len(days), train_days, test_days)):
+        train_r = r_cum[:, tr1] - r_cum[:, tr0]
+        train_n = n_cum[:, tr1] - n_cum[:, tr0]
+
+        with np.errstate(divide="ignore", invalid="ignore"):
+            score = train_r if objective == "total_r" else train_r / train_n
+        score = np.where(train_n >= min_trades, score, -np.inf)
+        if not np.isfinite(score).any():
+            continue
+        best = int(np.argmax(score))
+
+        test_rows = slice(day_start[te0], day_end[te1 - 1])
+        test_active = active[best, test_rows]
+        test_r = r[best, test_rows][test_active]
+
+        windows.append({
+            "Finestra": w + 1,
+            "Train dal": days[tr0], "Train al": days[tr1 - 1],
+            "Test dal": days[te0], "Test al": days[te1 - 1],
+            "%entry": grid[best, 0], "%SL": grid[best, 1], "%TP": grid[best, 2],
+            "Train trade": int(train_n[best]), "Train R": train_r[best],
+            "Test trade": int(test_active.sum()), "Test R": test_r.sum(),
+            "Test winrate %": (test_r > 0).mean() * 100 if len(test_r) else np.nan,
+        })
+        oos.append(pd.DataFrame({
+            "row": rows[test_rows][test_active],
+            "Date": dates[rows[test_rows]][test_active],
+            "Finestra": w + 1,
+            "R_multiple": test_r,
+        }))
+
+    windows = pd.DataFrame(windows)
+    oos = pd.concat(oos, ignore_index=True) if oos else pd.DataFrame(columns=["row", "Date", "Finestra", "R_multiple"])
+    return windows, oos
+
+# endregion